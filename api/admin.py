@@ -1,12 +1,79 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
 
-from .models import Board, CustomUser, JournalEntry, List, Task
+from .jobs import enqueue
+from .models import (ArchivedJournalEntry, Board, CustomUser, Job,
+                     JournalEntry, List, Task)
+from .sharding import sharding_enabled
+
+# Below this many rows an exact COUNT(*) is cheap enough
+ESTIMATED_COUNT_MIN = 100_000
+
+
+def estimated_row_count(model, using='default'):
+    """
+    The database's own estimate of the rows in ``model``'s table, None if
+    it has none (SQLite only has one after ANALYZE).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class '
+                'WHERE oid = %s::regclass', [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT table_rows FROM information_schema.tables '
+                'WHERE table_schema = DATABASE() AND table_name = %s', [table])
+        elif connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    'SELECT stat FROM sqlite_stat1 '
+                    'WHERE tbl = %s ORDER BY idx IS NOT NULL LIMIT 1', [table])
+            except DatabaseError:
+                return None
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    return int(str(row[0]).split()[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Uses the database's row estimate instead of COUNT(*) for unfiltered
+    changelists of large tables.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= ESTIMATED_COUNT_MIN:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist defaults for tables too big to count or list in full."""
+    paginator = EstimatedCountPaginator
+    # Skips the second COUNT(*) of the unfiltered table when filtering
+    show_full_result_count = False
+    list_per_page = 50
 
 
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     list_display = ['username', 'is_staff', 'is_active']
+    list_filter = ['is_staff', 'is_active']
     fieldsets = (
         (None, {
             'fields': ('username', 'password')
@@ -22,10 +89,100 @@ class CustomUserAdmin(UserAdmin):
     }), )
     search_fields = ('username', )
     ordering = ('username', )
+    actions = ['purge_in_background']
+
+    @admin.action(description='Delete selected users in the background')
+    def purge_in_background(self, request, queryset):
+        for user_id in queryset.values_list('pk', flat=True):
+            enqueue('purge_user', user=request.user, user_id=user_id)
+        self.message_user(
+            request, 'Queued purge_user jobs, see their progress under Jobs.')
+
+
+class BoardAdmin(LargeTableAdmin):
+    list_display = [
+        'name', 'is_template', 'task_count', 'completed_task_count',
+        'last_activity_at'
+    ]
+    list_filter = ['is_template']
+    search_fields = ['name']
+    autocomplete_fields = ['members']
+    readonly_fields = [
+        'task_count', 'completed_task_count', 'last_activity_at'
+    ]
+
+
+class ListAdmin(LargeTableAdmin):
+    list_display = ['name', 'board', 'position', 'task_count']
+    list_select_related = ['board']
+    search_fields = ['name', 'board__name']
+    autocomplete_fields = ['board']
+    readonly_fields = ['task_count', 'completed_task_count']
+
+
+class TaskAdmin(LargeTableAdmin):
+    list_display = [
+        'title', 'list', 'board', 'priority', 'complexity', 'due_date',
+        'completed'
+    ]
+    list_select_related = ['list', 'board']
+    list_filter = ['completed', 'priority', 'complexity']
+    date_hierarchy = 'due_date'
+    search_fields = ['title']
+    autocomplete_fields = ['list', 'assigned_to']
+
+
+class JournalEntryAdmin(LargeTableAdmin):
+    list_display = ['title', 'user', 'task', 'visibility', 'created_at']
+    list_select_related = ['user', 'task']
+    list_filter = ['visibility']
+    date_hierarchy = 'created_at'
+    search_fields = ['title', '=user__username']
+    autocomplete_fields = ['user', 'task', 'shared_with']
+
+    # With sharding on the entries are spread over the shard databases,
+    # which the changelist's joins, filters and counts can't span
+    def has_module_permission(self, request):
+        return (not sharding_enabled()
+                and super().has_module_permission(request))
+
+    def has_view_permission(self, request, obj=None):
+        return (not sharding_enabled()
+                and super().has_view_permission(request, obj))
+
+    def has_add_permission(self, request):
+        return not sharding_enabled() and super().has_add_permission(request)
+
+    def has_change_permission(self, request, obj=None):
+        return (not sharding_enabled()
+                and super().has_change_permission(request, obj))
+
+    def has_delete_permission(self, request, obj=None):
+        return (not sharding_enabled()
+                and super().has_delete_permission(request, obj))
+
+
+class ArchivedJournalEntryAdmin(LargeTableAdmin):
+    list_display = ['id', 'title', 'user', 'task', 'created_at']
+    list_select_related = ['user', 'task']
+    date_hierarchy = 'created_at'
+    search_fields = ['=id', '=user__username']
+    raw_id_fields = ['user', 'task', 'shared_with']
+
+
+class JobAdmin(LargeTableAdmin):
+    list_display = [
+        'id', 'name', 'status', 'user', 'attempts', 'created_at', 'finished_at'
+    ]
+    list_select_related = ['user']
+    list_filter = ['status']
+    raw_id_fields = ['user']
 
 
 admin.site.register(CustomUser, CustomUserAdmin)
-admin.site.register(Board)
-admin.site.register(List)
-admin.site.register(Task)
-admin.site.register(JournalEntry)
+admin.site.register(Board, BoardAdmin)
+admin.site.register(List, ListAdmin)
+admin.site.register(Task, TaskAdmin)
+admin.site.register(JournalEntry, JournalEntryAdmin)
+admin.site.register(ArchivedJournalEntry, ArchivedJournalEntryAdmin)
+admin.site.register(Job, JobAdmin)
@@ -6,4 +6,9 @@ class ApiConfig(AppConfig):
     name = 'api'
 
     def ready(self):
+        # Register the job handlers
+        import api.archive  # noqa: F401
+        import api.deletion  # noqa: F401
+        import api.maintenance  # noqa: F401
         import api.signals
+        import api.slow_queries  # noqa: F401
@@ -0,0 +1,254 @@
+"""
+Hot/cold storage of journal entries.
+
+Entries older than ``JOURNAL_ARCHIVE_AFTER_DAYS`` are moved from
+``JournalEntry`` to ``ArchivedJournalEntry`` by ``manage.py
+archive_journal_entries`` or the job of the same name, after their mood
+index has been added to the ``JournalMoodAggregate`` of their user and
+task. The analytics endpoints read the archive only for ranges reaching
+back to its newest entry, and merge its rows with the hot ones per day.
+"""
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .jobs import job_handler
+from .models import (ArchivedJournalEntry, JournalEntry, JournalMoodAggregate,
+                     Task)
+from .sharding import journal_databases
+
+ARCHIVED_COLUMNS = ('id', 'user_id', 'title', 'content', 'created_at',
+                    'task_id', 'valence', 'arousal', 'visibility')
+
+
+def archive_cutoff():
+    return timezone.now() - timedelta(days=settings.JOURNAL_ARCHIVE_AFTER_DAYS)
+
+
+def newest_archived_at():
+    """When the newest archived entry was created, None if there is none."""
+    return ArchivedJournalEntry.objects.order_by('-created_at').values_list(
+        'created_at', flat=True).first()
+
+
+def reaches_archive(start):
+    """
+    Whether a range starting at ``start`` (a date, datetime, ISO string or
+    None for unbounded) can include archived entries. Entries may have
+    been archived with an earlier cutoff than today's, so this compares
+    with the newest archived entry rather than ``archive_cutoff()``.
+    """
+    newest = newest_archived_at()
+    if newest is None:
+        return False
+    if start is None:
+        return True
+    if isinstance(start, str):
+        start = parse_datetime(start) or parse_date(start)
+        if start is None:
+            return True
+    if isinstance(start, datetime):
+        start = start.date()
+    # Compare dates, ranges are filtered by day
+    return start <= newest.date()
+
+
+def mood_index(valence, arousal):
+    if valence is None or arousal is None:
+        return None
+    return math.sqrt(valence**2 + arousal**2)
+
+
+def _fold_into_aggregates(rows):
+    totals = {}
+    for row in rows:
+        index = mood_index(row['valence'], row['arousal'])
+        if row['task_id'] is None or index is None:
+            continue
+        count, total = totals.get((row['user_id'], row['task_id']), (0, 0.0))
+        totals[row['user_id'], row['task_id']] = (count + 1, total + index)
+    if not totals:
+        return
+
+    existing = {
+        (aggregate.user_id, aggregate.task_id): aggregate
+        for aggregate in JournalMoodAggregate.objects.filter(
+            user_id__in={user_id
+                         for user_id, _ in totals},
+            task_id__in={task_id
+                         for _, task_id in totals})
+    }
+    new = []
+    for (user_id, task_id), (count, total) in totals.items():
+        aggregate = existing.get((user_id, task_id))
+        if aggregate is None:
+            new.append(
+                JournalMoodAggregate(user_id=user_id,
+                                     task_id=task_id,
+                                     entry_count=count,
+                                     mood_sum=total))
+        else:
+            aggregate.entry_count += count
+            aggregate.mood_sum += total
+    JournalMoodAggregate.objects.bulk_update(
+        [aggregate for key, aggregate in existing.items() if key in totals],
+        ['entry_count', 'mood_sum'])
+    JournalMoodAggregate.objects.bulk_create(new)
+
+
+def _archive_batch(before, batch_size, using):
+    rows = list(
+        JournalEntry.objects.using(using).filter(
+            created_at__lt=before).order_by('created_at').values(
+                *ARCHIVED_COLUMNS)[:batch_size])
+    if not rows:
+        return 0
+    ids = [row['id'] for row in rows]
+
+    _fold_into_aggregates(rows)
+    ArchivedJournalEntry.objects.bulk_create([
+        ArchivedJournalEntry(mood_index=mood_index(row['valence'],
+                                                   row['arousal']),
+                             **row) for row in rows
+    ])
+    SharedWith = ArchivedJournalEntry.shared_with.through
+    SharedWith.objects.bulk_create([
+        SharedWith(archivedjournalentry_id=entry_id, customuser_id=user_id)
+        for entry_id, user_id in JournalEntry.shared_with.through.objects.
+        using(using).filter(journalentry_id__in=ids).values_list(
+            'journalentry_id', 'customuser_id')
+    ])
+    JournalEntry.objects.using(using).filter(pk__in=ids).delete()
+    return len(rows)
+
+
+def _archive_shard(before, batch_size, using):
+    # Entries of a shard are archived into default, commit both together
+    with transaction.atomic(), transaction.atomic(using=using):
+        return _archive_batch(before, batch_size, using)
+
+
+def archive_journal_entries(before=None, batch_size=1000, progress=None):
+    """
+    Move the entries created before ``before`` (default: the archive
+    cutoff) to the archive in batches of one transaction each, calling
+    ``progress(archived)`` after every batch. Returns how many entries
+    were archived.
+    """
+    before = before or archive_cutoff()
+    archived = 0
+    for database in journal_databases():
+        while True:
+            moved = _archive_shard(before, batch_size, database)
+            if not moved:
+                break
+            archived += moved
+            if progress:
+                progress(archived)
+    return archived
+
+
+@job_handler('archive_journal_entries')
+def archive_journal_entries_job(job, batch_size=1000):
+    archived = archive_journal_entries(
+        batch_size=batch_size,
+        progress=lambda archived: job.set_progress(archived=archived))
+    return {'archived': archived}
+
+
+def daily_mood_statistics(hot, cold, hot_mood_index):
+    """
+    Count, average, minimum and maximum mood index per day of the entries
+    in the ``hot`` queryset, or list of querysets of several shards, plus,
+    unless it is None, the ``cold`` archive queryset. ``hot_mood_index``
+    is the expression computing the index of a hot entry.
+    """
+    return merge_daily_rows(daily_mood_rows(hot, cold, hot_mood_index))
+
+
+def daily_mood_rows(hot, cold, hot_mood_index):
+    """
+    The per-day rows of ``daily_mood_statistics()`` before merging, one
+    per queryset and day. ``cold`` can be a list too.
+    """
+    hot = hot if isinstance(hot, (list, tuple)) else [hot]
+    cold = cold if isinstance(cold, (list, tuple)) else [cold]
+    parts = [(queryset, hot_mood_index) for queryset in hot]
+    parts += [(queryset, F('mood_index')) for queryset in cold]
+    rows = []
+    for queryset, index in parts:
+        if queryset is None:
+            continue
+        rows.extend(
+            queryset.filter(
+                valence__isnull=False,
+                arousal__isnull=False).values('created_at__date').annotate(
+                    mood_sum=Sum(index),
+                    min_mood_index=Min(index),
+                    max_mood_index=Max(index),
+                    entry_count=Count('id')).order_by())
+    return rows
+
+
+def merge_daily_rows(rows):
+    """
+    Combine per-day rows with ``entry_count``, ``mood_sum``,
+    ``min_mood_index`` and ``max_mood_index`` into one row per day with
+    ``avg_mood_index``, sorted by day.
+    """
+    days = {}
+    for row in rows:
+        day = days.get(row['created_at__date'])
+        if day is None:
+            days[row['created_at__date']] = dict(row)
+            continue
+        day['entry_count'] += row['entry_count']
+        day['mood_sum'] += row['mood_sum']
+        day['min_mood_index'] = min(day['min_mood_index'],
+                                    row['min_mood_index'])
+        day['max_mood_index'] = max(day['max_mood_index'],
+                                    row['max_mood_index'])
+    return [{
+        'created_at__date': day,
+        'avg_mood_index': row['mood_sum'] / row['entry_count'],
+        'min_mood_index': row['min_mood_index'],
+        'max_mood_index': row['max_mood_index'],
+        'entry_count': row['entry_count'],
+    } for day, row in sorted(days.items())]
+
+
+def heatmap_totals(user, hot, hot_mood_index):
+    """
+    Entry count and mood index sum per (task complexity, task priority)
+    over the ``hot`` queryset and the user's archived entries.
+    """
+    # Grouped by task first, the entries may be in a shard without tasks
+    hot_rows = hot.filter(task__isnull=False,
+                          valence__isnull=False,
+                          arousal__isnull=False).values('task').annotate(
+                              entries=Count('id'),
+                              mood=Sum(hot_mood_index)).order_by()
+    archived_rows = JournalMoodAggregate.objects.filter(
+        user=user).values('task').annotate(entries=Sum('entry_count'),
+                                           mood=Sum('mood_sum')).order_by()
+    rows = list(hot_rows) + list(archived_rows)
+    tasks = {
+        task_id: (complexity, priority)
+        for task_id, complexity, priority in Task.objects.filter(
+            pk__in={row['task']
+                    for row in rows}).values_list('id', 'complexity',
+                                                  'priority')
+    }
+    totals = {}
+    for row in rows:
+        key = tasks.get(row['task'])
+        if key is None:
+            continue
+        count, total = totals.get(key, (0, 0.0))
+        totals[key] = (count + row['entries'], total + row['mood'])
+    return totals
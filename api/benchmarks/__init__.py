@@ -0,0 +1,50 @@
+"""
+Micro benchmarks, run with ``python manage.py benchmark [suite ...]``.
+
+Every suite seeds its own data inside a transaction that is rolled back
+afterwards, so they can be pointed at a migrated development database.
+"""
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+
+SUITES = {}
+
+
+def suite(name):
+    """Register the decorated function as the benchmark suite ``name``."""
+
+    def decorator(func):
+        SUITES[name] = func
+        return func
+
+    return decorator
+
+
+def best_of(func, repeat):
+    """Return the fastest of ``repeat`` calls to ``func``, in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+class _Rollback(Exception):
+    pass
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back."""
+    try:
+        with transaction.atomic():
+            yield
+            raise _Rollback
+    except _Rollback:
+        pass
+
+
+from . import events, rendering, serializers, sharding  # noqa: E402,F401
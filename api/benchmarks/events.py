@@ -0,0 +1,59 @@
+import asyncio
+import statistics
+import time
+import tracemalloc
+
+from api.events import broker, stream_events
+
+from . import suite
+
+# Not a real board, keeps the benchmark away from live subscribers
+BOARD_ID = -1
+
+
+async def _fan_out(connections, repeat):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    streams = [
+        stream_events(BOARD_ID, heartbeat=60) for _ in range(connections)
+    ]
+    # The first chunk subscribes the stream
+    await asyncio.gather(*(anext(stream) for stream in streams))
+    per_connection = (tracemalloc.get_traced_memory()[0] -
+                      before) / connections
+    tracemalloc.stop()
+    held = broker.connection_count()
+
+    loop = asyncio.get_running_loop()
+    latencies, publish_ms = [], []
+    for _ in range(repeat):
+        received = asyncio.gather(*(anext(stream) for stream in streams))
+        start = time.perf_counter()
+        # Views publish from worker threads, not from the event loop
+        await loop.run_in_executor(None, broker.publish, BOARD_ID,
+                                   'task.moved', {
+                                       'task': 1,
+                                       'list': 1,
+                                       'position': 0
+                                   })
+        publish_ms.append((time.perf_counter() - start) * 1000)
+        await received
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    for stream in streams:
+        await stream.aclose()
+    return held, per_connection, min(publish_ms), latencies
+
+
+@suite('events')
+def events(report, scale, repeat):
+    """Board event fan-out from publish until every stream has the event."""
+    for connections in (10 * scale, 100 * scale, 1000 * scale):
+        held, per_connection, publish_ms, latencies = asyncio.run(
+            _fan_out(connections, repeat))
+        report(f'{connections} streams',
+               connections=held,
+               kb_per_connection=per_connection / 1024,
+               publish_ms=publish_ms,
+               median_ms=statistics.median(latencies),
+               max_ms=max(latencies))
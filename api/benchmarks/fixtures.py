@@ -0,0 +1,63 @@
+import random
+from datetime import timedelta
+
+from django.utils import timezone
+
+from api.models import Board, CustomUser, JournalEntry, List, Task
+
+
+def seed_board(users=5, lists=4, tasks_per_list=250, entries_per_task=2):
+    """
+    Bulk insert a board shared by ``users`` members with the given number
+    of lists, tasks and journal entries. Signals are not sent.
+    """
+    rng = random.Random(42)
+    now = timezone.now()
+    members = CustomUser.objects.bulk_create(
+        CustomUser(username=f'bench-{rng.random():.12f}')
+        for _ in range(users))
+    board = Board.objects.create(name='Benchmark board')
+    board.members.set(members)
+
+    board_lists = List.objects.bulk_create(
+        List(name=f'List {i}', board=board, position=i) for i in range(lists))
+    tasks = Task.objects.bulk_create(
+        Task(title=f'Task {i} in {board_list.name}',
+             description=f'Description for task {i} in {board_list.name}',
+             due_date=now + timedelta(days=rng.randint(-10, 30)),
+             priority=rng.choice([1, 2, 3]),
+             complexity=rng.choice([1, 2, 3]),
+             list=board_list,
+             board=board,
+             position=i,
+             completed=rng.random() < 0.3) for board_list in board_lists
+        for i in range(tasks_per_list))
+    Task.assigned_to.through.objects.bulk_create(
+        Task.assigned_to.through(task_id=task.id, customuser_id=member.id)
+        for task in tasks for member in rng.sample(members, 2))
+
+    entries = JournalEntry.objects.bulk_create(
+        JournalEntry(
+            user=rng.choice(members),
+            task=task,
+            board=board,
+            title=f'Update on {task.title}',
+            content=f'Working on {task.title}.',
+            created_at=now -
+            timedelta(days=rng.randint(0, 60), minutes=rng.randint(0, 1440)),
+            valence=rng.uniform(-1, 1),
+            arousal=rng.uniform(-1, 1),
+            visibility=rng.choice(['private', 'shared', 'public']))
+        for task in tasks for _ in range(entries_per_task))
+    JournalEntry.shared_with.through.objects.bulk_create(
+        JournalEntry.shared_with.through(journalentry_id=entry.id,
+                                         customuser_id=member.id)
+        for entry in entries if entry.visibility == 'shared'
+        for member in members if member.id != entry.user_id)
+    return {
+        'board': board,
+        'members': members,
+        'lists': board_lists,
+        'tasks': tasks,
+        'entries': entries,
+    }
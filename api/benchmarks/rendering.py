@@ -0,0 +1,114 @@
+import json
+import random
+import time
+from datetime import date, timedelta
+
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.middleware import brotli
+from api.renderers import (ColumnarJSONRenderer, FastJSONRenderer,
+                           MessagePackRenderer, msgpack)
+from api.views import BoardViewSet, JournalEntryViewSet, TaskViewSet
+
+from . import best_of, rolled_back, suite
+from .fixtures import seed_board
+
+
+def _response_data(view, user, **kwargs):
+    request = APIRequestFactory().get('/')
+    force_authenticate(request, user=user)
+    return view(request, **kwargs).data
+
+
+@suite('rendering')
+def rendering(report, scale, repeat):
+    """JSON render time and bytes on the wire per endpoint."""
+    with rolled_back():
+        data = seed_board(tasks_per_list=100 * scale)
+        user = data['members'][0]
+        endpoints = [
+            ('boards/<id>/',
+             _response_data(BoardViewSet.as_view({'get': 'retrieve'}),
+                            user,
+                            pk=data['board'].pk)),
+            ('journal-entries/',
+             _response_data(JournalEntryViewSet.as_view({'get': 'list'}),
+                            user)),
+            ('tasks/',
+             _response_data(TaskViewSet.as_view({'get': 'list'}), user)),
+        ]
+        for name, response_data in endpoints:
+            before = JSONRenderer().render(response_data)
+            report(f'{name} json',
+                   bytes=len(before),
+                   ms=best_of(lambda: JSONRenderer().render(response_data),
+                              repeat))
+            content = FastJSONRenderer().render(response_data)
+            render_ms = best_of(
+                lambda: FastJSONRenderer().render(response_data), repeat)
+            report(f'{name} orjson',
+                   bytes=len(content),
+                   ms=render_ms,
+                   identical=content == before)
+
+            start = time.perf_counter()
+            compressed = compress_string(content)
+            report(f'{name} orjson+gzip',
+                   bytes=len(compressed),
+                   ms=render_ms + (time.perf_counter() - start) * 1000)
+            if brotli is not None:
+                start = time.perf_counter()
+                compressed = brotli.compress(content, quality=4)
+                report(f'{name} orjson+br',
+                       bytes=len(compressed),
+                       ms=render_ms + (time.perf_counter() - start) * 1000)
+
+
+def _daily_series(days):
+    """``days`` rows shaped like the project-overview response."""
+    rng = random.Random(42)
+    start = date(2020, 1, 1)
+    rows = []
+    for day in range(days):
+        low, high = sorted(rng.uniform(0, 1.4) for _ in range(2))
+        rows.append({
+            'created_at__date': start + timedelta(days=day),
+            'avg_mood_index': rng.uniform(low, high),
+            'min_mood_index': low,
+            'max_mood_index': high,
+            'entry_count': rng.randint(1, 40),
+        })
+    return rows
+
+
+@suite('series')
+def series(report, scale, repeat):
+    """
+    Bytes, render and client parse time of the analytics time series as
+    rows, parallel arrays and MessagePack.
+    """
+    formats = [('rows', FastJSONRenderer(), json.loads),
+               ('columnar', ColumnarJSONRenderer(), json.loads)]
+    if msgpack is not None:
+        formats.append(('msgpack', MessagePackRenderer(), msgpack.unpackb))
+    with rolled_back():
+        data = seed_board(tasks_per_list=100 * scale)
+        endpoints = [
+            ('project-overview',
+             _response_data(JournalEntryViewSet.as_view(
+                 {'get': 'project_overview'}),
+                            data['members'][0],
+                            pk=data['board'].pk)),
+            (f'{3 * scale} years daily', _daily_series(3 * 365 * scale)),
+        ]
+        for name, rows in endpoints:
+            for label, renderer, parse in formats:
+                content = renderer.render(rows)
+                report(f'{name} {label}',
+                       bytes=len(content),
+                       gzip_bytes=len(compress_string(content)),
+                       render_ms=best_of(lambda: renderer.render(rows),
+                                         repeat),
+                       parse_ms=best_of(lambda: parse(content), repeat))
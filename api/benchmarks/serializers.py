@@ -0,0 +1,38 @@
+from api.fastpath import serialize_journal_entries, serialize_tasks
+from api.models import JournalEntry, Task
+from api.serializers import (JournalEntrySerializer, TaskSerializer,
+                             optimize_queryset)
+
+from . import best_of, rolled_back, suite
+from .fixtures import seed_board
+
+
+@suite('serializers')
+def serializer_throughput(report, scale, repeat):
+    """TaskSerializer/JournalEntrySerializer against api/fastpath.py."""
+    with rolled_back():
+        data = seed_board(tasks_per_list=250 * scale)
+        cases = [
+            ('tasks', Task.objects.filter(board=data['board']), TaskSerializer,
+             serialize_tasks),
+            ('journal entries',
+             JournalEntry.objects.filter(board=data['board']),
+             JournalEntrySerializer, serialize_journal_entries),
+        ]
+        for name, queryset, serializer_class, fast_path in cases:
+            rows = queryset.count()
+            serializer_queryset = optimize_queryset(queryset,
+                                                    serializer_class())
+            slow = best_of(
+                lambda: serializer_class(serializer_queryset, many=True).data,
+                repeat)
+            fast = best_of(lambda: fast_path(queryset), repeat)
+            report(f'{name}: serializer',
+                   rows=rows,
+                   ms=slow,
+                   rows_per_s=rows / slow * 1000)
+            report(f'{name}: fast path',
+                   rows=rows,
+                   ms=fast,
+                   rows_per_s=rows / fast * 1000,
+                   speedup=slow / fast)
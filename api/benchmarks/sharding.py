@@ -0,0 +1,92 @@
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils import timezone
+
+from api.models import JournalEntry
+
+from . import suite
+
+WRITERS = 8
+SHARDS = 4
+
+
+@contextmanager
+def temporary_databases(count):
+    """
+    ``count`` empty SQLite files with the journal entry tables, registered
+    as database aliases for the duration of the block.
+    """
+    directory = tempfile.mkdtemp(prefix='journal-shards-')
+    aliases = [f'benchmark_journal_{index}' for index in range(count)]
+    try:
+        for alias in aliases:
+            connections.settings[alias] = {
+                **connections.settings[DEFAULT_DB_ALIAS],
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': str(Path(directory) / f'{alias}.sqlite3'),
+                'OPTIONS': {
+                    'timeout': 60
+                },
+            }
+            with connections[alias].schema_editor() as editor:
+                editor.create_model(JournalEntry)
+        yield aliases
+    finally:
+        for alias in aliases:
+            if alias in connections.settings:
+                connections[alias].close()
+                del connections[alias]
+                del connections.settings[alias]
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _write(alias, user_id, rows):
+    try:
+        for index in range(rows):
+            # One autocommitted INSERT per entry, like the API's writes
+            JournalEntry.objects.using(alias).bulk_create([
+                JournalEntry(user_id=user_id,
+                             title=f'Entry {index}',
+                             created_at=timezone.now(),
+                             valence=0.5,
+                             arousal=-0.5)
+            ])
+    finally:
+        connections[alias].close()
+
+
+def _throughput(aliases, rows):
+    """Entries per second of ``WRITERS`` threads spread over ``aliases``."""
+    threads = [
+        threading.Thread(target=_write,
+                         args=(aliases[user_id % len(aliases)], user_id, rows))
+        for user_id in range(WRITERS)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return WRITERS * rows / (time.perf_counter() - start)
+
+
+@suite('sharding')
+def sharding(report, scale, repeat):
+    """
+    Concurrent journal entry inserts into one SQLite file against
+    ``SHARDS`` files, on throwaway databases in a temporary directory.
+    """
+    rows = 100 * scale
+    with temporary_databases(SHARDS) as aliases:
+        for name, targets in (('single database', aliases[:1]),
+                              (f'{SHARDS} shards', aliases)):
+            best = max(_throughput(targets, rows) for _ in range(repeat))
+            report(f'{WRITERS} writers, {name}',
+                   entries=WRITERS * rows,
+                   entries_per_s=best)
@@ -0,0 +1,88 @@
+"""
+Copying boards, for cloning and for saving boards as templates.
+
+``clone_board`` runs the same handful of bulk queries whatever the size of
+the board: positions are copied as they are instead of being recomputed
+by ``List.save``/``Task.save`` and the counters of api.counters are set
+from the copied rows directly.
+"""
+from collections import Counter
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Board, List, Task
+
+
+@transaction.atomic
+def clone_board(board,
+                owner,
+                name=None,
+                include_tasks=True,
+                include_assignees=False,
+                include_members=False,
+                is_template=False):
+    """
+    Copy ``board`` with its lists and return the copy, owned by ``owner``.
+
+    Copied tasks start uncompleted. Assignees are only kept if they are
+    members of the copy, so ``include_assignees`` needs
+    ``include_members`` to keep anyone but ``owner``.
+    """
+    member_ids = {owner.pk}
+    if include_members:
+        member_ids.update(board.members.values_list('id', flat=True))
+
+    lists = list(
+        board.lists.order_by('position').values('id', 'name', 'position'))
+    tasks = list(
+        Task.objects.filter(board=board).order_by().values(
+            'id', 'title', 'description', 'due_date', 'priority', 'complexity',
+            'list_id', 'position')) if include_tasks else []
+    tasks_per_list = Counter(task['list_id'] for task in tasks)
+
+    copy = Board.objects.create(
+        name=name or board.name,
+        is_template=is_template,
+        task_count=len(tasks),
+        last_activity_at=timezone.now(),
+    )
+    copy.members.add(*member_ids)
+
+    new_lists = List.objects.bulk_create([
+        List(board=copy,
+             name=row['name'],
+             position=row['position'],
+             task_count=tasks_per_list[row['id']]) for row in lists
+    ])
+    list_map = {
+        row['id']: new_list.pk
+        for row, new_list in zip(lists, new_lists)
+    }
+
+    new_tasks = Task.objects.bulk_create([
+        Task(title=row['title'],
+             description=row['description'],
+             due_date=row['due_date'],
+             priority=row['priority'],
+             complexity=row['complexity'],
+             list_id=list_map[row['list_id']],
+             board=copy,
+             position=row['position']) for row in tasks
+    ])
+
+    if include_assignees and new_tasks:
+        task_map = {
+            row['id']: new_task.pk
+            for row, new_task in zip(tasks, new_tasks)
+        }
+        Assignment = Task.assigned_to.through
+        assignments = Assignment.objects.filter(
+            task_id__in=task_map,
+            customuser_id__in=member_ids).values_list('task_id',
+                                                      'customuser_id')
+        Assignment.objects.bulk_create([
+            Assignment(task_id=task_map[task_id], customuser_id=user_id)
+            for task_id, user_id in assignments
+        ])
+    return copy
@@ -0,0 +1,133 @@
+"""
+Single-flight execution of identical concurrent computations.
+
+``analytics.run(key, compute)`` runs ``compute`` once per ``key`` at a
+time: callers arriving while it runs wait for that execution and share its
+result. With ``ANALYTICS_COALESCE_TTL`` set the result is also reused for
+that many seconds after it finished. Keys must cover everything the result
+depends on, including whose entries it may contain.
+
+The state is per process, like api.events. Journal entry writes call
+``analytics.forget()`` (through api.insights), which drops the reused
+results of this process only: with several processes a user may still
+read results from before their own write for up to the TTL, which is why
+it is off by default. ``analytics.stats()`` reports per key name how many
+calls were answered by an execution of their own, by joining one in
+flight or from the short-lived results.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Thread-safe coalescing of calls with the same key."""
+
+    def __init__(self, ttl=None):
+        self._ttl = ttl
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.results = {}
+        self.counts = {}
+        # Bumped by forget(), results computed across it aren't reused
+        self.generation = 0
+
+    @property
+    def ttl(self):
+        return (self._ttl
+                if self._ttl is not None else settings.ANALYTICS_COALESCE_TTL)
+
+    def _count(self, key, outcome):
+        self.counts.setdefault(key[0], Counter())[outcome] += 1
+
+    def run(self, key, compute):
+        """
+        The result of ``compute()`` for ``key``, a tuple starting with the
+        name the calls are counted under.
+        """
+        with self.lock:
+            cached = self.results.get(key)
+            if cached is not None and cached[0] > time.monotonic():
+                self._count(key, 'cached')
+                return cached[1]
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = _Flight()
+            self._count(key, 'executed' if leader else 'coalesced')
+            generation = self.generation
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+                if (flight.error is None and self.ttl > 0
+                        and generation == self.generation):
+                    self._expire()
+                    self.results[key] = (time.monotonic() + self.ttl,
+                                         flight.result)
+            flight.done.set()
+        return flight.result
+
+    def _expire(self):
+        now = time.monotonic()
+        for key in [
+                key for key, (expires, _) in self.results.items()
+                if expires <= now
+        ]:
+            del self.results[key]
+
+    def forget(self):
+        """
+        Stop reusing the results computed so far, after data they may
+        depend on changed. Calls in flight still share their execution.
+        """
+        with self.lock:
+            self.generation += 1
+            self.results.clear()
+
+    def stats(self):
+        """Calls per name and how they were answered."""
+        with self.lock:
+            counts = {name: dict(count) for name, count in self.counts.items()}
+        stats = {}
+        for name, count in sorted(counts.items()):
+            calls = sum(count.values())
+            executed = count.get('executed', 0)
+            stats[name] = {
+                'calls': calls,
+                'executed': executed,
+                'coalesced': count.get('coalesced', 0),
+                'cached': count.get('cached', 0),
+                # Share of the calls that didn't need an execution
+                'coalescing_ratio': 1 - executed / calls if calls else 0.0,
+            }
+        return stats
+
+    def reset(self):
+        with self.lock:
+            self.results.clear()
+            self.counts.clear()
+
+
+analytics = SingleFlight()
@@ -0,0 +1,65 @@
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Board, CustomUser
+
+
+def _cache_key(user_id):
+    return f'comembers:{user_id}'
+
+
+def get_comembers(user_id):
+    """
+    Return the users sharing at least one board with the given user as
+    (lowercased username, username, id) tuples sorted by username.
+
+    The list is cached per user and rebuilt from the membership tables
+    after one of the user's boards changed, or after
+    ``COMEMBERS_CACHE_TIMEOUT`` seconds.
+    """
+    key = _cache_key(user_id)
+    comembers = cache.get(key)
+    if comembers is None:
+        rows = CustomUser.objects.filter(boards__members=user_id).exclude(
+            id=user_id).values_list('username', 'id').distinct()
+        comembers = sorted(
+            (username.lower(), username, pk) for username, pk in rows)
+        cache.set(key, comembers, settings.COMEMBERS_CACHE_TIMEOUT)
+    return comembers
+
+
+def search_comembers(user_id, prefix='', limit=None):
+    """
+    Return co-members whose username starts with ``prefix``
+    (case-insensitive) as dictionaries, at most ``limit`` of them.
+    """
+    comembers = get_comembers(user_id)
+    prefix = prefix.lower()
+    start = bisect_left(comembers, (prefix, )) if prefix else 0
+    results = []
+    for username_lower, username, pk in comembers[start:]:
+        if limit is not None and len(results) >= limit:
+            break
+        if not username_lower.startswith(prefix):
+            break
+        results.append({'id': pk, 'username': username})
+    return results
+
+
+def board_member_ids(board_ids):
+    return set(
+        Board.members.through.objects.filter(
+            board_id__in=board_ids).values_list('customuser_id', flat=True))
+
+
+def invalidate_comembers(user_ids):
+    """
+    Drop the cached co-member lists of the given users once the current
+    transaction has been committed.
+    """
+    keys = [_cache_key(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
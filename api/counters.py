@@ -0,0 +1,194 @@
+"""
+Denormalized task counters on List and Board.
+
+``List.task_count``/``completed_task_count`` and the same fields on Board
+plus ``Board.last_activity_at`` are kept up to date by the Task signal
+receivers in api/signals.py, inside the transaction that changes the
+task. Bulk ``QuerySet.update()``/``bulk_create()`` calls bypass them and
+must call ``apply_task_delta`` or ``apply_board_delta`` themselves;
+``manage.py repair_board_counters`` recomputes everything from scratch.
+"""
+from collections import defaultdict
+
+from django.db.models import Count, F, IntegerField, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Board, JournalEntry, List, Task
+from .sharding import journal_databases
+
+
+def apply_board_delta(boards, tasks=0, completed=0):
+    """
+    Add ``tasks`` and ``completed`` to the counters of the ``boards``
+    queryset and mark them as active.
+    """
+    return boards.update(task_count=F('task_count') + tasks,
+                         completed_task_count=F('completed_task_count') +
+                         completed,
+                         last_activity_at=timezone.now())
+
+
+def apply_task_delta(list_id, tasks=0, completed=0, board_id=None):
+    """
+    Add ``tasks`` and ``completed`` to the counters of a list and its
+    board and mark the board as active.
+    """
+    if tasks or completed:
+        List.objects.filter(pk=list_id).update(
+            task_count=F('task_count') + tasks,
+            completed_task_count=F('completed_task_count') + completed)
+    boards = (Board.objects.filter(pk=board_id)
+              if board_id is not None else Board.objects.filter(lists=list_id))
+    apply_board_delta(boards, tasks, completed)
+
+
+def board_counts(tasks):
+    """(board_id, tasks, completed) of the ``tasks`` queryset per board."""
+    return list(tasks.order_by().values('board').annotate(
+        tasks=Count('id'),
+        completed=Count('id', filter=Q(completed=True))).values_list(
+            'board', 'tasks', 'completed'))
+
+
+def tasks_changed_board(counts, board_id):
+    """
+    Move the counts of tasks that moved to board ``board_id`` without
+    their list changing, as returned by ``board_counts()`` before the move,
+    from their old boards to the new one.
+    """
+    for old_board_id, tasks, completed in counts:
+        apply_board_delta(Board.objects.filter(pk=old_board_id), -tasks,
+                          -completed)
+    apply_board_delta(Board.objects.filter(pk=board_id),
+                      sum(tasks for _, tasks, _ in counts),
+                      sum(completed for _, _, completed in counts))
+
+
+def remember_counted_state(task):
+    """
+    Make sure ``task._counted_as`` holds the (list_id, completed) pair the
+    task is currently counted under, reading it if it was deferred.
+    """
+    if task._state.adding:
+        task._counted_as = None
+    elif None in getattr(task, '_counted_as', (None, )):
+        task._counted_as = Task.objects.filter(pk=task.pk).values_list(
+            'list_id', 'completed').first()
+
+
+def task_saved(task, created):
+    completed = int(task.completed)
+    board_id = task.board_id
+    if created or task._counted_as is None:
+        apply_task_delta(task.list_id, 1, completed, board_id)
+    else:
+        old_list_id, old_completed = task._counted_as
+        if old_list_id != task.list_id:
+            apply_task_delta(old_list_id, -1, -int(old_completed))
+            apply_task_delta(task.list_id, 1, completed, board_id)
+        else:
+            apply_task_delta(task.list_id, 0, completed - int(old_completed),
+                             board_id)
+    task._counted_as = (task.list_id, task.completed)
+
+
+def task_deleted(task):
+    counted_as = getattr(task, '_counted_as', None)
+    list_id, completed = counted_as or (task.list_id, task.completed)
+    apply_task_delta(list_id, -1, -int(completed))
+
+
+def list_deleted(list_obj):
+    apply_board_delta(Board.objects.filter(pk=list_obj.board_id),
+                      -list_obj.task_count, -list_obj.completed_task_count)
+
+
+def _count(filter_field, completed=None):
+    tasks = Task.objects.filter(**{filter_field: OuterRef('pk')})
+    if completed is not None:
+        tasks = tasks.filter(completed=completed)
+    counts = tasks.order_by().values(filter_field).annotate(
+        count=Count('id')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def _repair_task_boards():
+    list_board = List.objects.filter(pk=OuterRef('list')).values('board')
+    return Task.objects.exclude(board=Subquery(list_board)).update(
+        board=Subquery(list_board))
+
+
+def _repair_journal_entry_boards():
+    """Point the entries of every database at the board of their task."""
+    fixed = 0
+    for database in journal_databases():
+        entries = JournalEntry.objects.using(database)
+        fixed += entries.filter(task__isnull=True,
+                                board__isnull=False).update(board=None)
+        pairs = entries.filter(task__isnull=False).order_by().values_list(
+            'task', 'board').distinct()
+        recorded = defaultdict(set)
+        for task_id, board_id in pairs:
+            recorded[task_id].add(board_id)
+        actual = dict(
+            Task.objects.filter(pk__in=list(recorded)).values_list(
+                'pk', 'board'))
+        moved = defaultdict(list)
+        for task_id, board_ids in recorded.items():
+            if board_ids != {actual.get(task_id)}:
+                moved[actual.get(task_id)].append(task_id)
+        for board_id, task_ids in moved.items():
+            fixed += entries.filter(task__in=task_ids).exclude(
+                board=board_id).update(board=board_id)
+    return fixed
+
+
+def _repair_last_activity():
+    """
+    Bring ``last_activity_at`` forward to the latest completion or journal
+    entry on the board. Activity that left no trace can't be recovered.
+    """
+    latest = dict(
+        Task.objects.filter(
+            completed_at__isnull=False).order_by().values('board').annotate(
+                latest=Max('completed_at')).values_list('board', 'latest'))
+    for database in journal_databases():
+        for board_id, created_at in JournalEntry.objects.using(
+                database).filter(
+                    board__isnull=False).order_by().values('board').annotate(
+                        latest=Max('created_at')).values_list(
+                            'board', 'latest'):
+            latest[board_id] = max(latest.get(board_id, created_at),
+                                   created_at)
+    fixed = 0
+    for board_id, activity in latest.items():
+        fixed += Board.objects.filter(pk=board_id).filter(
+            Q(last_activity_at__isnull=True)
+            | Q(last_activity_at__lt=activity)).update(
+                last_activity_at=activity)
+    return fixed
+
+
+def repair_counters():
+    """
+    Recompute the denormalized boards of tasks and journal entries, the
+    counters of every list and board and the boards' last activity,
+    returning how many rows of each had to be corrected.
+    """
+    fixed = {'Task.board': _repair_task_boards()}
+    for model, filter_field in ((List, 'list'), (Board, 'board')):
+        stale = model.objects.annotate(
+            actual_tasks=_count(filter_field),
+            actual_completed=_count(filter_field, completed=True)).filter(
+                ~Q(task_count=F('actual_tasks'))
+                | ~Q(completed_task_count=F('actual_completed'))).values_list(
+                    'pk', 'actual_tasks', 'actual_completed')
+        fixed[model.__name__] = 0
+        for pk, tasks, completed in stale:
+            model.objects.filter(pk=pk).update(task_count=tasks,
+                                               completed_task_count=completed)
+            fixed[model.__name__] += 1
+    fixed['JournalEntry.board'] = _repair_journal_entry_boards()
+    fixed['Board.last_activity_at'] = _repair_last_activity()
+    return fixed
@@ -0,0 +1,168 @@
+"""
+Deleting boards and users without Django's cascade collector.
+
+``Model.delete()`` loads every related row into memory and then deletes or
+updates them row set by row set inside one transaction, which takes
+minutes for a large board. ``purge_board`` and ``purge_user`` instead
+remove the heavy children with set-based DELETE and UPDATE statements,
+``batch_size`` rows at a time in short transactions, and leave only the
+parent row and its few remaining relations to the ORM.
+
+Both also run as the ``purge_board`` and ``purge_user`` jobs, which
+report the rows deleted so far as the job's progress.
+"""
+from collections import Counter
+
+from django.db import transaction
+
+from .comembers import board_member_ids, invalidate_comembers
+from .insights import mark_stale
+from .jobs import job_handler
+from .models import (ArchivedJournalEntry, Board, CustomUser, Job,
+                     JournalEntry, JournalMoodAggregate, Task)
+from .sharding import journal_databases, user_journal_entries
+
+
+def _raw_delete(queryset):
+    """DELETE the rows of ``queryset`` in one statement, without signals."""
+    return queryset._raw_delete(queryset.db)
+
+
+def _batches(queryset, batch_size):
+    """
+    Yield the primary keys of ``queryset`` in batches. Each batch has to be
+    deleted (or no longer match) before the next one is read.
+    """
+    while True:
+        ids = list(queryset.order_by().values_list('pk',
+                                                   flat=True)[:batch_size])
+        if not ids:
+            return
+        yield ids
+
+
+class Purge:
+    """Running totals of a purge, reported to ``progress`` per batch."""
+
+    def __init__(self, progress=None):
+        self.deleted = Counter()
+        self.progress = progress
+
+    def count(self, model, rows):
+        label = model if isinstance(model, str) else model._meta.label
+        self.deleted[label] += rows
+        if self.progress:
+            self.progress(dict(self.deleted))
+
+
+def detach_board(board_id):
+    """
+    Remove all members of a board, which hides it from the API until it
+    is purged.
+    """
+    with transaction.atomic():
+        invalidate_comembers(board_member_ids([board_id]))
+        return _raw_delete(
+            Board.members.through.objects.filter(board_id=board_id))
+
+
+def _purge_entries(purge, model, entries, batch_size):
+    SharedWith = model.shared_with.through
+    entry_column = f'{model._meta.model_name}_id'
+    using = entries.db
+    for ids in _batches(entries, batch_size):
+        with transaction.atomic(using=using):
+            _raw_delete(
+                SharedWith.objects.using(using).filter(
+                    **{f'{entry_column}__in': ids}))
+            purge.count(
+                model,
+                _raw_delete(model.objects.using(using).filter(pk__in=ids)))
+
+
+def purge_board(board_id, batch_size=1000, progress=None):
+    """
+    Delete a board, its lists and tasks. Journal entries about the tasks
+    are kept and unlinked, like ``on_delete=SET_NULL`` does, which marks
+    their authors' mood insights stale. Returns the number of deleted rows
+    per model.
+    """
+    purge = Purge(progress)
+    detach_board(board_id)
+
+    Assignment = Task.assigned_to.through
+    for ids in _batches(Task.objects.filter(board=board_id), batch_size):
+        with transaction.atomic():
+            # The insights group the entries by their task's attributes
+            authors = set()
+            for database in journal_databases():
+                entries = JournalEntry.objects.using(database).filter(
+                    task__in=ids)
+                authors.update(entries.order_by().values_list('user',
+                                                              flat=True))
+                entries.update(task=None, board=None)
+            archived = ArchivedJournalEntry.objects.filter(task__in=ids)
+            authors.update(archived.order_by().values_list('user', flat=True))
+            archived.update(task=None)
+            mark_stale(*authors)
+            _raw_delete(JournalMoodAggregate.objects.filter(task__in=ids))
+            _raw_delete(Assignment.objects.filter(task__in=ids))
+            purge.count(Task, _raw_delete(Task.objects.filter(pk__in=ids)))
+
+    # The lists are empty now, the collector only has the board left.
+    _, by_model = Board.objects.filter(pk=board_id).delete()
+    for label, rows in by_model.items():
+        purge.count(label, rows)
+    return dict(purge.deleted)
+
+
+def purge_user(user_id, batch_size=1000, progress=None):
+    """
+    Delete a user with their journal entries, archived entries,
+    memberships and assignments. Boards are kept for their other members.
+    Returns the number of deleted rows per model.
+    """
+    purge = Purge(progress)
+    with transaction.atomic():
+        board_ids = Board.objects.filter(members=user_id).values('pk')
+        invalidate_comembers(board_member_ids(board_ids) | {user_id})
+
+    _purge_entries(purge, JournalEntry, user_journal_entries(user_id),
+                   batch_size)
+    _purge_entries(purge, ArchivedJournalEntry,
+                   ArchivedJournalEntry.objects.filter(user=user_id),
+                   batch_size)
+
+    through_querysets = [
+        Board.members.through.objects.all(),
+        Task.assigned_to.through.objects.all(),
+        ArchivedJournalEntry.shared_with.through.objects.all(),
+    ] + [
+        JournalEntry.shared_with.through.objects.using(database)
+        for database in journal_databases()
+    ]
+    for through in through_querysets:
+        rows = through.filter(customuser_id=user_id)
+        for ids in _batches(rows, batch_size):
+            _raw_delete(through.filter(pk__in=ids))
+    _raw_delete(JournalMoodAggregate.objects.filter(user=user_id))
+    Job.objects.filter(user=user_id).update(user=None)
+
+    _, by_model = CustomUser.objects.filter(pk=user_id).delete()
+    for label, rows in by_model.items():
+        purge.count(label, rows)
+    return dict(purge.deleted)
+
+
+@job_handler('purge_board')
+def purge_board_job(job, board_id, batch_size=1000):
+    return purge_board(
+        board_id, batch_size,
+        lambda deleted: job.set_progress(board=board_id, deleted=deleted))
+
+
+@job_handler('purge_user')
+def purge_user_job(job, user_id, batch_size=1000):
+    return purge_user(
+        user_id, batch_size,
+        lambda deleted: job.set_progress(user=user_id, deleted=deleted))
@@ -0,0 +1,123 @@
+"""
+Live board updates for ``GET /api/boards/<id>/events/``.
+
+Views publish small change events with ``publish_board_event`` once their
+transaction commits. The in-process ``broker`` hands them to the
+Server-Sent Events streams subscribed to that board. Streams only see
+events published by the same process, so run a single ASGI worker process
+or put a shared pub/sub in front of the broker before scaling out.
+"""
+import asyncio
+import itertools
+import json
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+
+class Subscription:
+    """The queue of one event stream, read on its own event loop."""
+
+    def __init__(self, board_id, maxsize):
+        self.board_id = board_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client too slow to keep up is told to reload instead.
+            self.overflowed = True
+
+
+class Broker:
+    """Thread-safe in-process publish/subscribe keyed by board id."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+    def subscribe(self, board_id):
+        """Subscribe to a board, must be called on the consuming loop."""
+        subscription = Subscription(board_id, self.queue_size)
+        with self.lock:
+            self.subscriptions.setdefault(board_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscriptions.get(subscription.board_id, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self.subscriptions.pop(subscription.board_id, None)
+
+    def connection_count(self):
+        with self.lock:
+            return sum(map(len, self.subscriptions.values()))
+
+    def publish(self, board_id, event_type, data):
+        """Send an event to every subscriber of a board, from any thread."""
+        event = (next(self.ids), event_type, data)
+        with self.lock:
+            subscribers = list(self.subscriptions.get(board_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, event)
+            except RuntimeError:
+                # The loop of the stream is closed
+                self.unsubscribe(subscription)
+        return len(subscribers)
+
+
+broker = Broker(getattr(settings, 'EVENTS_QUEUE_SIZE', 100))
+
+
+def publish_board_event(board_id, event_type, **data):
+    """Publish an event to a board's streams after the current commit."""
+    transaction.on_commit(lambda: broker.publish(board_id, event_type, data))
+
+
+def publish_task_event(event_type, task, old_board_id=None, /, **data):
+    """
+    Publish a task event to the task's board, and to the board it came
+    from if it moved between boards.
+    """
+    board_id = task.board_id
+    publish_board_event(board_id, event_type, **data)
+    if old_board_id is not None and old_board_id != board_id:
+        publish_board_event(old_board_id, event_type, **data)
+
+
+def format_event(event_id, event_type, data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder)
+    return f'id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n'
+
+
+async def stream_events(board_id, heartbeat):
+    """
+    Yield a board's events in the text/event-stream format, with a comment
+    line every ``heartbeat`` seconds to keep proxies from closing an idle
+    connection.
+    """
+    subscription = broker.subscribe(board_id)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(),
+                                               heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if subscription.overflowed:
+                yield format_event(event[0], 'reset', {})
+                return
+            yield format_event(*event)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,123 @@
+"""
+Read-only fast path for the task and journal entry endpoints.
+
+The functions here build the same dictionaries as ``TaskSerializer`` and
+``JournalEntrySerializer`` straight from ``values()`` rows, skipping the
+per-field overhead of DRF serializers on large lists. Any change to the
+fields of those serializers has to be mirrored here; ``api/tests.py``
+checks that both render identical JSON.
+"""
+from collections import defaultdict
+
+from rest_framework import serializers
+
+from .models import Task
+
+TASK_COLUMNS = ('id', 'title', 'description', 'due_date', 'priority',
+                'complexity', 'list_id', 'position', 'completed')
+JOURNAL_ENTRY_COLUMNS = ('id', 'title', 'content', 'created_at', 'task_id',
+                         'valence', 'arousal', 'visibility')
+
+PRIORITY_DISPLAY = {
+    value: str(label)
+    for value, label in Task._meta.get_field('priority').choices
+}
+COMPLEXITY_DISPLAY = {
+    value: str(label)
+    for value, label in Task._meta.get_field('complexity').choices
+}
+
+_datetime_field = serializers.DateTimeField()
+
+
+def _assignees_by_task(task_ids):
+    assignees = defaultdict(list)
+    rows = Task.assigned_to.through.objects.filter(
+        task_id__in=task_ids).order_by('customuser_id').values_list(
+            'task_id', 'customuser_id', 'customuser__username')
+    for task_id, user_id, username in rows:
+        assignees[task_id].append({'id': user_id, 'username': username})
+    return assignees
+
+
+def _shared_with_by_entry(model, entry_ids, using):
+    shared_with = defaultdict(list)
+    entry_column = f'{model._meta.model_name}_id'
+    rows = model.shared_with.through.objects.using(using).filter(
+        **{
+            f'{entry_column}__in': entry_ids
+        }).order_by('customuser_id').values_list(entry_column, 'customuser_id')
+    for entry_id, user_id in rows:
+        shared_with[entry_id].append(user_id)
+    return shared_with
+
+
+def serialize_task_rows(rows):
+    """
+    Render ``values(*TASK_COLUMNS)`` rows like ``TaskSerializer(many=True)``.
+    """
+    assignees = _assignees_by_task([row['id'] for row in rows])
+    to_datetime = _datetime_field.to_representation
+    return [{
+        'id':
+        row['id'],
+        'title':
+        row['title'],
+        'description':
+        row['description'],
+        'due_date':
+        to_datetime(row['due_date']),
+        'priority':
+        row['priority'],
+        'priority_display':
+        PRIORITY_DISPLAY.get(row['priority'], str(row['priority'])),
+        'complexity':
+        row['complexity'],
+        'complexity_display':
+        COMPLEXITY_DISPLAY.get(row['complexity'], str(row['complexity'])),
+        'list':
+        row['list_id'],
+        'assigned_to':
+        assignees.get(row['id'], []),
+        'position':
+        row['position'],
+        'completed':
+        row['completed'],
+    } for row in rows]
+
+
+def serialize_tasks(queryset):
+    """
+    Render the tasks of ``queryset`` like ``TaskSerializer(many=True)``.
+    """
+    return serialize_task_rows(list(queryset.values(*TASK_COLUMNS)))
+
+
+def serialize_journal_entries(queryset):
+    """
+    Render the entries of ``queryset`` like
+    ``JournalEntrySerializer(many=True)``. Also works for
+    ``ArchivedJournalEntry`` querysets.
+    """
+    rows = list(queryset.values(*JOURNAL_ENTRY_COLUMNS))
+    shared_with = _shared_with_by_entry(queryset.model,
+                                        [row['id'] for row in rows],
+                                        queryset.db)
+    task_ids = {row['task_id'] for row in rows if row['task_id'] is not None}
+    tasks = {
+        task['id']: task
+        for task in serialize_tasks(
+            Task.objects.filter(id__in=task_ids).order_by())
+    } if task_ids else {}
+    to_datetime = _datetime_field.to_representation
+    return [{
+        'id': row['id'],
+        'title': row['title'],
+        'content': row['content'],
+        'created_at': to_datetime(row['created_at']),
+        'task': tasks.get(row['task_id']),
+        'valence': row['valence'],
+        'arousal': row['arousal'],
+        'visibility': row['visibility'],
+        'shared_with': shared_with.get(row['id'], []),
+    } for row in rows]
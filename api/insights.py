@@ -0,0 +1,287 @@
+"""
+Which factors move a user's mood.
+
+A batch pass groups all of a user's journal entries, hot and archived, by
+task priority, task complexity, overdue state (written after the task's
+due date), hour and ISO weekday in the database, and keeps the count, sum
+and sum of squares of the mood index per group in ``MoodInsight.cells``.
+Those sufficient statistics are all the correlations and effect sizes
+need, so new entries are added to their cell as they are created instead
+of recomputing. Edited or deleted entries mark the insight stale, and
+insights older than ``MOOD_INSIGHTS_MAX_AGE_HOURS`` are recomputed, which
+also picks up changed tasks.
+
+Hours and weekdays are in the server's time zone.
+"""
+import math
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (Case, Count, ExpressionWrapper, F, FloatField,
+                              IntegerField, Sum, Value, When)
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay, Sqrt
+from django.utils import timezone
+
+from .archive import mood_index
+from .coalescing import analytics
+from .models import ArchivedJournalEntry, JournalEntry, MoodInsight, Task
+from .sharding import sharding_enabled, user_journal_entries
+
+TIME_OF_DAY = (
+    ('night', range(0, 6)),
+    ('morning', range(6, 12)),
+    ('afternoon', range(12, 18)),
+    ('evening', range(18, 24)),
+)
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday',
+            'Sunday')
+
+
+def _time_of_day(hour):
+    for index, (_, hours) in enumerate(TIME_OF_DAY):
+        if hour in hours:
+            return index
+
+
+# (name, kind, value of a cell key, label of a value)
+FACTORS = (
+    ('priority', 'ordinal', lambda key: key[0],
+     dict(Task._meta.get_field('priority').choices).get),
+    ('complexity', 'ordinal', lambda key: key[1],
+     dict(Task._meta.get_field('complexity').choices).get),
+    ('overdue', 'binary', lambda key: key[2], {
+        0: 'On time',
+        1: 'Overdue'
+    }.get),
+    ('time_of_day', 'categorical', lambda key: _time_of_day(key[3]),
+     lambda value: TIME_OF_DAY[value][0]),
+    ('weekday', 'categorical', lambda key: key[4],
+     lambda value: WEEKDAYS[value - 1]),
+)
+
+
+def _encode(key):
+    return '|'.join('' if value is None else str(value) for value in key)
+
+
+def _decode(key):
+    return tuple(int(value) if value else None for value in key.split('|'))
+
+
+def _cell_key(task, created_at):
+    overdue = None
+    if task is not None:
+        overdue = int(task.due_date is not None and task.due_date < created_at)
+    created_at = timezone.localtime(created_at)
+    return _encode((task and task.priority, task
+                    and task.complexity, overdue, created_at.hour,
+                    created_at.isoweekday()))
+
+
+def entry_cell(entry):
+    """The cell key of a journal entry, None without a mood."""
+    if entry.valence is None or entry.arousal is None:
+        return None
+    return _cell_key(entry.task, entry.created_at)
+
+
+def _grouped_cells(queryset, mood, squares):
+    overdue = Case(When(task__isnull=True, then=Value(None)),
+                   When(task__due_date__lt=F('created_at'), then=Value(1)),
+                   default=Value(0),
+                   output_field=IntegerField())
+    return queryset.filter(
+        valence__isnull=False, arousal__isnull=False).annotate(
+            overdue=overdue,
+            hour=ExtractHour('created_at'),
+            weekday=ExtractIsoWeekDay('created_at')).values(
+                'task__priority', 'task__complexity', 'overdue', 'hour',
+                'weekday').annotate(n=Count('id'),
+                                    total=Sum(mood),
+                                    squares=Sum(squares)).order_by()
+
+
+def _sharded_cells(user, cells):
+    # A shard can't join the tasks, fold the user's entries here instead
+    entries = list(
+        user_journal_entries(user).filter(valence__isnull=False,
+                                          arousal__isnull=False).values_list(
+                                              'task_id', 'created_at',
+                                              'valence', 'arousal'))
+    tasks = Task.objects.only('priority', 'complexity', 'due_date').in_bulk(
+        {task_id
+         for task_id, _, _, _ in entries if task_id is not None})
+    for task_id, created_at, valence, arousal in entries:
+        index = mood_index(valence, arousal)
+        cell = cells[_cell_key(tasks.get(task_id), created_at)]
+        cell[0] += 1
+        cell[1] += index
+        cell[2] += index**2
+
+
+def compute_cells(user):
+    """The cells of all of ``user``'s entries, in two grouped queries."""
+    squares = ExpressionWrapper(F('valence')**2 + F('arousal')**2,
+                                output_field=FloatField())
+    cells = defaultdict(lambda: [0, 0.0, 0.0])
+    grouped = [
+        _grouped_cells(ArchivedJournalEntry.objects.filter(user=user),
+                       F('mood_index'),
+                       F('mood_index') * F('mood_index'))
+    ]
+    if sharding_enabled():
+        _sharded_cells(user, cells)
+    else:
+        grouped.append(
+            _grouped_cells(JournalEntry.objects.filter(user=user),
+                           Sqrt(squares), squares))
+    for rows in grouped:
+        for row in rows:
+            cell = cells[_encode(
+                (row['task__priority'], row['task__complexity'],
+                 row['overdue'], row['hour'], row['weekday']))]
+            cell[0] += row['n']
+            cell[1] += row['total']
+            cell[2] += row['squares']
+    return dict(cells)
+
+
+def refresh_insight(user):
+    cells = compute_cells(user)
+    insight, _ = MoodInsight.objects.update_or_create(
+        user=user,
+        defaults={
+            'cells': cells,
+            'entry_count': sum(cell[0] for cell in cells.values()),
+            'computed_at': timezone.now(),
+            'stale': False,
+        })
+    return insight
+
+
+def get_insight(user):
+    """The cached ``MoodInsight`` of ``user``, recomputed when outdated."""
+    insight = MoodInsight.objects.filter(user=user).first()
+    max_age = timedelta(hours=settings.MOOD_INSIGHTS_MAX_AGE_HOURS)
+    if (insight is None or insight.stale
+            or insight.computed_at < timezone.now() - max_age):
+        insight = refresh_insight(user)
+    return insight
+
+
+def record_entry(entry):
+    """Add a new journal entry to its user's insight, if there is one."""
+    transaction.on_commit(analytics.forget)
+    key = entry_cell(entry)
+    if key is None:
+        return
+    index = mood_index(entry.valence, entry.arousal)
+    with transaction.atomic():
+        insight = MoodInsight.objects.select_for_update().filter(
+            user=entry.user_id, stale=False).first()
+        if insight is None:
+            return
+        count, total, squares = insight.cells.get(key, (0, 0.0, 0.0))
+        insight.cells[key] = [count + 1, total + index, squares + index**2]
+        insight.entry_count += 1
+        insight.save(update_fields=['cells', 'entry_count'])
+
+
+def mark_stale(*user_ids):
+    """
+    Have the insights of users whose entries changed recomputed, and stop
+    reusing analytics results that may include those entries.
+    """
+    transaction.on_commit(analytics.forget)
+    MoodInsight.objects.filter(user__in=user_ids).update(stale=True)
+
+
+def _ratio(numerator, denominator):
+    return numerator / denominator if denominator > 0 else None
+
+
+def _describe_factor(cells, kind, value_of, label_of):
+    groups = defaultdict(lambda: [0, 0.0, 0.0])
+    for key, (count, total, squares) in cells:
+        value = value_of(key)
+        if value is not None:
+            group = groups[value]
+            group[0] += count
+            group[1] += total
+            group[2] += squares
+
+    n = sum(count for count, _, _ in groups.values())
+    total = sum(total for _, total, _ in groups.values())
+    squares = sum(squares for _, _, squares in groups.values())
+    if not n:
+        return None
+    mean = total / n
+    total_ss = max(0.0, squares - total**2 / n)
+
+    result = {'kind': kind, 'count': n}
+    if kind == 'categorical':
+        between_ss = sum(group_total**2 / count
+                         for count, group_total, _ in groups.values())
+        eta_squared = _ratio(max(0.0, between_ss - total**2 / n), total_ss)
+        result['eta_squared'] = eta_squared
+        result['strength'] = (math.sqrt(eta_squared)
+                              if eta_squared is not None else None)
+    else:
+        sum_x = sum(value * count for value, (count, _, _) in groups.items())
+        sum_xx = sum(value**2 * count
+                     for value, (count, _, _) in groups.items())
+        sum_xy = sum(value * group_total
+                     for value, (_, group_total, _) in groups.items())
+        sxx = sum_xx - sum_x**2 / n
+        sxy = sum_xy - sum_x * total / n
+        correlation = _ratio(sxy, math.sqrt(max(0.0, sxx * total_ss)))
+        result['correlation'] = correlation
+        result['strength'] = (abs(correlation)
+                              if correlation is not None else None)
+        if kind == 'ordinal':
+            # Mood index change per priority or complexity level
+            result['slope'] = _ratio(sxy, sxx)
+        else:
+            (n0, total0, squares0), (n1, total1,
+                                     squares1) = (groups.get(0, (0, 0.0, 0.0)),
+                                                  groups.get(1, (0, 0.0, 0.0)))
+            within_ss = ((squares0 - total0**2 / n0 if n0 else 0.0) +
+                         (squares1 - total1**2 / n1 if n1 else 0.0))
+            pooled_sd = math.sqrt(max(0.0, _ratio(within_ss, n - 2) or 0.0))
+            result['cohens_d'] = (_ratio(total1 / n1 - total0 / n0, pooled_sd)
+                                  if n0 and n1 else None)
+
+    result['groups'] = [{
+        'value': value,
+        'label': label_of(value),
+        'count': count,
+        'mean_mood_index': group_total / count,
+        'difference': group_total / count - mean,
+    } for value, (count, group_total, _) in sorted(groups.items())]
+    return result
+
+
+def describe(insight):
+    """
+    Correlations and effect sizes of the factors of an insight, strongest
+    first: Pearson correlation for priority and complexity (plus the slope
+    per level), point-biserial correlation and Cohen's d for overdue, and
+    the correlation ratio (eta squared) for time of day and weekday.
+    """
+    cells = [(_decode(key), cell) for key, cell in insight.cells.items()]
+    total = sum(cell[1] for _, cell in cells)
+    factors = []
+    for name, kind, value_of, label_of in FACTORS:
+        factor = _describe_factor(cells, kind, value_of, label_of)
+        if factor is not None:
+            factors.append({'factor': name, **factor})
+    factors.sort(key=lambda factor: -(factor['strength'] or 0))
+    return {
+        'entry_count': insight.entry_count,
+        'mean_mood_index':
+        total / insight.entry_count if insight.entry_count else None,
+        'computed_at': insight.computed_at,
+        'factors': factors,
+    }
@@ -0,0 +1,158 @@
+"""
+Database-backed background jobs.
+
+Handlers are registered with ``@job_handler('name')`` and called as
+``handler(job, **payload)``. ``enqueue('name', **payload)`` stores a job,
+which ``manage.py run_jobs`` workers claim and run. With the
+``JOBS_EAGER`` setting enabled jobs run straight away in the enqueuing
+process instead, without retries, so development needs no worker.
+Otherwise a deployment has to run workers next to the web processes,
+``manage.py check --deploy`` reminds of that.
+"""
+import logging
+import os
+import socket
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import checks
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = {}
+
+
+def job_handler(name):
+    """Register the decorated function as the handler of ``name`` jobs."""
+
+    def decorator(func):
+        HANDLERS[name] = func
+        return func
+
+    return decorator
+
+
+@checks.register(checks.Tags.compatibility, deploy=True)
+def check_jobs_worker(app_configs, **kwargs):
+    if settings.JOBS_EAGER:
+        return []
+    return [
+        checks.Warning(
+            'Background jobs are only run by manage.py run_jobs workers.',
+            hint='Run one next to the web processes, or new accounts stay '
+            'empty and board purges never happen. Set DJANGO_JOBS_EAGER=True '
+            'to run jobs inline instead.',
+            id='api.W001')
+    ]
+
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def enqueue(name, user=None, max_attempts=3, **payload):
+    """
+    Queue the job ``name`` with the JSON serializable ``payload``.
+    """
+    if name not in HANDLERS:
+        raise ValueError(f'No handler registered for job {name!r}.')
+    job = Job.objects.create(name=name,
+                             payload=payload,
+                             user=user,
+                             max_attempts=max_attempts)
+    if settings.JOBS_EAGER and claim_job(job.pk, 'eager'):
+        job.refresh_from_db()
+        # No worker may be around to retry it
+        run_job(job, retry=False)
+        job.refresh_from_db()
+    return job
+
+
+def claim_job(job_id, worker):
+    """
+    Atomically mark a queued job as running, return whether it was won.
+    """
+    return Job.objects.filter(pk=job_id, status=Job.QUEUED).update(
+        status=Job.RUNNING,
+        locked_by=worker,
+        locked_at=timezone.now(),
+        attempts=F('attempts') + 1) == 1
+
+
+def claim_next_job(worker):
+    """
+    Claim the oldest job that is due, or return None if there is none.
+    """
+    due = Job.objects.filter(status=Job.QUEUED,
+                             run_at__lte=timezone.now()).order_by(
+                                 'run_at', 'id').values_list('id', flat=True)
+    # Another worker may claim a candidate first, try the next one then.
+    for job_id in due[:10]:
+        if claim_job(job_id, worker):
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def requeue_stale_jobs():
+    """
+    Put jobs back in the queue whose worker died while running them, that
+    is, which haven't reported progress for ``JOBS_LOCK_TIMEOUT`` seconds.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+    return Job.objects.filter(status=Job.RUNNING,
+                              locked_at__lt=cutoff).update(status=Job.QUEUED,
+                                                           locked_by='',
+                                                           locked_at=None)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=settings.JOBS_RETRY_BACKOFF * 2**(attempts - 1))
+
+
+def _own(job):
+    """
+    The job's row while it is still the run of ``job``'s claim. Once
+    requeue_stale_jobs() gave the job to another worker, the claim's
+    outcome is no longer recorded.
+    """
+    return Job.objects.filter(pk=job.pk,
+                              attempts=job.attempts,
+                              status__in=[Job.RUNNING, Job.QUEUED])
+
+
+def run_job(job, retry=True):
+    """
+    Run a claimed job and record its outcome. Failed jobs are retried with
+    exponential backoff until ``max_attempts`` is reached, or fail right
+    away without ``retry``.
+    """
+    try:
+        handler = HANDLERS.get(job.name)
+        if handler is None:
+            raise LookupError(f'No handler registered for job {job.name!r}.')
+        result = handler(job, **job.payload)
+    except Exception:
+        logger.exception('Job %s (%s) failed', job.pk, job.name)
+        now = timezone.now()
+        retry = retry and job.attempts < job.max_attempts
+        _own(job).update(status=Job.QUEUED if retry else Job.FAILED,
+                         run_at=now +
+                         retry_delay(job.attempts) if retry else job.run_at,
+                         finished_at=None if retry else now,
+                         last_error=traceback.format_exc(),
+                         locked_by='',
+                         locked_at=None)
+        return False
+    if not _own(job).update(status=Job.SUCCEEDED,
+                            result=result,
+                            finished_at=timezone.now(),
+                            locked_by='',
+                            locked_at=None):
+        logger.warning('Job %s (%s) was requeued while it ran', job.pk,
+                       job.name)
+    return True
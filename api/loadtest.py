@@ -0,0 +1,331 @@
+"""
+Load testing of a running server, run with ``python manage.py loadtest``.
+
+A scenario starts ``users`` simulated users over ``ramp_up`` seconds.
+Each registers and logs in, joins a board shared by all of them and then,
+until ``duration`` seconds have passed, keeps running one of ``actions``
+picked by weight with a random ``think_time`` pause in between. Sharing
+the board makes the task moves contend for the same lists like a team
+dragging cards around does.
+
+Every request is recorded under its route, the method plus the path with
+ids replaced by ``{id}``. Responses with 409, 423 or 503, and 500s about
+locked or deadlocked rows, count as lock contention.
+"""
+import random
+import re
+import secrets
+import threading
+import time
+from collections import defaultdict
+
+import requests
+from django.utils import timezone
+
+DEFAULT_SCENARIO = {
+    'users': 10,
+    'duration': 30,
+    'ramp_up': 5,
+    'think_time': [0.05, 0.25],
+    'lists': 4,
+    'tasks': 40,
+    'actions': {
+        'browse_boards': 30,
+        'move_task': 40,
+        'write_journal': 15,
+        'read_analytics': 15,
+    },
+}
+
+PASSWORD = 'load-test-password'
+CONTENTION_STATUSES = {409, 423, 503}
+CONTENTION_MARKERS = (b'database is locked', b'deadlock',
+                      b'could not serialize', b'lock wait timeout')
+_ID = re.compile(r'/\d+(?=/|$)')
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of the sorted ``values``."""
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, round(percent / 100 * len(values)) - 1))
+    return values[rank]
+
+
+class Recorder:
+    """Thread-safe request timings and outcomes per route."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.contention = defaultdict(int)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, route, latency_ms, status, body=b''):
+        contended = status in CONTENTION_STATUSES or (status >= 500 and any(
+            marker in body.lower() for marker in CONTENTION_MARKERS))
+        with self.lock:
+            self.latencies[route].append(latency_ms)
+            self.statuses[route][status] += 1
+            if not 200 <= status < 400:
+                self.errors[route] += 1
+            if contended:
+                self.contention[route] += 1
+
+    def summary(self, elapsed):
+        """Throughput, latency percentiles and error rates per route."""
+        routes = {}
+        with self.lock:
+            for route, latencies in sorted(self.latencies.items()):
+                latencies = sorted(latencies)
+                count = len(latencies)
+                routes[route] = {
+                    'requests': count,
+                    'rps': count / elapsed,
+                    'p50_ms': percentile(latencies, 50),
+                    'p95_ms': percentile(latencies, 95),
+                    'p99_ms': percentile(latencies, 99),
+                    'max_ms': latencies[-1],
+                    'error_rate': self.errors[route] / count,
+                    'contention': self.contention[route],
+                    'statuses': {
+                        str(code): seen
+                        for code, seen in sorted(self.statuses[route].items())
+                    },
+                }
+            everything = sorted(latency
+                                for latencies in self.latencies.values()
+                                for latency in latencies)
+            total = len(everything)
+            totals = {
+                'requests': total,
+                'rps': total / elapsed,
+                'p50_ms': percentile(everything, 50),
+                'p95_ms': percentile(everything, 95),
+                'p99_ms': percentile(everything, 99),
+                'error_rate':
+                sum(self.errors.values()) / total if total else 0.0,
+                'contention': sum(self.contention.values()),
+            }
+        return totals, routes
+
+
+class VirtualUser:
+    """One simulated user with its own HTTP session."""
+
+    def __init__(self, base_url, recorder, username, rng=None):
+        self.base_url = base_url.rstrip('/') + '/'
+        self.recorder = recorder
+        self.username = username
+        self.rng = rng or random.Random()
+        self.session = requests.Session()
+        self.board = None
+        self.lists = []
+        self.tasks = []
+        # Other users' threads send requests as the owner to join
+        self.lock = threading.Lock()
+
+    def request(self, method, path, **kwargs):
+        """Send and record a request, returns the response or None."""
+        route = f'{method} {_ID.sub("/{id}", path.split("?")[0])}'
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method,
+                                            self.base_url + path,
+                                            timeout=30,
+                                            **kwargs)
+        except requests.RequestException:
+            self.recorder.record(route, (time.perf_counter() - start) * 1000,
+                                 0)
+            return None
+        self.recorder.record(route, (time.perf_counter() - start) * 1000,
+                             response.status_code, response.content)
+        return response if response.ok else None
+
+    def sign_up(self):
+        if self.request('POST',
+                        'register/',
+                        json={
+                            'username': self.username,
+                            'password': PASSWORD
+                        }) is None:
+            return False
+        response = self.request('POST',
+                                'login/',
+                                json={
+                                    'username': self.username,
+                                    'password': PASSWORD
+                                })
+        if response is None:
+            return False
+        self.session.headers['Authorization'] = (
+            f'Bearer {response.json()["access"]}')
+        return True
+
+    def create_shared_board(self, lists, tasks):
+        """Create the board all users work on, with lists and tasks."""
+        response = self.request('POST',
+                                'boards/',
+                                json={'name': f'Load test {self.username}'})
+        if response is None:
+            return False
+        self.board = response.json()['id']
+        for index in range(lists):
+            response = self.request('POST',
+                                    'lists/',
+                                    json={
+                                        'name': f'List {index + 1}',
+                                        'board': self.board
+                                    })
+            if response is None:
+                return False
+            self.lists.append(response.json()['id'])
+        response = self.request('POST',
+                                'tasks/bulk/',
+                                json={
+                                    'tasks': [{
+                                        'title': f'Task {index + 1}',
+                                        'list': self.lists[index % lists],
+                                        'priority': index % 3 + 1,
+                                        'complexity': index % 3 + 1,
+                                    } for index in range(tasks)]
+                                })
+        if response is None:
+            return False
+        self.tasks = [task['id'] for task in response.json()]
+        return True
+
+    def join(self, owner):
+        """Become a member of ``owner``'s shared board."""
+        self.board, self.lists, self.tasks = owner.board, owner.lists, owner.tasks
+        with owner.lock:
+            return owner.request('POST',
+                                 f'boards/{self.board}/add_member/',
+                                 json={'username': self.username}) is not None
+
+    def browse_boards(self):
+        self.request('GET', 'boards/')
+        self.request('GET', f'boards/{self.board}/')
+        self.request('GET', f'tasks/?list={self.rng.choice(self.lists)}')
+
+    def move_task(self):
+        self.request(
+            'POST',
+            f'tasks/{self.rng.choice(self.tasks)}/move/',
+            json={
+                'list_id':
+                self.rng.choice(self.lists),
+                'position':
+                self.rng.randrange(len(self.tasks) // len(self.lists) + 1),
+            })
+
+    def write_journal(self):
+        self.request('POST',
+                     'journal-entries/',
+                     json={
+                         'title': 'Load test entry',
+                         'content': 'Written by manage.py loadtest.',
+                         'task_id': self.rng.choice(self.tasks),
+                         'valence': round(self.rng.uniform(-1, 1), 3),
+                         'arousal': round(self.rng.uniform(-1, 1), 3),
+                         'visibility': 'private',
+                         'shared_with': [],
+                     })
+
+    def read_analytics(self):
+        path = self.rng.choice(
+            ('journal-entries/mood-statistics/',
+             'journal-entries/heatmap-data/', 'dashboard/dashboard/'))
+        self.request('GET', path)
+
+
+def _simulate(user, owner, scenario, start_at, deadline):
+    time.sleep(max(0.0, start_at - time.monotonic()))
+    if not user.sign_up() or not user.join(owner):
+        return
+    actions = list(scenario['actions'])
+    weights = [scenario['actions'][action] for action in actions]
+    low, high = scenario['think_time']
+    while time.monotonic() < deadline:
+        getattr(user, user.rng.choices(actions, weights)[0])()
+        time.sleep(user.rng.uniform(low, high))
+
+
+def run_scenario(base_url, scenario=None, seed=None):
+    """
+    Run ``scenario`` (merged over ``DEFAULT_SCENARIO``) against the API at
+    ``base_url`` and return the results: the scenario, totals and per
+    route statistics.
+    """
+    scenario = {**DEFAULT_SCENARIO, **(scenario or {})}
+    unknown = set(scenario['actions']) - set(DEFAULT_SCENARIO['actions'])
+    if unknown:
+        raise ValueError(f'Unknown actions: {", ".join(sorted(unknown))}')
+
+    rng = random.Random(seed)
+    run_id = secrets.token_hex(3)
+    recorder = Recorder()
+    started_at = timezone.now()
+    start = time.monotonic()
+
+    owner = VirtualUser(base_url, recorder, f'loadtest-{run_id}-owner',
+                        random.Random(rng.random()))
+    if not (owner.sign_up() and owner.create_shared_board(
+            scenario['lists'], scenario['tasks'])):
+        raise RuntimeError(f'Could not set up the shared board at {base_url}.')
+
+    users = scenario['users']
+    deadline = start + scenario['ramp_up'] + scenario['duration']
+    threads = [
+        threading.Thread(
+            target=_simulate,
+            args=(VirtualUser(base_url, recorder, f'loadtest-{run_id}-{index}',
+                              random.Random(rng.random())), owner, scenario,
+                  start + scenario['ramp_up'] * index / users, deadline),
+            daemon=True) for index in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    elapsed = time.monotonic() - start
+    totals, routes = recorder.summary(elapsed)
+    return {
+        'run_id': run_id,
+        'base_url': base_url,
+        'started_at': started_at.isoformat(),
+        'elapsed_s': elapsed,
+        'scenario': scenario,
+        'totals': totals,
+        'routes': routes,
+    }
+
+
+def compare(results, baseline):
+    """
+    Per route changes from ``baseline`` to ``results``: relative change of
+    throughput and p95 latency, absolute change of the error rate.
+    """
+
+    def change(new, old):
+        if new is None or not old:
+            return None
+        return (new - old) / old
+
+    rows = {}
+    for route in sorted(set(results['routes']) | set(baseline['routes'])):
+        new = results['routes'].get(route, {})
+        old = baseline['routes'].get(route, {})
+        rows[route] = {
+            'rps_change':
+            change(new.get('rps'), old.get('rps')),
+            'p95_change':
+            change(new.get('p95_ms'), old.get('p95_ms')),
+            'error_rate_change':
+            new.get('error_rate', 0.0) - old.get('error_rate', 0.0),
+            'contention_change':
+            new.get('contention', 0) - old.get('contention', 0),
+        }
+    return rows
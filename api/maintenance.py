@@ -0,0 +1,439 @@
+"""
+Database maintenance and health report.
+
+``maintain(alias)`` refreshes the planner statistics (ANALYZE), returns
+free pages to the file system (incremental VACUUM) and checks the
+integrity of one database. ``health_report()`` then describes every
+database: table and index sizes, free space, the indexes none of
+``KEY_QUERIES`` uses (SQLite keeps no index usage statistics, PostgreSQL's
+are used instead) and the plan the database picks for each of those
+queries. ``compare()`` lists what changed since an earlier report, which
+is how drift shows up between scheduled runs.
+
+Run with ``manage.py db_maintenance`` or the ``db_maintenance`` job.
+Only SQLite and PostgreSQL are supported.
+"""
+import re
+import time
+
+from django.apps import apps
+from django.db import connections, router
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .archive import archive_cutoff
+from .jobs import job_handler
+from .models import ArchivedJournalEntry, Board, CustomUser, JournalEntry, Task
+from .sharding import (SHARDED_MODELS, journal_databases, sharding_enabled,
+                       user_journal_entries)
+
+_SQLITE_INDEX = re.compile(r'USING (?:COVERING )?INDEX (\w+)')
+_SQLITE_SCAN = re.compile(r'\bSCAN (\w+)$', re.M)
+_POSTGRES_INDEX = re.compile(r'Index (?:Only )?Scan (?:Backward )?using (\w+)')
+_POSTGRES_SCAN = re.compile(r'Seq Scan on (\w+)')
+
+
+def _sample():
+    """Ids to run the key queries with, made up on an empty database."""
+    task = Task.objects.values('pk', 'list_id', 'board_id').first() or {}
+    return {
+        'user': CustomUser.objects.values_list('pk', flat=True).first() or 1,
+        'board': task.get('board_id', 1),
+        'list': task.get('list_id', 1),
+        'task': task.get('pk', 1),
+    }
+
+
+KEY_QUERIES = {}
+
+
+def key_query(name):
+    """
+    Register the decorated function, which builds one of the hot queries of
+    api/views.py from the ids of ``_sample()``, as key query ``name``.
+    """
+
+    def decorator(func):
+        KEY_QUERIES[name] = func
+        return func
+
+    return decorator
+
+
+@key_query('boards.overdue_counts')
+def _overdue_counts(sample):
+    return Task.objects.overdue().filter(
+        board__in=[sample['board']]).order_by().values_list('board').annotate(
+            Count('id'))
+
+
+@key_query('boards.members')
+def _member_boards(sample):
+    return Board.objects.filter(members=sample['user'], is_template=False)
+
+
+@key_query('tasks.list')
+def _list_tasks(sample):
+    return Task.objects.filter(list=sample['list'])
+
+
+@key_query('tasks.overdue')
+def _overdue_tasks(sample):
+    return Task.objects.for_member(sample['user']).overdue().order_by(
+        'due_date', 'id')
+
+
+@key_query('tasks.due_soon')
+def _tasks_due_soon(sample):
+    return Task.objects.for_assignee(sample['user']).due_soon().order_by(
+        'due_date', 'id')
+
+
+@key_query('dashboard.uncompleted')
+def _uncompleted_tasks(sample):
+    return Task.objects.filter(assigned_to=sample['user'],
+                               completed=False).order_by('due_date')
+
+
+@key_query('journal.list')
+def _journal_entries(sample):
+    return user_journal_entries(sample['user'])
+
+
+@key_query('journal.last_activity')
+def _last_activity(sample):
+    return user_journal_entries(
+        sample['user']).filter(task__isnull=False).values('task').annotate(
+            Max('created_at')).order_by()
+
+
+@key_query('journal.project_overview')
+def _project_overview(sample):
+    return JournalEntry.objects.filter(
+        board=sample['board'],
+        visibility='public').values('created_at__date').annotate(
+            Count('id')).order_by()
+
+
+@key_query('journal.task_history')
+def _task_history(sample):
+    return JournalEntry.objects.filter(
+        task=sample['task']).order_by('created_at')
+
+
+@key_query('journal.archive_batch')
+def _archive_batch(sample):
+    entries = JournalEntry.objects.filter(created_at__lt=archive_cutoff())
+    return entries.order_by('created_at').values('id')[:1000]
+
+
+@key_query('archive.newest')
+def _newest_archived(sample):
+    return ArchivedJournalEntry.objects.order_by('-created_at').values(
+        'created_at')[:1]
+
+
+@key_query('archive.project_overview')
+def _archived_project_overview(sample):
+    return ArchivedJournalEntry.objects.filter(
+        task__board=sample['board']).values('created_at__date').annotate(
+            Count('id')).order_by()
+
+
+def databases():
+    """The aliases to maintain: default and the journal shards."""
+    return list(dict.fromkeys(['default', *journal_databases()]))
+
+
+def _timed(cursor, sql):
+    start = time.perf_counter()
+    cursor.execute(sql)
+    rows = cursor.fetchall() if cursor.description else []
+    return rows, round((time.perf_counter() - start) * 1000, 1)
+
+
+def maintain(alias,
+             analyze=True,
+             vacuum=True,
+             full_vacuum=False,
+             vacuum_pages=None,
+             quick_check=False):
+    """
+    ANALYZE, VACUUM and check the integrity of database ``alias``.
+
+    SQLite only vacuums incrementally once ``auto_vacuum`` is INCREMENTAL,
+    which takes one full VACUUM (``full_vacuum``) to switch to. Returns
+    what was done and how long it took; ``integrity`` is ``['ok']`` when
+    the check passed.
+    """
+    connection = connections[alias]
+    result = {'vendor': connection.vendor}
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            if vacuum:
+                result['vacuum'] = _sqlite_vacuum(cursor, full_vacuum,
+                                                  vacuum_pages)
+            if analyze:
+                _, result['analyze_ms'] = _timed(cursor, 'ANALYZE')
+                _timed(cursor, 'PRAGMA optimize')
+            check = 'quick_check' if quick_check else 'integrity_check'
+            rows, result['integrity_ms'] = _timed(cursor, f'PRAGMA {check}')
+            result['integrity'] = [row[0] for row in rows]
+            rows, _ = _timed(cursor, 'PRAGMA foreign_key_check')
+            result['integrity'] += [
+                f'{row[0]} row {row[1]} references a missing {row[2]} row'
+                for row in rows
+            ]
+        elif connection.vendor == 'postgresql':
+            if vacuum:
+                sql = 'VACUUM FULL' if full_vacuum else 'VACUUM'
+                _, milliseconds = _timed(cursor, sql)
+                result['vacuum'] = {'mode': sql, 'ms': milliseconds}
+            if analyze:
+                _, result['analyze_ms'] = _timed(cursor, 'ANALYZE')
+            # Needs the amcheck extension, not attempted
+            result['integrity'] = None
+        else:
+            result['skipped'] = f'{connection.vendor} is not supported'
+    return result
+
+
+def _sqlite_vacuum(cursor, full_vacuum, pages):
+    cursor.execute('PRAGMA auto_vacuum')
+    mode = cursor.fetchone()[0]
+    cursor.execute('PRAGMA freelist_count')
+    free_before = cursor.fetchone()[0]
+    if full_vacuum:
+        cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        _, milliseconds = _timed(cursor, 'VACUUM')
+        mode = 'full'
+    elif mode == 2:
+        sql = ('PRAGMA incremental_vacuum' if pages is None else
+               f'PRAGMA incremental_vacuum({int(pages)})')
+        _, milliseconds = _timed(cursor, sql)
+        mode = 'incremental'
+    else:
+        return {
+            'mode': 'skipped',
+            'free_pages': free_before,
+            'hint': 'auto_vacuum is not INCREMENTAL, run a full vacuum once',
+        }
+    cursor.execute('PRAGMA freelist_count')
+    return {
+        'mode': mode,
+        'ms': milliseconds,
+        'pages_freed': free_before - cursor.fetchone()[0],
+    }
+
+
+def _indexes(connection, cursor, tables):
+    indexes = {}
+    for table in tables:
+        constraints = connection.introspection.get_constraints(cursor, table)
+        for name, info in constraints.items():
+            if info['index'] and not info['primary_key']:
+                # expression indexes have no column names
+                columns = [
+                    column or 'expression' for column in info['columns']
+                ]
+                indexes[name] = {
+                    'table': table,
+                    'columns': columns,
+                    'unique': info['unique'],
+                }
+    return indexes
+
+
+def _sizes(connection, cursor):
+    """Bytes per table and index name, and the file's total and free bytes."""
+    if connection.vendor == 'sqlite':
+        cursor.execute('PRAGMA page_size')
+        page_size = cursor.fetchone()[0]
+        cursor.execute('PRAGMA page_count')
+        total = cursor.fetchone()[0] * page_size
+        cursor.execute('PRAGMA freelist_count')
+        free = cursor.fetchone()[0] * page_size
+        try:
+            cursor.execute(
+                'SELECT name, SUM(pgsize) FROM dbstat GROUP BY name')
+            sizes = dict(cursor.fetchall())
+        except Exception:
+            # SQLite built without the dbstat table
+            sizes = {}
+        return sizes, {'total_bytes': total, 'free_bytes': free}
+    if connection.vendor == 'postgresql':
+        cursor.execute(
+            'SELECT c.relname, pg_relation_size(c.oid) FROM pg_class c '
+            'JOIN pg_namespace n ON n.oid = c.relnamespace '
+            "WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'i')")
+        sizes = dict(cursor.fetchall())
+        cursor.execute('SELECT pg_database_size(current_database())')
+        return sizes, {'total_bytes': cursor.fetchone()[0], 'free_bytes': None}
+    return {}, {'total_bytes': None, 'free_bytes': None}
+
+
+def _postgres_scans(cursor):
+    cursor.execute('SELECT indexrelname, idx_scan FROM pg_stat_user_indexes')
+    return dict(cursor.fetchall())
+
+
+def _explain(queryset):
+    vendor = connections[queryset.db].vendor
+    try:
+        plan = queryset.explain().splitlines()
+    except Exception as exc:
+        return {'database': queryset.db, 'error': str(exc)}
+    text = '\n'.join(plan)
+    index_pattern, scan_pattern = ((_POSTGRES_INDEX, _POSTGRES_SCAN)
+                                   if vendor == 'postgresql' else
+                                   (_SQLITE_INDEX, _SQLITE_SCAN))
+    return {
+        'database': queryset.db,
+        'plan': plan,
+        'indexes': sorted(set(index_pattern.findall(text))),
+        'full_scans': sorted(set(scan_pattern.findall(text))),
+    }
+
+
+def explain_key_queries():
+    """
+    The plan of every key query and the indexes and full scans in it.
+    Journal queries are explained on every shard, as ``name@alias``.
+    """
+    sample = _sample()
+    plans = {}
+    for name, build in KEY_QUERIES.items():
+        queryset = build(sample)
+        if queryset.model in SHARDED_MODELS and sharding_enabled():
+            for alias in journal_databases():
+                plans[f'{name}@{alias}'] = _explain(queryset.using(alias))
+        else:
+            plans[name] = _explain(queryset)
+    return plans
+
+
+def health_report(aliases=None):
+    """Sizes, indexes and key query plans of the given databases."""
+    aliases = aliases or databases()
+    queries = explain_key_queries()
+    used = {}
+    for name, query in queries.items():
+        for index in query.get('indexes', ()):
+            used.setdefault((query['database'], index), []).append(name)
+
+    own_tables = {
+        model._meta.db_table
+        for model in apps.get_app_config('api').get_models(
+            include_auto_created=True)
+    }
+    report = {
+        'generated_at': timezone.now().isoformat(),
+        'databases': {},
+        'queries': queries,
+    }
+    for alias in aliases:
+        connection = connections[alias]
+        tables = [
+            model._meta.db_table
+            for model in apps.get_models(include_auto_created=True)
+            if router.allow_migrate_model(alias, model)
+        ]
+        with connection.cursor() as cursor:
+            existing = set(connection.introspection.table_names(cursor))
+            tables = sorted(set(tables) & existing)
+            sizes, file_size = _sizes(connection, cursor)
+            indexes = _indexes(connection, cursor, tables)
+            scans = (_postgres_scans(cursor)
+                     if connection.vendor == 'postgresql' else None)
+
+        unused = []
+        for name, index in indexes.items():
+            index['bytes'] = sizes.get(name)
+            index['used_by'] = used.get((alias, name), [])
+            if scans is not None:
+                index['scans'] = scans.get(name)
+                idle = index['scans'] == 0
+            else:
+                idle = not index['used_by']
+            # Unique indexes enforce constraints, and KEY_QUERIES only
+            # covers this app's tables
+            if idle and not index['unique'] and index['table'] in own_tables:
+                unused.append(name)
+        report['databases'][alias] = {
+            'vendor': connection.vendor,
+            **file_size,
+            'tables': {
+                table: sizes.get(table)
+                for table in tables
+            },
+            'indexes': indexes,
+            'unused_indexes': sorted(unused),
+        }
+    return report
+
+
+def compare(report, baseline):
+    """
+    What changed from ``baseline`` to ``report``: key queries whose indexes
+    or full scans differ, relative growth of tables and indexes, and newly
+    unused indexes.
+    """
+
+    def growth(new, old):
+        if new is None or not old:
+            return None
+        return (new - old) / old
+
+    plans = {}
+    for name, query in report['queries'].items():
+        old = baseline['queries'].get(name)
+        if old is None:
+            continue
+        for key in ('indexes', 'full_scans'):
+            if query.get(key) != old.get(key):
+                plans.setdefault(name, {})[key] = {
+                    'before': old.get(key),
+                    'after': query.get(key),
+                }
+
+    sizes = {}
+    unused = {}
+    for alias, database in report['databases'].items():
+        old = baseline['databases'].get(alias)
+        if old is None:
+            continue
+        for kind in ('tables', 'indexes'):
+            for name, value in database[kind].items():
+                new_bytes = value['bytes'] if kind == 'indexes' else value
+                old_value = old[kind].get(name)
+                old_bytes = (old_value or {}
+                             ).get('bytes') if kind == 'indexes' else old_value
+                sizes[f'{alias}.{name}'] = growth(new_bytes, old_bytes)
+        new_unused = sorted(
+            set(database['unused_indexes']) - set(old['unused_indexes']))
+        if new_unused:
+            unused[alias] = new_unused
+    return {'plans': plans, 'growth': sizes, 'newly_unused_indexes': unused}
+
+
+@job_handler('db_maintenance')
+def db_maintenance_job(job, vacuum=True, full_vacuum=False):
+    maintenance = {}
+    for alias in databases():
+        maintenance[alias] = maintain(alias,
+                                      vacuum=vacuum,
+                                      full_vacuum=full_vacuum)
+        job.set_progress(done=list(maintenance))
+    report = health_report()
+    return {
+        'maintenance': maintenance,
+        'unused_indexes': {
+            alias: database['unused_indexes']
+            for alias, database in report['databases'].items()
+        },
+        'full_scans': {
+            name: query['full_scans']
+            for name, query in report['queries'].items()
+            if query.get('full_scans')
+        },
+    }
@@ -0,0 +1,31 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.archive import archive_journal_entries, archive_cutoff
+
+
+class Command(BaseCommand):
+    help = ('Moves journal entries older than JOURNAL_ARCHIVE_AFTER_DAYS '
+            'to the archive table')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days',
+                            type=int,
+                            help='Archive entries older than this many days '
+                            'instead.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        before = (timezone.now() - timedelta(days=options['days'])
+                  if options['days'] is not None else archive_cutoff())
+        archived = archive_journal_entries(
+            before,
+            options['batch_size'],
+            progress=lambda archived: self.stdout.write(
+                f'  {archived} entries archived'))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Archived {archived} journal entries created before '
+                f'{before:%Y-%m-%d %H:%M}'))
@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = ('Runs the micro benchmarks in api/benchmarks. Seeded data is '
+            'rolled back, the database must be migrated.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites',
+                            nargs='*',
+                            help='Suites to run (default: all). Available: ' +
+                            ', '.join(sorted(SUITES)))
+        parser.add_argument('--scale',
+                            type=int,
+                            default=1,
+                            help='Multiply the seeded data volume.')
+        parser.add_argument('--repeat',
+                            type=int,
+                            default=5,
+                            help='Runs per measurement, the best is kept.')
+        parser.add_argument('--json',
+                            action='store_true',
+                            help='Print the results as JSON lines.')
+
+    def handle(self, *args, **options):
+        names = options['suites'] or sorted(SUITES)
+        unknown = set(names) - set(SUITES)
+        if unknown:
+            raise CommandError(f'Unknown suites: {", ".join(sorted(unknown))}')
+
+        for name in names:
+            if not options['json']:
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+            SUITES[name](self.reporter(name, options['json']),
+                         options['scale'], options['repeat'])
+
+    def reporter(self, suite, as_json):
+
+        def report(case, **metrics):
+            if as_json:
+                self.stdout.write(
+                    json.dumps({
+                        'suite': suite,
+                        'case': case,
+                        **metrics
+                    }))
+            else:
+                values = '  '.join(f'{key}={_format(value)}'
+                                   for key, value in metrics.items())
+                self.stdout.write(f'  {case:<40} {values}')
+
+        return report
+
+
+def _format(value):
+    return f'{value:.2f}' if isinstance(value, float) else str(value)
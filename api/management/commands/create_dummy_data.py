@@ -5,6 +5,7 @@ from django.core.management.base import BaseCommand
 from django.utils.timezone import make_aware, now
 
 from api.models import Board, CustomUser, JournalEntry, List, Task
+from api.sharding import set_shared_with
 
 
 class Command(BaseCommand):
@@ -103,7 +104,7 @@ class Command(BaseCommand):
                             potential_shared_users,
                             k=random.randint(
                                 1, min(3, len(potential_shared_users))))
-                        journal_entry.shared_with.set(shared_users)
+                        set_shared_with(journal_entry, shared_users)
 
                     self.stdout.write(
                         self.style.SUCCESS(
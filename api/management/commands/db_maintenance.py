@@ -0,0 +1,158 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.maintenance import compare, databases, health_report, maintain
+
+
+def _size(value):
+    if value is None:
+        return '?'
+    for unit in ('B', 'kB', 'MB'):
+        if value < 1024:
+            return f'{value:.0f} {unit}'
+        value /= 1024
+    return f'{value:.1f} GB'
+
+
+class Command(BaseCommand):
+    help = ('Runs ANALYZE, incremental VACUUM and integrity checks, then '
+            'reports table and index sizes, unused indexes and the plans of '
+            'the key queries')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database',
+                            action='append',
+                            choices=list(connections),
+                            help='Maintain only this database, repeatable. '
+                            'Defaults to default and the journal shards.')
+        parser.add_argument('--report-only',
+                            action='store_true',
+                            help='Only write the report, change nothing.')
+        parser.add_argument('--full-vacuum',
+                            action='store_true',
+                            help='Rebuild the database files, which also '
+                            'turns on incremental vacuuming on SQLite.')
+        parser.add_argument('--vacuum-pages',
+                            type=int,
+                            help='Free at most this many pages per database.')
+        parser.add_argument('--quick',
+                            action='store_true',
+                            help='Run the faster, less thorough integrity '
+                            'check.')
+        parser.add_argument('--save',
+                            help='Write the report as JSON to this file.')
+        parser.add_argument('--compare',
+                            help='Report the changes since the report saved '
+                            'in this file.')
+        parser.add_argument('--growth',
+                            type=float,
+                            default=0.2,
+                            help='Size growth to report with --compare, as a '
+                            'fraction. Defaults to 0.2.')
+        parser.add_argument('--json',
+                            action='store_true',
+                            help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        aliases = options['database'] or databases()
+        maintenance = {}
+        if not options['report_only']:
+            for alias in aliases:
+                maintenance[alias] = maintain(
+                    alias,
+                    full_vacuum=options['full_vacuum'],
+                    vacuum_pages=options['vacuum_pages'],
+                    quick_check=options['quick'])
+
+        report = health_report(aliases)
+        report['maintenance'] = maintenance
+        if options['compare']:
+            try:
+                with open(options['compare']) as baseline:
+                    report['changes'] = compare(report, json.load(baseline))
+            except FileNotFoundError:
+                raise CommandError(f'No report at {options["compare"]}.')
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(report, file, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.write_report(report, options['growth'])
+
+        failed = [
+            alias for alias, result in maintenance.items()
+            if result.get('integrity') not in (None, ['ok'])
+        ]
+        if failed:
+            raise CommandError(
+                f'Integrity check failed on {", ".join(failed)}.')
+
+    def write_report(self, report, growth):
+        for alias, database in report['databases'].items():
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    f'{alias} ({database["vendor"]})  '
+                    f'{_size(database["total_bytes"])}, '
+                    f'{_size(database["free_bytes"])} free'))
+            result = report['maintenance'].get(alias)
+            if result:
+                if 'skipped' in result:
+                    self.stdout.write(f'  maintenance skipped: '
+                                      f'{result["skipped"]}')
+                if 'vacuum' in result:
+                    self.stdout.write(f'  vacuum: {result["vacuum"]}')
+                if 'analyze_ms' in result:
+                    self.stdout.write(f'  analyze: {result["analyze_ms"]} ms')
+                if result.get('integrity') is not None:
+                    style = (self.style.SUCCESS if result['integrity']
+                             == ['ok'] else self.style.ERROR)
+                    for line in result['integrity'][:20]:
+                        self.stdout.write(style(f'  integrity: {line}'))
+            for table, size in sorted(database['tables'].items(),
+                                      key=lambda item: -(item[1] or 0)):
+                self.stdout.write(f'  {_size(size):>10}  {table}')
+            for name, index in sorted(
+                    database['indexes'].items(),
+                    key=lambda item: -(item[1]['bytes'] or 0)):
+                unused = name in database['unused_indexes']
+                line = (f'  {_size(index["bytes"]):>10}  {name} on '
+                        f'{index["table"]}({", ".join(index["columns"])})')
+                self.stdout.write(
+                    self.style.WARNING(f'{line}  unused') if unused else line)
+
+        self.stdout.write(self.style.MIGRATE_HEADING('Key queries'))
+        for name, query in report['queries'].items():
+            if 'error' in query:
+                self.stdout.write(
+                    self.style.ERROR(f'  {name}: {query["error"]}'))
+                continue
+            line = (f'  {name} [{query["database"]}]: '
+                    f'{", ".join(query["indexes"]) or "no index"}')
+            if query['full_scans']:
+                line += f'; full scan of {", ".join(query["full_scans"])}'
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
+            for step in query['plan']:
+                self.stdout.write(f'      {step}')
+
+        changes = report.get('changes')
+        if changes is None:
+            return
+        self.stdout.write(self.style.MIGRATE_HEADING('Since the baseline'))
+        for name, change in changes['plans'].items():
+            for key, values in change.items():
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'  {name} {key}: {values["before"]} -> '
+                        f'{values["after"]}'))
+        for name, fraction in sorted(changes['growth'].items()):
+            if fraction is not None and fraction >= growth:
+                self.stdout.write(f'  {name} grew by {fraction:.0%}')
+        for alias, names in changes['newly_unused_indexes'].items():
+            self.stdout.write(
+                self.style.WARNING(
+                    f'  {alias} newly unused: {", ".join(names)}'))
@@ -0,0 +1,100 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.loadtest import DEFAULT_SCENARIO, compare, run_scenario
+
+
+class Command(BaseCommand):
+    help = ('Runs a multi-user load test against a running server and '
+            'reports throughput, latency, errors and lock contention per '
+            'route. The simulated users and their data are left in the '
+            'database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url',
+                            default='http://127.0.0.1:8000/api/',
+                            help='Base URL of the API.')
+        parser.add_argument('--scenario',
+                            help='JSON file overriding keys of the default '
+                            'scenario: ' + ', '.join(DEFAULT_SCENARIO))
+        parser.add_argument('--users', type=int)
+        parser.add_argument('--duration',
+                            type=float,
+                            help='Seconds to run after the ramp-up.')
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--save', help='Write the results to this file.')
+        parser.add_argument('--compare',
+                            help='Results file of an earlier run to compare '
+                            'against.')
+        parser.add_argument('--json',
+                            action='store_true',
+                            help='Print the results as JSON.')
+
+    def handle(self, *args, **options):
+        scenario = {}
+        if options['scenario']:
+            scenario = self.load(options['scenario'])
+        for key in ('users', 'duration'):
+            if options[key] is not None:
+                scenario[key] = options[key]
+        baseline = self.load(
+            options['compare']) if options['compare'] else None
+
+        try:
+            results = run_scenario(options['url'], scenario, options['seed'])
+        except (ValueError, RuntimeError) as exc:
+            raise CommandError(exc)
+        if baseline is not None:
+            results['comparison'] = compare(results, baseline)
+
+        if options['save']:
+            with open(options['save'], 'w') as file:
+                json.dump(results, file, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        totals = results['totals']
+        self.stdout.write(
+            self.style.MIGRATE_HEADING(
+                f'{results["scenario"]["users"]} users, '
+                f'{results["elapsed_s"]:.1f} s, {totals["requests"]} requests')
+        )
+        self.stdout.write(
+            f'  {"route":<48} {"req":>6} {"rps":>7} {"p50":>7} {"p95":>7} '
+            f'{"p99":>7} {"err%":>6} {"lock":>5}')
+        for route, stats in [*results['routes'].items(), ('total', totals)]:
+            self.stdout.write(
+                f'  {route:<48} {stats["requests"]:>6} {stats["rps"]:>7.1f} '
+                f'{_ms(stats["p50_ms"])} {_ms(stats["p95_ms"])} '
+                f'{_ms(stats["p99_ms"])} {stats["error_rate"] * 100:>6.1f} '
+                f'{stats["contention"]:>5}')
+
+        if baseline is not None:
+            self.stdout.write('')
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(f'Compared to {baseline["run_id"]} '
+                                           f'({baseline["started_at"]})'))
+            for route, row in results['comparison'].items():
+                self.stdout.write(
+                    f'  {route:<48} rps {_percent(row["rps_change"])}  '
+                    f'p95 {_percent(row["p95_change"])}  '
+                    f'err {row["error_rate_change"] * 100:+.1f} pts  '
+                    f'lock {row["contention_change"]:+d}')
+
+    def load(self, path):
+        try:
+            with open(path) as file:
+                return json.load(file)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Could not read {path}: {exc}')
+
+
+def _ms(value):
+    return f'{value:>7.1f}' if value is not None else f'{"-":>7}'
+
+
+def _percent(value):
+    return f'{value * 100:+.1f}%' if value is not None else 'n/a'
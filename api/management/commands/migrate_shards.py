@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Creates or updates the journal entry tables in every database '
+            'of JOURNAL_SHARDS')
+
+    def handle(self, *args, **options):
+        if not settings.JOURNAL_SHARDS:
+            self.stdout.write('JOURNAL_SHARDS is empty, nothing to migrate.')
+            return
+        for alias in settings.JOURNAL_SHARDS:
+            self.stdout.write(f'Migrating {alias}')
+            call_command('migrate',
+                         database=alias,
+                         interactive=False,
+                         verbosity=options['verbosity'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Migrated {len(settings.JOURNAL_SHARDS)} shards'))
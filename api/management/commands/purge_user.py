@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.deletion import purge_user
+from api.jobs import enqueue
+from api.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = ('Deletes a user and their journal entries in batches, without '
+            "loading everything into memory like the admin's delete does")
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--async',
+                            action='store_true',
+                            dest='run_async',
+                            help='Queue a purge_user job instead.')
+
+    def handle(self, *args, **options):
+        try:
+            user = CustomUser.objects.get(username=options['username'])
+        except CustomUser.DoesNotExist:
+            raise CommandError(f'User {options["username"]!r} not found.')
+
+        if options['run_async']:
+            job = enqueue('purge_user',
+                          user_id=user.pk,
+                          batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.pk}'))
+            return
+
+        deleted = purge_user(user.pk, options['batch_size'])
+        for label, rows in sorted(deleted.items()):
+            self.stdout.write(f'  {label}: {rows}')
+        self.stdout.write(self.style.SUCCESS(f'Deleted {user.username}'))
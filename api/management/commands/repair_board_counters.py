@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import repair_counters
+
+
+class Command(BaseCommand):
+    help = ('Recomputes the denormalized task counters and last activity of '
+            'lists and boards and the board of tasks and journal entries')
+
+    def handle(self, *args, **kwargs):
+        for field, fixed in repair_counters().items():
+            self.stdout.write(
+                self.style.SUCCESS(f'{field}: corrected {fixed} rows'))
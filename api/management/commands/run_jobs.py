@@ -0,0 +1,67 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.jobs import claim_next_job, requeue_stale_jobs, run_job, worker_id
+
+
+class Command(BaseCommand):
+    help = ('Runs queued background jobs. Needed whenever JOBS_EAGER is off, '
+            'which is the default without DEBUG.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers',
+                            type=int,
+                            default=1,
+                            help='Number of worker processes.')
+        parser.add_argument('--once',
+                            action='store_true',
+                            help='Exit once no job is due.')
+        parser.add_argument('--poll-interval',
+                            type=float,
+                            default=1.0,
+                            help='Seconds to wait when the queue is empty.')
+
+    def handle(self, *args, **options):
+        if options['workers'] <= 1:
+            self.work(options['once'], options['poll_interval'])
+            return
+
+        # Forked children must not share the parent's database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=self.work,
+                            args=(options['once'], options['poll_interval']))
+            for _ in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+
+    def work(self, once, poll_interval):
+        worker = worker_id()
+        self.stdout.write(f'Worker {worker} started')
+        try:
+            while True:
+                requeue_stale_jobs()
+                job = claim_next_job(worker)
+                if job is None:
+                    if once:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                succeeded = run_job(job)
+                self.stdout.write(f'{worker}: job {job.pk} ({job.name}) '
+                                  f'{"succeeded" if succeeded else "failed"}')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connections.close_all()
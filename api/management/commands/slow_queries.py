@@ -0,0 +1,93 @@
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SORT_KEYS = {
+    'total': 'total_ms',
+    'max': 'max_ms',
+    'count': 'count',
+    'avg': 'avg_ms',
+}
+
+
+def aggregate(entries):
+    """Group slow-query log entries by fingerprint."""
+    groups = defaultdict(
+        lambda: {
+            'count': 0,
+            'total_ms': 0.0,
+            'max_ms': 0.0,
+            'params': set(),
+            'views': set(),
+            'call_sites': set(),
+        })
+    for entry in entries:
+        group = groups[entry['fingerprint']]
+        group['fingerprint'] = entry['fingerprint']
+        group['sql'] = entry['sql']
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        group['params'].add(entry['params_fingerprint'])
+        group['views'].add(entry['view'])
+        group['call_sites'].add(entry['call_site'])
+        group['last_seen'] = entry['logged_at']
+        if entry['plan']:
+            group['plan'] = entry['plan']
+    for group in groups.values():
+        group['avg_ms'] = group['total_ms'] / group['count']
+        group['distinct_params'] = len(group.pop('params'))
+        group['views'] = sorted(filter(None, group['views']))
+        group['call_sites'] = sorted(filter(None, group['call_sites']))
+    return list(groups.values())
+
+
+class Command(BaseCommand):
+    help = 'Summarizes the slow-query log by query fingerprint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=10)
+        parser.add_argument('--sort', choices=SORT_KEYS, default='total')
+        parser.add_argument('--log',
+                            help='Log file to read instead of SLOW_QUERY_LOG.')
+        parser.add_argument('--json',
+                            action='store_true',
+                            help='Print the summary as JSON.')
+
+    def handle(self, *args, **options):
+        path = options['log'] or settings.SLOW_QUERY_LOG
+        try:
+            with open(path) as log:
+                entries = [json.loads(line) for line in log if line.strip()]
+        except FileNotFoundError:
+            raise CommandError(f'No slow-query log at {path}, is '
+                               'SLOW_QUERY_THRESHOLD_MS set?')
+
+        key = SORT_KEYS[options['sort']]
+        groups = sorted(aggregate(entries),
+                        key=lambda group: group[key],
+                        reverse=True)[:options['top']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(groups, indent=2))
+            return
+
+        self.stdout.write(f'{len(entries)} slow queries in {path}')
+        for group in groups:
+            self.stdout.write('')
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    f'{group["fingerprint"]}  {group["count"]}x  '
+                    f'total {group["total_ms"]:.1f} ms  '
+                    f'avg {group["avg_ms"]:.1f} ms  '
+                    f'max {group["max_ms"]:.1f} ms  '
+                    f'{group["distinct_params"]} distinct params'))
+            self.stdout.write(f'  {group["sql"]}')
+            for view in group['views']:
+                self.stdout.write(f'  view: {view}')
+            for call_site in group['call_sites']:
+                self.stdout.write(f'  at: {call_site}')
+            for line in group.get('plan') or []:
+                self.stdout.write(f'  plan: {line}')
@@ -0,0 +1,195 @@
+import cProfile
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from .profiling import save_profile
+from .slow_queries import current_view
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+def accepted_encodings(header):
+    """
+    Return the content codings accepted by an Accept-Encoding header,
+    ignoring those with ``q=0``.
+    """
+    encodings = set()
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with brotli or gzip, whichever the client prefers
+    and is available, like Django's GZipMiddleware.
+
+    Streaming responses and responses below
+    ``RESPONSE_COMPRESSION_MIN_SIZE`` bytes are sent as they are.
+    """
+    # Random gzip padding as in GZipMiddleware, mitigates BREACH attacks
+    max_random_bytes = 100
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'RESPONSE_COMPRESSION_MIN_SIZE',
+                                1024)
+        self.brotli_quality = getattr(settings,
+                                      'RESPONSE_COMPRESSION_BROTLI_QUALITY', 4)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if len(response.content) < self.min_size:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding', ))
+        encodings = accepted_encodings(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if brotli is not None and 'br' in encodings:
+            encoding = 'br'
+            content = brotli.compress(response.content,
+                                      quality=self.brotli_quality)
+        elif 'gzip' in encodings or '*' in encodings:
+            encoding = 'gzip'
+            content = compress_string(response.content,
+                                      max_random_bytes=self.max_random_bytes)
+        else:
+            return response
+
+        if len(content) >= len(response.content):
+            return response
+        response.content = content
+        response.headers['Content-Length'] = str(len(content))
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes differ, a strong ETag would no longer match.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        return response
+
+
+class QueryCapture:
+    """``execute_wrapper`` recording the SQL of a connection with timings."""
+
+    def __init__(self, alias, queries):
+        self.alias = alias
+        self.queries = queries
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': self.alias,
+                'sql': sql,
+                'params': repr(params)[:1000],
+                'many': many,
+                'ms': (time.perf_counter() - start) * 1000,
+            })
+
+
+class ProfilingMiddleware:
+    """
+    Run single requests of staff users under cProfile when they carry an
+    ``X-Profile`` header or a ``_profile`` query parameter, and store the
+    profile and the SQL with api.profiling. The response gets the id in
+    an ``X-Profile-Id`` header; /api/profiles/ lists the stored profiles.
+
+    Unflagged requests only pay for two dictionary lookups.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if ('HTTP_X_PROFILE' not in request.META
+                and '_profile' not in request.GET):
+            return self.get_response(request)
+        user = self.staff_user(request)
+        if user is None:
+            return self.get_response(request)
+
+        queries = []
+        profiler = cProfile.Profile()
+        started_at = timezone.now()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(
+                        QueryCapture(connection.alias, queries)))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = time.perf_counter() - start
+
+        response['X-Profile-Id'] = save_profile(
+            profiler, {
+                'method': request.method,
+                'path': request.get_full_path(),
+                'user': user.username,
+                'status': response.status_code,
+                'started_at': started_at.isoformat(),
+                'duration_ms': duration * 1000,
+                'query_count': len(queries),
+                'query_ms': sum(query['ms'] for query in queries),
+                'queries': queries,
+            })
+        return response
+
+    def staff_user(self, request):
+        """The staff user of a session or JWT, None for anyone else."""
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_authenticated:
+            try:
+                authenticated = JWTAuthentication().authenticate(request)
+            except (AuthenticationFailed, InvalidToken):
+                return None
+            user = authenticated[0] if authenticated else None
+        return user if user is not None and user.is_staff else None
+
+
+class QueryContextMiddleware:
+    """Let api.slow_queries know which view runs a query."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_view.set(f'{request.method} {request.path}')
+        try:
+            return self.get_response(request)
+        finally:
+            current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if match is not None:
+            current_view.set(f'{request.method} {match.view_name}')
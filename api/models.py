@@ -1,8 +1,11 @@
+from datetime import timedelta
+
 from django.conf import settings
 from django.contrib.auth.models import (AbstractBaseUser, BaseUserManager,
                                         PermissionsMixin)
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Max
+from django.db.models.functions import Lower
 from django.utils import timezone
 
 
@@ -60,10 +63,34 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
         return self.username
 
 
+def allocate_positions(model, parent_field, parent_id, count=1):
+    """
+    Reserve ``count`` consecutive positions after the last ``model`` row
+    with ``parent_field=parent_id`` and return the first of them.
+
+    Must be called inside a transaction. The parent row is locked with a
+    no-op UPDATE until the transaction ends, so concurrent allocations for
+    the same parent wait for each other instead of reading the same
+    maximum.
+    """
+    parent = model._meta.get_field(parent_field).related_model
+    parent.objects.filter(pk=parent_id).update(id=models.F('id'))
+    max_position = model.objects.filter(**{
+        parent_field: parent_id
+    }).aggregate(Max('position'))['position__max']
+    return max_position + 1 if max_position is not None else 0
+
+
 class Board(models.Model):
     name = models.CharField(max_length=255)
     members = models.ManyToManyField(settings.AUTH_USER_MODEL,
                                      related_name='boards')
+    # Templates are only listed by /boards/templates/ and copied with clone
+    is_template = models.BooleanField(default=False)
+    # Maintained by api.counters
+    task_count = models.PositiveIntegerField(default=0)
+    completed_task_count = models.PositiveIntegerField(default=0)
+    last_activity_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -75,21 +102,59 @@ class List(models.Model):
                               on_delete=models.CASCADE,
                               related_name='lists')
     position = models.PositiveIntegerField(default=0)
+    # Maintained by api.counters
+    task_count = models.PositiveIntegerField(default=0)
+    completed_task_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         ordering = ['position']
 
     def save(self, *args, **kwargs):
-        if not self.position:
-            max_position = List.objects.filter(board=self.board).aggregate(
-                Max('position'))['position__max']
-            self.position = max_position + 1 if max_position is not None else 0
-        super().save(*args, **kwargs)
+        with transaction.atomic(using=kwargs.get('using')):
+            if not self.position:
+                self.position = allocate_positions(List, 'board',
+                                                   self.board_id)
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 
+class TaskQuerySet(models.QuerySet):
+
+    def overdue(self, now=None):
+        """Uncompleted tasks whose due date has passed."""
+        return self.filter(completed=False, due_date__lt=now or timezone.now())
+
+    def due_soon(self, within=timedelta(hours=48), now=None):
+        """Uncompleted tasks due in the next ``within``."""
+        now = now or timezone.now()
+        return self.filter(completed=False,
+                           due_date__gte=now,
+                           due_date__lt=now + within)
+
+    def for_assignee(self, user):
+        """The user's tasks, leaving out those on templates."""
+        return self.filter(assigned_to=user, board__is_template=False)
+
+    def for_board(self, board):
+        return self.filter(board=board)
+
+    def for_member(self, user):
+        """Tasks on the boards the user is a member of, except templates."""
+        return self.filter(board__members=user, board__is_template=False)
+
+    def title_prefix(self, prefix):
+        """
+        Tasks whose title starts with ``prefix``, ignoring case. A range on
+        the lowercased title, which task_title_lower_idx serves, where
+        ``istartswith``'s LIKE can't use an index.
+        """
+        prefix = prefix.lower()
+        return self.alias(title_lower=Lower('title')).filter(
+            title_lower__gte=prefix, title_lower__lt=prefix + '\U0010ffff')
+
+
 class Task(models.Model):
     STATUS_CHOICES = [
         ('active', 'Active'),
@@ -108,14 +173,32 @@ class Task(models.Model):
     list = models.ForeignKey('List',
                              on_delete=models.CASCADE,
                              related_name='tasks')
+    # The list's board, copied by save() so board queries need no join
+    board = models.ForeignKey('Board',
+                              on_delete=models.CASCADE,
+                              editable=False,
+                              db_index=False,
+                              related_name='tasks')
     assigned_to = models.ManyToManyField(settings.AUTH_USER_MODEL,
                                          related_name='assigned_tasks')
     position = models.IntegerField()
     completed = models.BooleanField(default=False)
     completed_at = models.DateTimeField(null=True, blank=True)
 
+    objects = TaskQuerySet.as_manager()
+
     class Meta:
         ordering = ['position']
+        indexes = [
+            models.Index(fields=['completed', 'due_date'],
+                         name='task_completed_due_date_idx'),
+            # Admin date hierarchy
+            models.Index(fields=['due_date'], name='task_due_date_idx'),
+            models.Index(fields=['board', 'completed', 'due_date'],
+                         name='task_board_completed_due_idx'),
+            # Typeahead search, see TaskQuerySet.title_prefix()
+            models.Index(Lower('title'), name='task_title_lower_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -129,26 +212,82 @@ class Task(models.Model):
         return self.due_date and self.due_date < timezone.now(
         ) and not self.completed
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember where the task was counted, see api.counters
+        instance._counted_as = (instance.__dict__.get('list_id'),
+                                instance.__dict__.get('completed'))
+        instance._board_of_list = instance.__dict__.get('list_id')
+        return instance
+
     def save(self, *args, **kwargs):
-        if self.position is None:
-            max_position = Task.objects.filter(list=self.list).aggregate(
-                Max('position'))['position__max']
-            self.position = max_position + 1 if max_position is not None else 0
-        super().save(*args, **kwargs)
+        self._moved_from_board = None
+        if (self.board_id is None
+                or self.list_id != getattr(self, '_board_of_list', None)):
+            old_board_id = self.board_id
+            self.board_id = self.list.board_id
+            self._board_of_list = self.list_id
+            if not self._state.adding and old_board_id != self.board_id:
+                # Its journal entries follow in api.signals
+                self._moved_from_board = old_board_id
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'list' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'board'}
+        with transaction.atomic(using=kwargs.get('using')):
+            if self.position is None:
+                self.position = allocate_positions(Task, 'list', self.list_id)
+            super().save(*args, **kwargs)
+
+
+def unlink_task(collector, field, sub_objs, using):
+    """``on_delete`` of ``JournalEntry.task``: SET_NULL, also the board."""
+    # The board first, sub_objs can be a queryset filtering on the task
+    collector.add_field_update(field.model._meta.get_field('board'), None,
+                               sub_objs)
+    collector.add_field_update(field, None, sub_objs)
+
+
+unlink_task.lazy_sub_objs = True
+
+
+class JournalEntryQuerySet(models.QuerySet):
+
+    def create(self, **kwargs):
+        if self._db is not None:
+            return super().create(**kwargs)
+        # Without .using() the routers pick the database by the new entry,
+        # i.e. its user's shard (api.sharding)
+        entry = self.model(**kwargs)
+        entry.save(force_insert=True)
+        return entry
 
 
 class JournalEntry(models.Model):
+    # The entries may live in a shard without the users and tasks
+    # (api.sharding), so their references have no database constraints.
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              on_delete=models.CASCADE,
+                             db_constraint=False,
                              related_name='journal_entries')
     title = models.CharField(max_length=255)
     content = models.TextField(blank=True)
     created_at = models.DateTimeField(default=timezone.now)
     task = models.ForeignKey('Task',
-                             on_delete=models.SET_NULL,
+                             on_delete=unlink_task,
                              null=True,
                              blank=True,
+                             db_constraint=False,
                              related_name='journal_entries')
+    # The task's board, copied by save() and kept in sync by api.signals
+    board = models.ForeignKey('Board',
+                              on_delete=models.SET_NULL,
+                              null=True,
+                              blank=True,
+                              editable=False,
+                              db_constraint=False,
+                              db_index=False,
+                              related_name='journal_entries')
     valence = models.FloatField(null=True, blank=True)
     arousal = models.FloatField(null=True, blank=True)
     visibility = models.CharField(max_length=10,
@@ -158,10 +297,175 @@ class JournalEntry(models.Model):
                                   default='private')
     shared_with = models.ManyToManyField(settings.AUTH_USER_MODEL,
                                          related_name='shared_journal_entries',
-                                         blank=True)
+                                         blank=True,
+                                         db_constraint=False)
+
+    objects = JournalEntryQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['task', 'user', 'created_at'],
+                         name='journal_task_user_created_idx'),
+            # Admin date hierarchy and archiving
+            models.Index(fields=['created_at'], name='journal_created_at_idx'),
+            models.Index(fields=['board', 'created_at'],
+                         name='journal_board_created_idx'),
+        ]
+
+    def __str__(self):
+        return self.title
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._board_of_task = instance.__dict__.get('task_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.task_id != getattr(self, '_board_of_task', None):
+            self.board_id = self.task.board_id if self.task_id else None
+            self._board_of_task = self.task_id
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'task' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'board'}
+        super().save(*args, **kwargs)
+
+
+class ArchivedJournalEntry(models.Model):
+    """
+    A journal entry moved out of ``JournalEntry`` by api.archive, keeping
+    its id. The mood index is stored instead of computed per query.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE,
+                             related_name='archived_journal_entries')
+    title = models.CharField(max_length=255)
+    content = models.TextField(blank=True)
+    created_at = models.DateTimeField()
+    task = models.ForeignKey('Task',
+                             on_delete=models.SET_NULL,
+                             null=True,
+                             blank=True,
+                             related_name='archived_journal_entries')
+    valence = models.FloatField(null=True, blank=True)
+    arousal = models.FloatField(null=True, blank=True)
+    mood_index = models.FloatField(null=True, blank=True)
+    visibility = models.CharField(max_length=10,
+                                  choices=[('private', 'Private'),
+                                           ('shared', 'Shared'),
+                                           ('public', 'Public')],
+                                  default='private')
+    shared_with = models.ManyToManyField(
+        settings.AUTH_USER_MODEL,
+        related_name='shared_archived_journal_entries',
+        blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'created_at'],
+                         name='archive_user_created_idx'),
+            models.Index(fields=['task', 'created_at'],
+                         name='archive_task_created_idx'),
+            # api.archive.newest_archived_at()
+            models.Index(fields=['created_at'], name='archive_created_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+
+class JournalMoodAggregate(models.Model):
+    """
+    Mood index totals of a user's archived entries on a task, which is
+    all the heatmap needs from the archive.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.CASCADE,
+                             related_name='journal_mood_aggregates')
+    task = models.ForeignKey('Task',
+                             on_delete=models.CASCADE,
+                             related_name='journal_mood_aggregates')
+    entry_count = models.PositiveIntegerField(default=0)
+    mood_sum = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'task'],
+                                    name='unique_mood_aggregate_user_task'),
+        ]
+
+
+class MoodInsight(models.Model):
+    """
+    Cached mood insights of a user (see api.insights): the sufficient
+    statistics of their mood index per combination of task priority,
+    complexity, overdue state, hour and weekday.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL,
+                                on_delete=models.CASCADE,
+                                primary_key=True,
+                                related_name='mood_insight')
+    cells = models.JSONField(default=dict)
+    entry_count = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField(default=timezone.now)
+    stale = models.BooleanField(default=False)
+
+
+class Job(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL,
+                             on_delete=models.SET_NULL,
+                             null=True,
+                             blank=True,
+                             related_name='jobs')
+    status = models.CharField(max_length=10,
+                              choices=STATUS_CHOICES,
+                              default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    progress = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'],
+                         name='job_status_run_at_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
+
+    def set_progress(self, **progress):
+        """
+        Record the progress of the running job, which also keeps
+        requeue_stale_jobs() from handing it to another worker.
+        """
+        self.progress = progress
+        self.locked_at = timezone.now()
+        Job.objects.filter(pk=self.pk,
+                           attempts=self.attempts,
+                           status=Job.RUNNING).update(progress=progress,
+                                                      locked_at=self.locked_at)
@@ -0,0 +1,21 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from .renderers import FastJSONRenderer, orjson
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser backed by orjson, falling back to the standard library for
+    non UTF-8 request bodies or when orjson is not installed.
+    """
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        if orjson is None or encoding.lower().replace('_', '-') != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
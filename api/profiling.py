@@ -0,0 +1,77 @@
+"""
+Storage of request profiles taken by ``api.middleware.ProfilingMiddleware``.
+
+Every profile is a pair of files in ``PROFILE_DIR``: ``<id>.prof`` with the
+cProfile stats (open it with ``python -m pstats`` or snakeviz) and
+``<id>.json`` with the request and the SQL it ran. Only the newest
+``PROFILE_MAX_COUNT`` profiles are kept.
+"""
+import io
+import json
+import pstats
+import re
+import secrets
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+PROFILE_ID = re.compile(r'^\d{8}-\d{12}-[0-9a-f]{4}$')
+
+
+def profile_dir():
+    path = Path(settings.PROFILE_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def profile_path(profile_id, suffix):
+    """Path of a profile file, None for ids that are not ours."""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    path = profile_dir() / f'{profile_id}{suffix}'
+    return path if path.exists() else None
+
+
+def save_profile(profiler, info):
+    """Store a finished ``cProfile.Profile`` with ``info`` and its id."""
+    profile_id = f'{timezone.now():%Y%m%d-%H%M%S%f}-{secrets.token_hex(2)}'
+    directory = profile_dir()
+    profiler.dump_stats(directory / f'{profile_id}.prof')
+    info = {'id': profile_id, **info}
+    (directory / f'{profile_id}.json').write_text(json.dumps(info,
+                                                             default=str))
+
+    # Ids sort by time, drop the oldest beyond the limit
+    for stale in sorted(
+            directory.glob('*.json'))[:-settings.PROFILE_MAX_COUNT]:
+        stale.unlink(missing_ok=True)
+        stale.with_suffix('.prof').unlink(missing_ok=True)
+    return profile_id
+
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first."""
+    profiles = []
+    for path in sorted(profile_dir().glob('*.json'), reverse=True):
+        info = json.loads(path.read_text())
+        info.pop('queries', None)
+        profiles.append(info)
+    return profiles
+
+
+def load_profile(profile_id, sort='cumulative', limit=50):
+    """
+    The stored info of a profile plus the top ``limit`` functions by
+    ``sort`` as pstats text, or None if there is no such profile.
+    """
+    info_path = profile_path(profile_id, '.json')
+    stats_path = profile_path(profile_id, '.prof')
+    if info_path is None or stats_path is None:
+        return None
+    info = json.loads(info_path.read_text())
+    output = io.StringIO()
+    stats = pstats.Stats(str(stats_path), stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    info['stats'] = output.getvalue()
+    return info
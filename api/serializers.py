@@ -1,7 +1,176 @@
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
 from django.utils import timezone
-from rest_framework import serializers
+from rest_framework import permissions, serializers
+from rest_framework.relations import PKOnlyObject
+
+from .models import Board, CustomUser, Job, JournalEntry, List, Task
+from .sharding import (SHARDED_MODELS, set_shared_with, shared_with_ids,
+                       sharding_enabled)
+
+
+def parse_field_paths(value):
+    """
+    Turn a comma separated list of dotted paths, e.g. ``id,task.title``,
+    into a nested dictionary, e.g. ``{'id': {}, 'task': {'title': {}}}``.
+    """
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in path.strip().split('.'):
+            if name:
+                node = node.setdefault(name, {})
+    return tree
+
+
+def wants_sparse_fieldset(request):
+    return 'fields' in request.query_params or 'expand' in request.query_params
+
+
+class SparseFieldsetMixin:
+    """
+    Let clients pick fields and nested relations with the ``fields`` and
+    ``expand`` query parameters of safe requests.
+
+    ``fields`` lists the fields to return, nested ones as ``task.title``.
+    ``expand`` lists the nested relations to embed, e.g.
+    ``task,task.assigned_to``; relations it doesn't list are returned as
+    primary keys. Without either parameter every field is returned fully
+    expanded. Write-only fields are never removed.
+    """
+
+    def __init__(self,
+                 *args,
+                 sparse_fields=None,
+                 sparse_expand=None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if (sparse_fields is None and sparse_expand is None
+                and request is not None
+                and request.method in permissions.SAFE_METHODS):
+            if 'fields' in request.query_params:
+                sparse_fields = parse_field_paths(
+                    request.query_params['fields'])
+            if 'expand' in request.query_params:
+                sparse_expand = parse_field_paths(
+                    request.query_params['expand'])
+        if sparse_fields is not None or sparse_expand is not None:
+            self._apply_sparse_fieldset(sparse_fields, sparse_expand)
+
+    def _apply_sparse_fieldset(self, sparse_fields, sparse_expand):
+        for name, field in list(self.fields.items()):
+            if field.write_only:
+                continue
+            if sparse_fields and name not in sparse_fields:
+                self.fields.pop(name)
+                continue
+            if not isinstance(field, serializers.BaseSerializer):
+                continue
+
+            many = isinstance(field, serializers.ListSerializer)
+            source = {'source': field.source} if field.source != name else {}
+            if sparse_expand is not None and name not in sparse_expand:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(
+                    many=many, read_only=True, **source)
+                continue
+
+            nested_fields = (sparse_fields or {}).get(name) or None
+            nested_expand = (sparse_expand.get(name)
+                             if sparse_expand is not None else None)
+            nested_class = type(field.child if many else field)
+            if (issubclass(nested_class, SparseFieldsetMixin) and
+                (nested_fields is not None or nested_expand is not None)):
+                self.fields[name] = nested_class(many=many,
+                                                 read_only=True,
+                                                 allow_null=field.allow_null,
+                                                 sparse_fields=nested_fields,
+                                                 sparse_expand=nested_expand,
+                                                 **source)
+
+
+def _stable(queryset):
+    # Unordered models get a deterministic order so that related objects
+    # render the same way as in api/fastpath.py.
+    if not queryset.model._meta.ordering:
+        queryset = queryset.order_by('pk')
+    return queryset
+
+
+def _crosses_databases(model, related_model):
+    return sharding_enabled() and ((model in SHARDED_MODELS)
+                                   != (related_model in SHARDED_MODELS))
+
+
+def _query_plan(serializer, model, prefix=''):
+    only, select_related, prefetch = set(), [], []
+    only.add(prefix + model._meta.pk.name)
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        name = field.source_attrs[0]
+        if name.startswith('get_') and name.endswith('_display'):
+            name = name[len('get_'):-len('_display')]
+        try:
+            model_field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        path = prefix + name
+        crosses = (model_field.is_relation
+                   and _crosses_databases(model, model_field.related_model))
+
+        if isinstance(field, serializers.ListSerializer):
+            child = field.child
+            child_only, child_select, child_prefetch = _query_plan(
+                child, child.Meta.model)
+            if model_field.one_to_many:
+                child_only.add(model_field.field.name)
+            queryset = _apply_query_plan(child.Meta.model.objects.all(),
+                                         child_only, child_select,
+                                         child_prefetch)
+            prefetch.append(Prefetch(path, queryset=_stable(queryset)))
+        elif isinstance(field, serializers.BaseSerializer) and crosses:
+            # No joins between shards and the default database
+            only.add(path)
+            queryset = _apply_query_plan(field.Meta.model.objects.all(),
+                                         *_query_plan(field, field.Meta.model))
+            prefetch.append(Prefetch(path, queryset=queryset))
+        elif isinstance(field, serializers.BaseSerializer):
+            only.add(path)
+            select_related.append(path)
+            nested_only, nested_select, nested_prefetch = _query_plan(
+                field, field.Meta.model, path + '__')
+            only |= nested_only
+            select_related += nested_select
+            prefetch += nested_prefetch
+        elif crosses:
+            # Read from the shard by the field, e.g. SharedWithField
+            continue
+        elif model_field.many_to_many or model_field.one_to_many:
+            related_model = model_field.related_model
+            queryset = related_model.objects.only(related_model._meta.pk.name)
+            prefetch.append(Prefetch(path, queryset=_stable(queryset)))
+        else:
+            only.add(path)
+    return only, select_related, prefetch
+
+
+def _apply_query_plan(queryset, only, select_related, prefetch):
+    queryset = queryset.only(*only).prefetch_related(*prefetch)
+    if select_related:
+        # select_related() without arguments would follow every foreign key
+        queryset = queryset.select_related(*select_related)
+    return queryset
+
 
-from .models import Board, CustomUser, JournalEntry, List, Task
+def optimize_queryset(queryset, serializer):
+    """
+    Restrict ``queryset`` to the columns and relations read by
+    ``serializer`` and load nested relations in bulk.
+    """
+    return _apply_query_plan(queryset, *_query_plan(serializer,
+                                                    queryset.model))
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -23,7 +192,7 @@ class ListSerializer(serializers.ModelSerializer):
         read_only_fields = ['position']
 
 
-class TaskSerializer(serializers.ModelSerializer):
+class TaskSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     assigned_to = UserSerializer(many=True, read_only=True)
     assigned_to_ids = serializers.PrimaryKeyRelatedField(
         queryset=CustomUser.objects.all(), many=True, write_only=True)
@@ -56,6 +225,118 @@ class TaskSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
+class TaskBulkItemSerializer(serializers.Serializer):
+    """
+    One task of a bulk create. The list and assignees are plain ids,
+    ``TaskBulkCreateSerializer`` checks them for all tasks at once.
+    """
+    title = serializers.CharField(max_length=255)
+    description = serializers.CharField(allow_blank=True, required=False)
+    due_date = serializers.DateTimeField(allow_null=True, required=False)
+    priority = serializers.ChoiceField(
+        choices=Task._meta.get_field('priority').choices, required=False)
+    complexity = serializers.ChoiceField(
+        choices=Task._meta.get_field('complexity').choices, required=False)
+    list = serializers.IntegerField()
+    assigned_to_ids = serializers.ListField(child=serializers.IntegerField(),
+                                            required=False)
+    completed = serializers.BooleanField(required=False)
+
+
+class TaskBulkCreateSerializer(serializers.Serializer):
+    tasks = TaskBulkItemSerializer(many=True,
+                                   allow_empty=False,
+                                   max_length=1000)
+
+    def validate_tasks(self, tasks):
+        user = self.context['request'].user
+        list_ids = {task['list'] for task in tasks}
+        boards = dict(
+            List.objects.filter(pk__in=list_ids,
+                                board__members=user).values_list(
+                                    'id', 'board_id'))
+        missing = list_ids - boards.keys()
+        if missing:
+            raise serializers.ValidationError(
+                f'Unknown lists: {sorted(missing)}.')
+
+        user_ids = {
+            user_id
+            for task in tasks
+            for user_id in task.get('assigned_to_ids', [])
+        }
+        found = set(
+            CustomUser.objects.filter(pk__in=user_ids).values_list('id',
+                                                                   flat=True))
+        if user_ids - found:
+            raise serializers.ValidationError(
+                f'Unknown users: {sorted(user_ids - found)}.')
+
+        for task in tasks:
+            task['board_id'] = boards[task['list']]
+        return tasks
+
+
+class TaskBulkAssignSerializer(serializers.Serializer):
+    """
+    Users to add to and remove from the assignees of many tasks. Added
+    users must be members of every task's board.
+    """
+    task_ids = serializers.ListField(child=serializers.IntegerField(),
+                                     allow_empty=False,
+                                     max_length=1000)
+    add = serializers.ListField(child=serializers.IntegerField(),
+                                required=False,
+                                default=list,
+                                max_length=100)
+    remove = serializers.ListField(child=serializers.IntegerField(),
+                                   required=False,
+                                   default=list,
+                                   max_length=100)
+
+    def validate(self, data):
+        if not data['add'] and not data['remove']:
+            raise serializers.ValidationError('Give users to add or remove.')
+        data['add'] = list(dict.fromkeys(data['add']))
+        data['remove'] = list(dict.fromkeys(data['remove']))
+        both = set(data['add']) & set(data['remove'])
+        if both:
+            raise serializers.ValidationError(
+                f'Users both added and removed: {sorted(both)}.')
+
+        user = self.context['request'].user
+        task_ids = set(data['task_ids'])
+        boards = dict(
+            Task.objects.filter(pk__in=task_ids,
+                                board__members=user).values_list(
+                                    'id', 'board_id'))
+        missing = task_ids - boards.keys()
+        if missing:
+            raise serializers.ValidationError(
+                {'task_ids': f'Unknown tasks: {sorted(missing)}.'})
+
+        add = set(data['add'])
+        members = set(
+            Board.members.through.objects.filter(
+                board_id__in=set(boards.values()),
+                customuser_id__in=add).values_list('board_id',
+                                                   'customuser_id'))
+        outsiders = {
+            user_id
+            for board_id in set(boards.values())
+            for user_id in add if (board_id, user_id) not in members
+        }
+        if outsiders:
+            raise serializers.ValidationError({
+                'add':
+                f'Not members of every board of the tasks: '
+                f'{sorted(outsiders)}.'
+            })
+
+        data['boards'] = boards
+        return data
+
+
 class TaskDropdownSerializer(serializers.ModelSerializer):
 
     class Meta:
@@ -73,10 +354,32 @@ class ListWithTasksSerializer(serializers.ModelSerializer):
 
 class BoardSerializer(serializers.ModelSerializer):
     members = UserSerializer(many=True, read_only=True)
+    overdue_task_count = serializers.SerializerMethodField()
 
     class Meta:
         model = Board
-        fields = ['id', 'name', 'members']
+        fields = [
+            'id', 'name', 'members', 'is_template', 'task_count',
+            'completed_task_count', 'overdue_task_count', 'last_activity_at'
+        ]
+        read_only_fields = [
+            'is_template', 'task_count', 'completed_task_count',
+            'last_activity_at'
+        ]
+
+    def get_overdue_task_count(self, obj):
+        # BoardViewSet.list counts the overdue tasks of all boards at once
+        overdue_counts = self.context.get('overdue_counts')
+        if overdue_counts is not None:
+            return overdue_counts.get(obj.id, 0)
+        return Task.objects.for_board(obj).overdue().count()
+
+
+class BoardCloneSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255, required=False)
+    include_tasks = serializers.BooleanField(default=True)
+    include_assignees = serializers.BooleanField(default=False)
+    include_members = serializers.BooleanField(default=False)
 
 
 class BoardDetailSerializer(serializers.ModelSerializer):
@@ -88,9 +391,42 @@ class BoardDetailSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'members', 'lists']
 
 
-class JournalEntrySerializer(serializers.ModelSerializer):
-    shared_with = serializers.PrimaryKeyRelatedField(
-        queryset=CustomUser.objects.all(), many=True)
+class SharedWithField(serializers.ManyRelatedField):
+    """
+    The ``shared_with`` user ids of a journal entry. With sharding they are
+    read from the entry's shard, from ``prefetch_shared_with()`` if it ran.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(child_relation=serializers.PrimaryKeyRelatedField(
+            queryset=CustomUser.objects.all()),
+                         **kwargs)
+
+    def get_attribute(self, instance):
+        if not sharding_enabled() or not isinstance(instance, JournalEntry):
+            return super().get_attribute(instance)
+        ids = getattr(instance, '_shared_with_ids', None)
+        if ids is None:
+            ids = shared_with_ids([instance])[instance.pk]
+        return [PKOnlyObject(pk=user_id) for user_id in ids]
+
+
+def prefetch_shared_with(entries):
+    """Load ``SharedWithField`` for many sharded entries at once."""
+    if not sharding_enabled():
+        return entries
+    entries = list(entries)
+    journal_entries = [
+        entry for entry in entries if isinstance(entry, JournalEntry)
+    ]
+    ids = shared_with_ids(journal_entries)
+    for entry in journal_entries:
+        entry._shared_with_ids = ids[entry.pk]
+    return entries
+
+
+class JournalEntrySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    shared_with = SharedWithField()
     mood_index = serializers.FloatField(read_only=True)
     task = TaskSerializer(read_only=True)
     task_id = serializers.PrimaryKeyRelatedField(queryset=Task.objects.all(),
@@ -152,7 +488,7 @@ class JournalEntrySerializer(serializers.ModelSerializer):
         if 'created_at' not in validated_data:
             validated_data['created_at'] = timezone.now()
         journal_entry = JournalEntry.objects.create(**validated_data)
-        journal_entry.shared_with.set(shared_with)
+        set_shared_with(journal_entry, shared_with)
         return journal_entry
 
     def update(self, instance, validated_data):
@@ -172,10 +508,39 @@ class JournalEntrySerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
 
         if current_visibility == 'shared' and new_visibility != 'shared':
-            instance.shared_with.clear()
+            set_shared_with(instance, [])
 
         if shared_with is not None and new_visibility == 'shared':
-            instance.shared_with.set(shared_with)
+            set_shared_with(instance, shared_with)
 
         instance.save()
         return instance
+
+
+class JobSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Job
+        fields = [
+            'id', 'name', 'status', 'attempts', 'max_attempts', 'progress',
+            'result', 'last_error', 'created_at', 'run_at', 'finished_at'
+        ]
+        read_only_fields = fields
+
+
+class BatchItemSerializer(serializers.Serializer):
+    method = serializers.ChoiceField(
+        choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET')
+    path = serializers.CharField()
+    body = serializers.JSONField(required=False)
+
+
+class BatchSerializer(serializers.Serializer):
+    requests = BatchItemSerializer(many=True, allow_empty=False)
+    parallel = serializers.BooleanField(default=False)
+
+    def validate_requests(self, value):
+        if len(value) > settings.BATCH_MAX_REQUESTS:
+            raise serializers.ValidationError(
+                f'At most {settings.BATCH_MAX_REQUESTS} requests per batch.')
+        return value
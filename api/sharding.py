@@ -0,0 +1,151 @@
+"""
+Journal entries sharded by user over several databases.
+
+With ``JOURNAL_SHARDS`` set to a list of database aliases, every user's
+journal entries and their ``shared_with`` rows live in the shard picked by
+a stable hash of the user id, everything else stays in ``default``. Empty
+(the default) keeps the entries in ``default`` and turns all of this into
+no-ops.
+
+``JournalShardRouter`` routes an entry by its user, and a user's related
+entries (``user.journal_entries``) to the user's shard. Querysets without
+an instance to go by have to pick the database themselves:
+
+- ``user_journal_entries(user)`` for the entries of one user;
+- ``journal_databases()`` to run a query on every shard, e.g. for the
+  public and shared entries of other users.
+
+Joins between the entries and tasks, lists or boards don't work across
+databases, those queries fetch the other side first. Shards are migrated
+with ``manage.py migrate_shards`` and only get the journal tables. Each
+shard numbers its entries from its own range of ``SHARD_ID_SPACING`` ids,
+so entry ids stay unique across the shards and the archive.
+"""
+import zlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+from .models import CustomUser, JournalEntry
+
+SHARDED_MODELS = {JournalEntry, JournalEntry.shared_with.through}
+SHARDED_MODEL_NAMES = {model._meta.model_name for model in SHARDED_MODELS}
+SHARD_ID_SPACING = 10**12
+
+
+def sharding_enabled():
+    return bool(settings.JOURNAL_SHARDS)
+
+
+def journal_databases():
+    """The aliases of all databases holding journal entries."""
+    return list(settings.JOURNAL_SHARDS) or [DEFAULT_DB_ALIAS]
+
+
+def shard_for(user_id):
+    """The database holding the journal entries of ``user_id``."""
+    shards = settings.JOURNAL_SHARDS
+    if not shards:
+        return DEFAULT_DB_ALIAS
+    return shards[zlib.crc32(str(user_id).encode()) % len(shards)]
+
+
+def user_journal_entries(user):
+    user_id = getattr(user, 'pk', user)
+    return JournalEntry.objects.using(shard_for(user_id)).filter(user=user_id)
+
+
+def shared_with_ids(entries):
+    """The ids of the users each entry is shared with, per entry id."""
+    SharedWith = JournalEntry.shared_with.through
+    shared_with = {entry.pk: [] for entry in entries}
+    by_database = {}
+    for entry in entries:
+        by_database.setdefault(entry._state.db, []).append(entry.pk)
+    for database, entry_ids in by_database.items():
+        rows = SharedWith.objects.using(database).filter(
+            journalentry_id__in=entry_ids).order_by(
+                'customuser_id').values_list('journalentry_id',
+                                             'customuser_id')
+        for entry_id, user_id in rows:
+            shared_with[entry_id].append(user_id)
+    return shared_with
+
+
+def set_shared_with(entry, users):
+    """
+    ``entry.shared_with.set(users)`` on the entry's own database. The
+    related manager would look for the users there too.
+    """
+    SharedWith = JournalEntry.shared_with.through
+    rows = SharedWith.objects.using(
+        entry._state.db).filter(journalentry_id=entry.pk)
+    user_ids = {getattr(user, 'pk', user) for user in users}
+    existing = set(rows.values_list('customuser_id', flat=True))
+    rows.exclude(customuser_id__in=user_ids).delete()
+    SharedWith.objects.using(entry._state.db).bulk_create([
+        SharedWith(journalentry_id=entry.pk, customuser_id=user_id)
+        for user_id in sorted(user_ids - existing)
+    ])
+
+
+class JournalShardRouter:
+    """Routes journal entries to their user's shard, the rest to default."""
+
+    def _route(self, model, instance):
+        if not sharding_enabled():
+            return None
+        if model not in SHARDED_MODELS:
+            return DEFAULT_DB_ALIAS
+        if isinstance(instance, JournalEntry) and instance.user_id:
+            return shard_for(instance.user_id)
+        if isinstance(instance, CustomUser) and instance.pk:
+            return shard_for(instance.pk)
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints.get('instance'))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if sharding_enabled() and (type(obj1) in SHARDED_MODELS
+                                   or type(obj2) in SHARDED_MODELS):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.JOURNAL_SHARDS:
+            return app_label == 'api' and model_name in SHARDED_MODEL_NAMES
+        return None
+
+
+@receiver(post_migrate)
+def reserve_shard_ids(sender, using, **kwargs):
+    """Start the entry ids of shard ``i`` at ``(i + 1) * SHARD_ID_SPACING``."""
+    if sender.name != 'api' or using not in settings.JOURNAL_SHARDS:
+        return
+    start = (settings.JOURNAL_SHARDS.index(using) + 1) * SHARD_ID_SPACING
+    connection = connections[using]
+    table = JournalEntry._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT MAX(id) FROM {connection.ops.quote_name(table)}')
+        if (cursor.fetchone()[0] or 0) >= start:
+            return
+        if connection.vendor == 'sqlite':
+            cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s',
+                           [table])
+            cursor.execute(
+                'INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)',
+                [table, start - 1])
+        elif connection.vendor == 'postgresql':
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'), %s, false)",
+                [table, start])
+        elif connection.vendor == 'mysql':
+            cursor.execute(f'ALTER TABLE {connection.ops.quote_name(table)} '
+                           f'AUTO_INCREMENT = {start:d}')
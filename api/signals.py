@@ -2,61 +2,192 @@ import random
 from datetime import timedelta
 from itertools import product
 
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
 from django.dispatch import receiver
 from django.utils import timezone
 
+from .comembers import board_member_ids, get_comembers, invalidate_comembers
+from .counters import (board_counts, list_deleted, remember_counted_state,
+                       task_deleted, task_saved, tasks_changed_board)
+from .insights import mark_stale, record_entry
+from .jobs import enqueue, job_handler
 from .models import Board, CustomUser, JournalEntry, List, Task
+from .sharding import journal_databases, sharding_enabled, user_journal_entries
 
 
 @receiver(post_save, sender=CustomUser)
 def create_user_data(sender, instance, created, **kwargs):
     if created:
-        # Create a board
-        board = Board.objects.create(name=f"{instance.username}'s Board")
-        board.members.add(instance)
-
-        # Create lists
-        lists = ['To Do', 'In Progress', 'Done']
-        created_lists = []
-        for i, list_name in enumerate(lists):
-            created_lists.append(
-                List.objects.create(name=list_name, board=board, position=i))
-
-        # Create tasks for each priority and complexity combination
-        task_titles = [
-            "Implement user authentication", "Design database schema",
-            "Create API endpoints", "Write unit tests",
-            "Set up CI/CD pipeline", "Optimize database queries",
-            "Implement caching mechanism", "Create user dashboard",
-            "Integrate third-party API", "Implement real-time notifications",
-            "Refactor legacy code", "Implement data visualization",
-            "Optimize front-end performance", "Implement search functionality",
-            "Set up monitoring and logging"
-        ]
-
-        priorities = [1, 2, 3]
-        complexities = [1, 2, 3]
-
-        for i, (priority,
-                complexity) in enumerate(product(priorities, complexities)):
-            due_date = timezone.now() + timedelta(days=random.randint(1, 30))
-            task = Task.objects.create(
-                title=task_titles[i % len(task_titles)],
-                description=
-                f"Description for {task_titles[i % len(task_titles)]}",
-                due_date=due_date,
-                priority=priority,
-                complexity=complexity,
-                list=random.choice(created_lists),
-                position=i)
-            task.assigned_to.add(instance)
-
-            # Create journal entries for each task
-            for _ in range(random.randint(2, 5)):
-                create_journal_entry(instance, task)
-
-        print(f"Created initial data for user {instance.username}")
+        enqueue('seed_user_data', user=instance, user_id=instance.pk)
+
+
+@receiver(pre_save, sender=CustomUser)
+def user_pre_save(sender, instance, update_fields=None, **kwargs):
+    instance._saved_username = None
+    if instance._state.adding or (update_fields is not None
+                                  and 'username' not in update_fields):
+        return
+    instance._saved_username = CustomUser.objects.filter(
+        pk=instance.pk).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=CustomUser)
+def user_renamed(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_saved_username', None)
+    if created or raw or previous in (None, instance.username):
+        return
+    # The co-member lists of everyone sharing a board hold the old name
+    board_ids = instance.boards.values_list('id', flat=True)
+    invalidate_comembers(board_member_ids(board_ids) - {instance.pk})
+
+
+@job_handler('seed_user_data')
+@transaction.atomic
+def seed_user_data(job, user_id):
+    instance = CustomUser.objects.get(pk=user_id)
+    # Create a board
+    board = Board.objects.create(name=f"{instance.username}'s Board")
+    board.members.add(instance)
+
+    # Create lists
+    lists = ['To Do', 'In Progress', 'Done']
+    created_lists = []
+    for i, list_name in enumerate(lists):
+        created_lists.append(
+            List.objects.create(name=list_name, board=board, position=i))
+
+    # Create tasks for each priority and complexity combination
+    task_titles = [
+        "Implement user authentication", "Design database schema",
+        "Create API endpoints", "Write unit tests", "Set up CI/CD pipeline",
+        "Optimize database queries", "Implement caching mechanism",
+        "Create user dashboard", "Integrate third-party API",
+        "Implement real-time notifications", "Refactor legacy code",
+        "Implement data visualization", "Optimize front-end performance",
+        "Implement search functionality", "Set up monitoring and logging"
+    ]
+
+    priorities = [1, 2, 3]
+    complexities = [1, 2, 3]
+
+    for i, (priority,
+            complexity) in enumerate(product(priorities, complexities)):
+        due_date = timezone.now() + timedelta(days=random.randint(1, 30))
+        task = Task.objects.create(
+            title=task_titles[i % len(task_titles)],
+            description=f"Description for {task_titles[i % len(task_titles)]}",
+            due_date=due_date,
+            priority=priority,
+            complexity=complexity,
+            list=random.choice(created_lists),
+            position=i)
+        task.assigned_to.add(instance)
+
+        # Create journal entries for each task
+        for _ in range(random.randint(2, 5)):
+            create_journal_entry(instance, task)
+
+    print(f"Created initial data for user {instance.username}")
+
+
+@receiver(m2m_changed, sender=Board.members.through)
+def board_members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        # user.boards.add(...): the user and everyone on those boards
+        board_ids = pk_set if pk_set is not None else set(
+            instance.boards.values_list('id', flat=True))
+        affected = board_member_ids(board_ids) | {instance.pk}
+    else:
+        # board.members.add(...): every member of the board, past and present
+        affected = board_member_ids([instance.pk]) | (pk_set or set())
+    invalidate_comembers(affected)
+
+
+@receiver(pre_delete, sender=Board)
+def board_deleted(sender, instance, **kwargs):
+    invalidate_comembers(board_member_ids([instance.pk]))
+
+
+@receiver(pre_delete, sender=CustomUser)
+def user_deleted(sender, instance, **kwargs):
+    comember_ids = [pk for _, _, pk in get_comembers(instance.pk)]
+    invalidate_comembers(comember_ids + [instance.pk])
+    if sharding_enabled():
+        # The collector only cascades within the default database
+        user_journal_entries(instance).delete()
+        for database in journal_databases():
+            JournalEntry.shared_with.through.objects.using(database).filter(
+                customuser_id=instance.pk).delete()
+
+
+def _deleted_along_with(origin, *models):
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in models
+
+
+@receiver(pre_save, sender=Task)
+def task_pre_save(sender, instance, **kwargs):
+    remember_counted_state(instance)
+
+
+@receiver(post_save, sender=Task)
+def task_post_save(sender, instance, created, **kwargs):
+    task_saved(instance, created)
+    if getattr(instance, '_moved_from_board', None) is not None:
+        move_journal_entries([instance.pk], instance.board_id)
+
+
+@receiver(post_save, sender=List)
+def list_post_save(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    # The list may have moved to another board, its tasks move with it
+    moved = Task.objects.filter(list=instance).exclude(board=instance.board_id)
+    counts = board_counts(moved)
+    if counts:
+        task_ids = list(moved.values_list('id', flat=True))
+        Task.objects.filter(pk__in=task_ids).update(board=instance.board_id)
+        tasks_changed_board(counts, instance.board_id)
+        move_journal_entries(task_ids, instance.board_id)
+
+
+def move_journal_entries(task_ids, board_id):
+    """Point the journal entries of tasks that changed boards to the new one."""
+    for database in journal_databases():
+        JournalEntry.objects.using(database).filter(task__in=task_ids).update(
+            board=board_id)
+
+
+@receiver(post_delete, sender=Task)
+def task_post_delete(sender, instance, origin=None, **kwargs):
+    # The counters of a list or board being deleted don't need updating
+    if not _deleted_along_with(origin, Board, List):
+        task_deleted(instance)
+    if sharding_enabled():
+        for database in journal_databases():
+            JournalEntry.objects.using(database).filter(
+                task=instance.pk).update(task=None, board=None)
+
+
+@receiver(post_delete, sender=List)
+def list_post_delete(sender, instance, origin=None, **kwargs):
+    if not _deleted_along_with(origin, Board):
+        list_deleted(instance)
+
+
+@receiver(post_save, sender=JournalEntry)
+def journal_entry_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        record_entry(instance)
+    else:
+        mark_stale(instance.user_id)
 
 
 def create_journal_entry(user, task):
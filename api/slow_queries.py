@@ -0,0 +1,143 @@
+"""
+Slow-query log.
+
+Every database connection gets an ``execute_wrapper`` that times its
+queries once ``SLOW_QUERY_THRESHOLD_MS`` is set, which it isn't by
+default. Queries slower than that are appended to ``SLOW_QUERY_LOG`` as
+JSON lines with:
+
+- the normalized SQL and its fingerprint;
+- a fingerprint of the parameters;
+- the duration;
+- the view (set by ``api.middleware.QueryContextMiddleware``);
+- the call site in our code;
+- the EXPLAIN output of the database.
+
+``manage.py slow_queries`` aggregates the log by fingerprint.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils import timezone
+
+# "GET api:task-list" while a view runs
+current_view = ContextVar('current_view', default=None)
+# Set while the wrapper runs EXPLAIN, so that query is not logged itself
+_explaining = ContextVar('explaining', default=False)
+
+_write_lock = threading.Lock()
+_PROJECT_DIR = str(Path(__file__).resolve().parent.parent)
+
+_IN_LIST = re.compile(r'\bIN \((?:\s*%s\s*,)*\s*%s\s*\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """
+    SQL with literals and placeholders replaced by ``?`` and IN lists
+    collapsed, so queries differing only in values look the same.
+    """
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def fingerprint(value):
+    return hashlib.sha1(value.encode()).hexdigest()[:16]
+
+
+def call_site():
+    """The innermost frame in our code outside of this module."""
+    for frame in reversed(traceback.extract_stack()[:-1]):
+        if (frame.filename.startswith(_PROJECT_DIR)
+                and frame.filename != __file__):
+            path = frame.filename[len(_PROJECT_DIR) + 1:]
+            return f'{path}:{frame.lineno} in {frame.name}'
+    return None
+
+
+def explain(connection, sql, params):
+    if not sql.lstrip()[:6].upper() == 'SELECT':
+        return None
+    token = _explaining.set(True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}',
+                           params)
+            return [' '.join(map(str, row)) for row in cursor.fetchall()]
+    except Exception as exc:
+        return [f'EXPLAIN failed: {exc}']
+    finally:
+        _explaining.reset(token)
+
+
+def write_entry(entry):
+    line = json.dumps(entry, default=str)
+    with _write_lock:
+        with open(settings.SLOW_QUERY_LOG, 'a') as log:
+            log.write(line + '\n')
+
+
+class SlowQueryLogger:
+    """``execute_wrapper`` logging queries slower than the threshold."""
+
+    def __init__(self, connection, threshold_ms):
+        self.connection = connection
+        self.threshold_ms = threshold_ms
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= self.threshold_ms and not _explaining.get():
+            normalized = normalize_sql(sql)
+            write_entry({
+                'logged_at':
+                timezone.now().isoformat(),
+                'alias':
+                self.connection.alias,
+                'fingerprint':
+                fingerprint(normalized),
+                'sql':
+                normalized,
+                'params_fingerprint':
+                fingerprint(repr(params)),
+                'many':
+                many,
+                'duration_ms':
+                round(duration_ms, 3),
+                'view':
+                current_view.get(),
+                'call_site':
+                call_site(),
+                'plan':
+                None if many else explain(self.connection, sql, params),
+            })
+        return result
+
+
+@receiver(connection_created)
+def install_slow_query_logger(sender, connection, **kwargs):
+    threshold_ms = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold_ms is None:
+        return
+    if not any(
+            isinstance(wrapper, SlowQueryLogger)
+            for wrapper in connection.execute_wrappers):
+        # First, so the pop() of connection.execute_wrapper() blocks that
+        # are active while the connection opens doesn't remove it.
+        connection.execute_wrappers.insert(
+            0, SlowQueryLogger(connection, threshold_ms))
@@ -1 +1,1531 @@
+import asyncio
+import copy
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import (LiveServerTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .archive import archive_journal_entries
+from .coalescing import SingleFlight, analytics
+from .comembers import search_comembers
+from .counters import repair_counters
+from .deletion import purge_board, purge_user
+from .events import Broker, broker, stream_events
+from .fastpath import serialize_journal_entries, serialize_tasks
+from .insights import compute_cells, describe, get_insight
+from .jobs import (check_jobs_worker, claim_next_job, enqueue, job_handler,
+                   requeue_stale_jobs, run_job)
+from .loadtest import Recorder, compare as loadtest_compare, run_scenario
+from .maintenance import (KEY_QUERIES, compare as compare_reports,
+                          health_report, maintain)
+from .models import (ArchivedJournalEntry, Board, CustomUser, Job,
+                     JournalEntry, List, MoodInsight, Task)
+from .profiling import list_profiles
+from .renderers import (ColumnarJSONRenderer, FastJSONRenderer,
+                        MessagePackRenderer, msgpack)
+from .slow_queries import SlowQueryLogger, fingerprint, normalize_sql
+from .serializers import (JournalEntrySerializer, TaskSerializer,
+                          optimize_queryset)
+from .sharding import (SHARD_ID_SPACING, JournalShardRouter, journal_databases,
+                       set_shared_with, shard_for, shared_with_ids,
+                       sharding_enabled, user_journal_entries)
+
+
+def all_journal_entries():
+    """A queryset of the journal entries per database holding them."""
+    return [
+        JournalEntry.objects.using(database)
+        for database in journal_databases()
+    ]
+
+
+class JournalTestCase(TestCase):
+    """
+    For tests reaching journal entries, which live in the shard databases
+    when run with JOURNAL_SHARDS set.
+    """
+    databases = '__all__'
+
+
+class FastPathParityTests(JournalTestCase):
+    """The fast path in api/fastpath.py must render exactly like DRF."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Creating the users seeds a board with tasks and journal entries.
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.other = CustomUser.objects.create_user('bob', 'password')
+
+        task = Task.objects.filter(assigned_to=cls.user).first()
+        task.assigned_to.add(cls.other)
+        Task.objects.create(title='Unassigned',
+                            list=task.list,
+                            priority=3,
+                            complexity=2,
+                            completed=True)
+
+        shared = user_journal_entries(cls.user).first()
+        shared.visibility = 'shared'
+        shared.save()
+        set_shared_with(shared, [cls.other])
+        JournalEntry.objects.create(user=cls.user, title='No task or mood')
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_tasks_match_task_serializer(self):
+        queryset = optimize_queryset(Task.objects.all(), TaskSerializer())
+        serializer = TaskSerializer(queryset, many=True)
+        self.assertEqual(self.render(serialize_tasks(queryset)),
+                         self.render(serializer.data))
+
+    def test_journal_entries_match_journal_entry_serializer(self):
+        queryset = optimize_queryset(user_journal_entries(self.user),
+                                     JournalEntrySerializer())
+        serializer = JournalEntrySerializer(queryset, many=True)
+        self.assertEqual(self.render(serialize_journal_entries(queryset)),
+                         self.render(serializer.data))
+
+    def test_endpoints_match_serializer_path(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        task = Task.objects.filter(assigned_to=self.other).first()
+        entry = user_journal_entries(
+            self.user).filter(shared_with=self.other).first()
+        urls = [
+            '/api/tasks/',
+            '/api/tasks/?ordering=-due_date',
+            f'/api/tasks/{task.pk}/',
+            '/api/journal-entries/',
+            f'/api/journal-entries/{entry.pk}/',
+        ]
+        for url in urls:
+            separator = '&' if '?' in url else '?'
+            with self.subTest(url=url):
+                fast = client.get(url)
+                # Any ?fields= parameter goes through the DRF serializers.
+                slow = client.get(f'{url}{separator}fields=')
+                self.assertEqual(fast.status_code, 200)
+                self.assertEqual(fast.content, slow.content)
+
+
+class FastJSONRendererTests(TestCase):
+
+    def test_matches_json_renderer(self):
+        data = {
+            'when': timezone.now(),
+            'text': 'caf\u00e9 \u2028',
+            'big': 2**70,
+            'nested': [{
+                1: 0.1
+            }, None, True],
+        }
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+
+
+class SeriesRendererTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.task = Task.objects.filter(assigned_to=cls.user).first()
+        user_journal_entries(cls.user).update(task=cls.task)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def urls(self):
+        return [
+            '/api/journal-entries/mood-statistics/',
+            '/api/journal-entries/heatmap-data/',
+            f'/api/journal-entries/{self.task.pk}/task-mood-statistics/',
+            f'/api/journal-entries/{self.task.pk}/task-mood-history/',
+            f'/api/journal-entries/{self.task.board_id}/project-overview/',
+        ]
+
+    def rows(self, columns):
+        return [
+            dict(zip(columns, values)) for values in zip(*columns.values())
+        ]
+
+    def test_columnar_json_has_the_rows_of_json(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                rows = self.client.get(url).json()
+                self.assertTrue(rows)
+                for response in (
+                        self.client.get(f'{url}?format=columnar'),
+                        self.client.get(
+                            url, HTTP_ACCEPT=ColumnarJSONRenderer.media_type)):
+                    self.assertEqual(response['Content-Type'],
+                                     ColumnarJSONRenderer.media_type)
+                    self.assertIn('Accept', response['Vary'])
+                    self.assertEqual(self.rows(response.json()), rows)
+
+    @skipUnless(msgpack, 'msgpack is not installed')
+    def test_msgpack_has_the_columns_of_columnar_json(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                columns = self.client.get(f'{url}?format=columnar').json()
+                for response in (
+                        self.client.get(f'{url}?format=msgpack'),
+                        self.client.get(
+                            url, HTTP_ACCEPT=MessagePackRenderer.media_type)):
+                    self.assertEqual(response['Content-Type'],
+                                     MessagePackRenderer.media_type)
+                    self.assertEqual(msgpack.unpackb(response.content),
+                                     columns)
+
+    def test_only_on_the_analytics_actions(self):
+        self.assertEqual(
+            self.client.get('/api/tasks/?format=columnar').status_code, 404)
+        self.assertEqual(
+            self.client.get('/api/tasks/',
+                            HTTP_ACCEPT='application/msgpack').status_code,
+            406)
+        # Anything but a list of rows renders as it is
+        response = self.client.get(
+            '/api/journal-entries/0/task-mood-statistics/?format=columnar')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'error': 'Task not found.'})
+        self.assertEqual(ColumnarJSONRenderer().render([]), b'{}')
+
+
+class AdminQueryCountTests(JournalTestCase):
+    """Admin pages must not run more queries as the tables grow."""
+    # Session, user, permissions, the page's own queries and a few spare
+    MAX_QUERIES = 15
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin', 'password')
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.task = Task.objects.filter(assigned_to=cls.user).first()
+        entries = user_journal_entries(cls.user)
+        cls.entry = entries.first()
+        set_shared_with(cls.entry, [cls.admin])
+        entries.filter(pk__in=list(
+            entries.exclude(
+                pk=cls.entry.pk).values_list('pk', flat=True)[:3])).update(
+                    created_at=timezone.now() - timedelta(days=365))
+        archive_journal_entries()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelists(self):
+        models = ['customuser', 'board', 'list', 'task', 'journalentry']
+        if sharding_enabled():
+            models.remove('journalentry')
+        return [
+            reverse(f'admin:api_{model}_changelist')
+            for model in models + ['archivedjournalentry', 'job']
+        ]
+
+    def change_pages(self):
+        board = Board.objects.filter(members=self.user).first()
+        pages = [
+            reverse('admin:api_customuser_change', args=[self.user.pk]),
+            reverse('admin:api_board_change', args=[board.pk]),
+            reverse('admin:api_list_change',
+                    args=[List.objects.filter(board=board).first().pk]),
+            reverse('admin:api_task_change', args=[self.task.pk]),
+        ]
+        if not sharding_enabled():
+            pages.append(
+                reverse('admin:api_journalentry_change', args=[self.entry.pk]))
+        return pages
+
+    def query_count(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_counts_do_not_grow_with_the_tables(self):
+        before = {
+            url: self.query_count(url)[0]
+            for url in self.changelists() + self.change_pages()
+        }
+
+        # Each user comes with a board, lists, tasks and journal entries
+        for index in range(5):
+            bystander = CustomUser.objects.create_user(f'bystander{index}',
+                                                       'password')
+            self.task.assigned_to.add(bystander)
+
+        for url, count in before.items():
+            with self.subTest(url=url):
+                after, response = self.query_count(url)
+                self.assertEqual(after, count)
+                self.assertLessEqual(after, self.MAX_QUERIES)
+
+    def test_change_forms_do_not_list_every_user(self):
+        CustomUser.objects.create_user('bystander', 'password')
+        for url in self.change_pages():
+            with self.subTest(url=url):
+                _, response = self.query_count(url)
+                self.assertNotContains(response, 'bystander')
+
+    @override_settings(JOURNAL_SHARDS=['journal_0', 'journal_1'])
+    def test_journal_entry_admin_is_off_with_sharding(self):
+        changelist = reverse('admin:api_journalentry_changelist')
+        self.assertNotContains(self.client.get(reverse('admin:index')),
+                               changelist)
+        change = reverse('admin:api_journalentry_change', args=[self.entry.pk])
+        for url in (changelist, change):
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+
+class TaskSearchTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        task = Task.objects.filter(assigned_to=cls.user).first()
+        for title in ('Zephyr report', 'zephyr tests', 'Old zephyr docs'):
+            Task.objects.create(title=title,
+                                list=task.list).assigned_to.add(cls.user)
+
+    def search(self, **params):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/journal-entries/available-tasks/search/',
+                              params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(task['title'] for task in response.data)
+
+    def test_prefix_match_ignores_case(self):
+        self.assertEqual(self.search(q='ZEPH'),
+                         ['Zephyr report', 'zephyr tests'])
+
+    def test_contains_match(self):
+        self.assertEqual(self.search(q='zeph', match='contains'),
+                         ['Old zephyr docs', 'Zephyr report', 'zephyr tests'])
+
+
+class CoMemberTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user('alice', 'password')
+        cls.bob = CustomUser.objects.create_user('bob', 'password')
+        cls.board = Board.objects.create(name='Shared')
+        cls.board.members.add(cls.alice)
+
+    def setUp(self):
+        cache.clear()
+
+    def comembers(self, user):
+        return [user['username'] for user in search_comembers(user.pk)]
+
+    def change(self, change):
+        # Warm both caches, then drop them the way a request's commit would
+        self.comembers(self.alice), self.comembers(self.bob)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+
+    def test_adding_and_removing_members(self):
+        self.change(lambda: self.board.members.add(self.bob))
+        self.assertEqual(self.comembers(self.alice), ['bob'])
+        self.assertEqual(self.comembers(self.bob), ['alice'])
+
+        self.change(lambda: self.board.members.remove(self.bob))
+        self.assertEqual(self.comembers(self.alice), [])
+        self.assertEqual(self.comembers(self.bob), [])
+
+        self.change(lambda: self.bob.boards.add(self.board))
+        self.assertEqual(self.comembers(self.alice), ['bob'])
+        self.change(lambda: self.bob.boards.remove(self.board))
+        self.assertEqual(self.comembers(self.alice), [])
+
+    def test_clearing_members(self):
+        self.board.members.add(self.bob)
+        self.change(self.board.members.clear)
+        self.assertEqual(self.comembers(self.alice), [])
+        self.assertEqual(self.comembers(self.bob), [])
+
+    def test_deleting_the_board(self):
+        self.board.members.add(self.bob)
+        self.change(self.board.delete)
+        self.assertEqual(self.comembers(self.alice), [])
+        self.assertEqual(self.comembers(self.bob), [])
+
+    def test_renaming_a_member(self):
+        self.board.members.add(self.bob)
+
+        def rename():
+            self.bob.username = 'robert'
+            self.bob.save()
+
+        self.change(rename)
+        self.assertEqual(self.comembers(self.alice), ['robert'])
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.get(
+            '/api/journal-entries/shareable-users/?search=ROB')
+        self.assertEqual(response.data, [{
+            'id': self.bob.pk,
+            'username': 'robert'
+        }])
+
+
+@job_handler('test_flaky')
+def flaky_job(job, fail=True):
+    if fail:
+        raise RuntimeError('flaky')
+    return {'attempts': job.attempts}
+
+
+@override_settings(JOBS_EAGER=False, JOBS_RETRY_BACKOFF=10)
+class JobTests(TestCase):
+
+    def test_failed_jobs_are_retried_with_backoff(self):
+        job = enqueue('test_flaky', max_attempts=2)
+        run_job(claim_next_job('worker'))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=9))
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        run_job(claim_next_job('worker'))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertIn('flaky', job.last_error)
+
+    @override_settings(JOBS_EAGER=True)
+    def test_failed_eager_jobs_are_not_left_queued(self):
+        job = enqueue('test_flaky')
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 1))
+
+    def test_requeued_job_does_not_record_the_stale_run(self):
+        job = enqueue('test_flaky', fail=False)
+        stale = claim_next_job('worker-1')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() -
+                                             timedelta(days=1))
+        self.assertEqual(requeue_stale_jobs(), 1)
+        current = claim_next_job('worker-2')
+
+        run_job(stale)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by),
+                         (Job.RUNNING, 'worker-2'))
+        run_job(current)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.result), (Job.SUCCEEDED, {
+            'attempts': 2
+        }))
+
+    def test_deploy_check_asks_for_a_worker(self):
+        self.assertEqual([warning.id for warning in check_jobs_worker(None)],
+                         ['api.W001'])
+        with override_settings(JOBS_EAGER=True):
+            self.assertEqual(check_jobs_worker(None), [])
+
+    def test_progress_keeps_the_job_claimed(self):
+        enqueue('test_flaky', fail=False)
+        job = claim_next_job('worker')
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() -
+                                             timedelta(days=1))
+        job.set_progress(step=1)
+        self.assertEqual(requeue_stale_jobs(), 0)
+
+
+class CounterTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.board = Board.objects.filter(members=cls.user).first()
+        cls.other_board = Board.objects.create(name='Other')
+        cls.other_list = List.objects.create(name='Inbox',
+                                             board=cls.other_board)
+
+    def assertCountersCorrect(self):
+        for board in Board.objects.all():
+            tasks = Task.objects.filter(list__board=board)
+            self.assertEqual(
+                (board.task_count, board.completed_task_count),
+                (tasks.count(), tasks.filter(completed=True).count()),
+                board.name)
+        for list_obj in List.objects.all():
+            tasks = Task.objects.filter(list=list_obj)
+            self.assertEqual(
+                (list_obj.task_count, list_obj.completed_task_count),
+                (tasks.count(), tasks.filter(completed=True).count()))
+
+    def test_task_changes(self):
+        task = Task.objects.filter(board=self.board).first()
+        task.completed = True
+        task.save()
+        task.list = self.other_list
+        task.save()
+        Task.objects.create(title='New', list=self.other_list)
+        task.delete()
+        self.assertCountersCorrect()
+
+    def test_list_moving_to_another_board(self):
+        Task.objects.filter(board=self.board).first().complete()
+        list_obj = List.objects.filter(board=self.board).first()
+        list_obj.board = self.other_board
+        list_obj.save()
+        self.assertEqual(
+            set(
+                Task.objects.filter(list=list_obj).values_list('board',
+                                                               flat=True)),
+            {self.other_board.pk})
+        self.assertCountersCorrect()
+
+    def test_repair_counters(self):
+        Board.objects.update(task_count=0, last_activity_at=None)
+        List.objects.update(completed_task_count=7)
+        task = Task.objects.filter(board=self.board).first()
+        Task.objects.filter(pk=task.pk).update(board=self.other_board)
+        for entries in all_journal_entries():
+            entries.filter(task=task).update(board=None)
+
+        fixed = repair_counters()
+        self.assertEqual(fixed['Task.board'], 1)
+        self.assertGreater(fixed['JournalEntry.board'], 0)
+        self.assertCountersCorrect()
+        task_boards = dict(Task.objects.values_list('id', 'board'))
+        for entries in all_journal_entries():
+            for task_id, board_id in entries.filter(
+                    task__isnull=False).values_list('task', 'board'):
+                self.assertEqual(board_id, task_boards[task_id])
+        latest = user_journal_entries(
+            self.user).filter(board=self.board).latest('created_at').created_at
+        self.board.refresh_from_db()
+        self.assertGreaterEqual(self.board.last_activity_at, latest)
+        self.assertEqual(repair_counters()['Board'], 0)
+
+
+class TaskBulkCreateTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.other = CustomUser.objects.create_user('bob', 'password')
+        cls.board = Board.objects.filter(members=cls.user).first()
+        cls.first, cls.second = List.objects.filter(board=cls.board)[:2]
+
+    def create(self, tasks):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.post('/api/tasks/bulk/', {'tasks': tasks}, format='json')
+
+    def last_position(self, list_obj):
+        return max(Task.objects.filter(list=list_obj).values_list('position',
+                                                                  flat=True),
+                   default=-1)
+
+    def test_positions_and_counters_per_list(self):
+        first_end = self.last_position(self.first)
+        second_end = self.last_position(self.second)
+        response = self.create([
+            {
+                'title': 'A1',
+                'list': self.first.pk
+            },
+            {
+                'title': 'B1',
+                'list': self.second.pk,
+                'completed': True
+            },
+            {
+                'title': 'A2',
+                'list': self.first.pk,
+                'completed': True
+            },
+            {
+                'title': 'A3',
+                'list': self.first.pk
+            },
+        ])
+        self.assertEqual(response.status_code, 201)
+        positions = {
+            task['title']: (task['list'], task['position'])
+            for task in response.data
+        }
+        self.assertEqual(
+            positions, {
+                'A1': (self.first.pk, first_end + 1),
+                'B1': (self.second.pk, second_end + 1),
+                'A2': (self.first.pk, first_end + 2),
+                'A3': (self.first.pk, first_end + 3),
+            })
+
+        # The setUpTestData objects still hold the counters from before
+        for before, delta in ((self.first, (3, 1)), (self.second, (1, 1)),
+                              (self.board, (4, 2))):
+            after = type(before).objects.get(pk=before.pk)
+            with self.subTest(counters=after):
+                self.assertEqual(
+                    (after.task_count - before.task_count,
+                     after.completed_task_count - before.completed_task_count),
+                    delta)
+        self.assertGreater(
+            Board.objects.get(pk=self.board.pk).last_activity_at,
+            timezone.now() - timedelta(minutes=1))
+
+    def test_lists_of_other_boards_are_rejected(self):
+        foreign = List.objects.filter(board__members=self.other).first()
+        count = Task.objects.count()
+        response = self.create([{
+            'title': 'Mine',
+            'list': self.first.pk
+        }, {
+            'title': 'Theirs',
+            'list': foreign.pk
+        }])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(str(foreign.pk), str(response.data))
+        self.assertEqual(Task.objects.count(), count)
+
+    def test_assignees_are_deduplicated(self):
+        response = self.create([{
+            'title':
+            'Shared',
+            'list':
+            self.first.pk,
+            'assigned_to_ids': [self.other.pk, self.user.pk, self.other.pk]
+        }])
+        self.assertEqual(response.status_code, 201)
+        task = Task.objects.get(pk=response.data[0]['id'])
+        self.assertEqual(sorted(task.assigned_to.values_list('id', flat=True)),
+                         sorted([self.user.pk, self.other.pk]))
+        self.assertEqual(
+            [user['id'] for user in response.data[0]['assigned_to']],
+            sorted([self.user.pk, self.other.pk]))
+
+
+class TaskBulkAssignTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user('alice', 'password')
+        cls.bob = CustomUser.objects.create_user('bob', 'password')
+        cls.carol = CustomUser.objects.create_user('carol', 'password')
+        cls.alice_board = Board.objects.filter(members=cls.alice).get()
+        cls.bob_board = Board.objects.filter(members=cls.bob).get()
+        cls.alice_board.members.add(cls.bob)
+        cls.bob_board.members.add(cls.alice)
+        cls.alice_task = Task.objects.filter(board=cls.alice_board).first()
+        # Bob is already assigned to the tasks of his own board
+        cls.bob_task = Task.objects.filter(board=cls.bob_board).first()
+
+    def assign(self, **data):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        return client.post('/api/tasks/bulk-assign/', {
+            'task_ids': [self.alice_task.pk, self.bob_task.pk],
+            **data
+        },
+                           format='json')
+
+    def assignees(self, task):
+        return sorted(task.assigned_to.values_list('username', flat=True))
+
+    def test_add_and_remove(self):
+        counters = list(
+            Board.objects.values_list('task_count', 'completed_task_count'))
+        with mock.patch.object(broker, 'publish') as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.assign(add=[self.bob.pk, self.bob.pk])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['added'], response.data['removed']),
+                         (1, 0))
+        self.assertEqual(self.assignees(self.alice_task), ['alice', 'bob'])
+        self.assertEqual(self.assignees(self.bob_task), ['bob'])
+        self.assertCountEqual(publish.call_args_list, [
+            mock.call(board.pk, 'tasks.assigned', {
+                'tasks': [task.pk],
+                'added': [self.bob.pk],
+                'removed': []
+            }) for board, task in ((self.alice_board, self.alice_task),
+                                   (self.bob_board, self.bob_task))
+        ])
+
+        response = self.assign(remove=[self.bob.pk])
+        self.assertEqual((response.data['added'], response.data['removed']),
+                         (0, 2))
+        self.assertEqual([[user['username'] for user in task['assigned_to']]
+                          for task in response.data['tasks']], [['alice'], []])
+        self.assertEqual(
+            list(
+                Board.objects.values_list('task_count',
+                                          'completed_task_count')), counters)
+
+    def test_invalid_requests_change_nothing(self):
+        outsider_task = Task.objects.filter(assigned_to=self.carol).first()
+        requests = [
+            ({
+                'add': [self.carol.pk]
+            }, 'add'),
+            ({
+                'add': [self.bob.pk],
+                'remove': [self.bob.pk]
+            }, 'non_field_errors'),
+            ({}, 'non_field_errors'),
+            ({
+                'task_ids': [self.alice_task.pk, outsider_task.pk],
+                'add': [self.bob.pk]
+            }, 'task_ids'),
+        ]
+        assignments = Task.assigned_to.through.objects.count()
+        for data, field in requests:
+            with self.subTest(data=data):
+                response = self.assign(**data)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(field, response.data)
+        self.assertEqual(Task.assigned_to.through.objects.count(), assignments)
+
+
+class PurgeTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create_user('alice', 'password')
+        cls.bob = CustomUser.objects.create_user('bob', 'password')
+        cls.board = Board.objects.filter(members=cls.alice).first()
+        cls.board.members.add(cls.bob)
+        cls.task_ids = list(
+            Task.objects.filter(board=cls.board).values_list('id', flat=True))
+        Task.objects.get(pk=cls.task_ids[0]).assigned_to.add(cls.bob)
+        cls.bob_board = Board.objects.filter(members=cls.bob).exclude(
+            pk=cls.board.pk).get()
+        cls.bob_tasks = Task.objects.filter(board=cls.bob_board).count()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_purge_board(self):
+        entries = user_journal_entries(self.alice).count()
+        get_insight(self.alice)
+        self.assertEqual(search_comembers(self.alice.pk), [{
+            'id': self.bob.pk,
+            'username': 'bob'
+        }])
+        progress = []
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted = purge_board(self.board.pk,
+                                  batch_size=2,
+                                  progress=progress.append)
+
+        self.assertEqual(deleted['api.Task'], len(self.task_ids))
+        self.assertEqual(deleted['api.List'], 3)
+        self.assertEqual(deleted['api.Board'], 1)
+        self.assertEqual(progress[-1], deleted)
+        self.assertGreater(len(progress), len(self.task_ids) // 2)
+        self.assertFalse(Board.objects.filter(pk=self.board.pk).exists())
+        self.assertFalse(List.objects.filter(board=self.board.pk).exists())
+        self.assertFalse(
+            Task.assigned_to.through.objects.filter(
+                task_id__in=self.task_ids).exists())
+        # The entries stay, without their task
+        alice_entries = user_journal_entries(self.alice)
+        self.assertEqual(alice_entries.count(), entries)
+        self.assertFalse(alice_entries.filter(task__isnull=False).exists())
+        self.assertTrue(MoodInsight.objects.get(user=self.alice).stale)
+        self.assertEqual(search_comembers(self.alice.pk), [])
+
+        # Bob's own board is untouched
+        self.assertEqual(
+            Task.objects.filter(board=self.bob_board).count(), self.bob_tasks)
+        self.assertFalse(
+            user_journal_entries(self.bob).filter(task__isnull=True).exists())
+
+    def test_purge_user(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            deleted = purge_user(self.bob.pk, batch_size=2)
+        self.assertGreater(deleted['api.JournalEntry'], 0)
+        self.assertEqual(deleted['api.CustomUser'], 1)
+        self.assertFalse(CustomUser.objects.filter(pk=self.bob.pk).exists())
+        self.assertFalse(user_journal_entries(self.bob).exists())
+        self.assertFalse(
+            Task.assigned_to.through.objects.filter(
+                customuser_id=self.bob.pk).exists())
+        # Boards are kept for their other members
+        self.assertEqual(
+            Task.objects.filter(board=self.bob_board).count(), self.bob_tasks)
+        self.assertEqual(list(self.board.members.all()), [self.alice])
+        self.assertTrue(user_journal_entries(self.alice).exists())
+        self.assertEqual(search_comembers(self.alice.pk), [])
+
+    @override_settings(JOBS_EAGER=False)
+    def test_background_board_deletion(self):
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        response = client.delete(f'/api/boards/{self.board.pk}/?async=true')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Location'],
+                         f'/api/jobs/{response.data["id"]}/')
+        # Hidden right away, deleted by the job
+        self.assertEqual(
+            client.get(f'/api/boards/{self.board.pk}/').status_code, 404)
+        self.assertTrue(Board.objects.filter(pk=self.board.pk).exists())
+
+        run_job(claim_next_job('worker'))
+        job = client.get(response['Location']).data
+        self.assertEqual(job['status'], Job.SUCCEEDED)
+        self.assertEqual(job['result']['api.Task'], len(self.task_ids))
+        self.assertFalse(Board.objects.filter(pk=self.board.pk).exists())
+
+
+class BatchTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.board = Board.objects.filter(members=cls.user).first()
+
+    def batch(self, requests):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/batch/', {'requests': requests},
+                               format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['responses']
+
+    def test_requests_run_in_order(self):
+        list_obj = List.objects.filter(board=self.board).first()
+        responses = self.batch([
+            {
+                'method': 'POST',
+                'path': '/api/tasks/',
+                'body': {
+                    'title': 'Batched',
+                    'list': list_obj.pk,
+                    'assigned_to_ids': [self.user.pk]
+                }
+            },
+            {
+                'method': 'GET',
+                'path': f'/api/tasks/?list={list_obj.pk}'
+            },
+            {
+                'method': 'GET',
+                'path': '/api/nothing-here/'
+            },
+        ])
+        self.assertEqual([response['status'] for response in responses],
+                         [201, 200, 404])
+        self.assertIn(responses[0]['body']['id'],
+                      [task['id'] for task in responses[1]['body']])
+
+    def test_streaming_endpoints_fail_alone(self):
+        responses = self.batch([
+            {
+                'method': 'GET',
+                'path': f'/api/boards/{self.board.pk}/events/'
+            },
+            {
+                'method': 'GET',
+                'path': f'/api/boards/{self.board.pk}/'
+            },
+        ])
+        self.assertEqual([response['status'] for response in responses],
+                         [400, 200])
+
+
+class BrokerTests(TestCase):
+
+    async def test_subscribers_get_their_boards_events(self):
+        broker = Broker()
+        subscription = broker.subscribe(1)
+        other = broker.subscribe(2)
+        self.assertEqual(broker.publish(1, 'task.created', {'task': 5}), 1)
+        event = await asyncio.wait_for(subscription.queue.get(), 1)
+        self.assertEqual(event[1:], ('task.created', {'task': 5}))
+        self.assertTrue(other.queue.empty())
+
+        broker.unsubscribe(subscription)
+        self.assertEqual(broker.publish(1, 'task.created', {}), 0)
+        self.assertEqual(broker.connection_count(), 1)
+
+    async def test_slow_subscribers_overflow(self):
+        broker = Broker(queue_size=1)
+        subscription = broker.subscribe(1)
+        broker.publish(1, 'task.created', {})
+        broker.publish(1, 'task.updated', {})
+        # Let the loop run the puts scheduled by publish()
+        await asyncio.sleep(0)
+        self.assertTrue(subscription.overflowed)
+        self.assertEqual(subscription.queue.qsize(), 1)
+
+    async def test_stream(self):
+        events = stream_events(7, heartbeat=0.01)
+        self.assertEqual(await anext(events), 'retry: 3000\n\n')
+        self.assertEqual(await anext(events), ': keepalive\n\n')
+        self.assertEqual(broker.publish(7, 'task.deleted', {'task': 3}), 1)
+        self.assertRegex(
+            await anext(events),
+            r'^id: \d+\nevent: task.deleted\ndata: {"task": 3}\n\n$')
+        await events.aclose()
+        self.assertEqual(broker.publish(7, 'task.deleted', {}), 0)
+
+
+class BoardEventsTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.other = CustomUser.objects.create_user('bob', 'password')
+        cls.board = Board.objects.filter(members=cls.user).first()
+
+    def url(self, user=None, token=None):
+        if user is not None:
+            token = str(AccessToken.for_user(user))
+        return f'/api/boards/{self.board.pk}/events/?token={token}'
+
+    async def test_tokens_and_membership_are_checked(self):
+        for url, status in ((f'/api/boards/{self.board.pk}/events/',
+                             401), (self.url(token='not-a-token'), 401),
+                            (self.url(self.other), 404)):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, status)
+
+    async def test_members_get_the_stream(self):
+        response = await self.async_client.get(self.url(self.user))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        self.assertEqual(await anext(content), b'retry: 3000\n\n')
+        await content.aclose()
+
+
+class TemplateTaskTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.board = Board.objects.filter(members=cls.user).first()
+        Task.objects.filter(board=cls.board).update(completed=False,
+                                                    due_date=timezone.now() -
+                                                    timedelta(days=1))
+
+    def test_template_tasks_are_not_due(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        before = {
+            scope: client.get(f'/api/tasks/overdue/?scope={scope}').data
+            for scope in ('assigned', 'boards')
+        }
+        dashboard = client.get('/api/dashboard/dashboard/').data
+
+        response = client.post(
+            f'/api/boards/{self.board.pk}/save-as-template/',
+            {'include_assignees': True},
+            format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(
+            Task.objects.filter(board=response.data['id'],
+                                assigned_to=self.user).exists())
+
+        for scope, tasks in before.items():
+            with self.subTest(scope=scope):
+                self.assertEqual(
+                    client.get(f'/api/tasks/overdue/?scope={scope}').data,
+                    tasks)
+        self.assertEqual(
+            client.get('/api/dashboard/dashboard/').data, dashboard)
+
+    def test_template_tasks_cannot_be_linked(self):
+        template = Board.objects.create(name='Template', is_template=True)
+        Task.objects.create(title='Template task',
+                            list=List.objects.create(
+                                name='To Do',
+                                board=template)).assigned_to.add(self.user)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for url in ('/api/journal-entries/available-tasks/',
+                    '/api/journal-entries/available-tasks/search/?q=temp'
+                    '&limit=50'):
+            with self.subTest(url=url):
+                titles = [task['title'] for task in client.get(url).data]
+                self.assertNotIn('Template task', titles)
+        titles = [
+            task['title'] for task in client.get(
+                '/api/journal-entries/available-tasks/').data
+        ]
+        self.assertEqual(len(titles),
+                         Task.objects.filter(board=self.board).count())
+
+
+@override_settings(ANALYTICS_COALESCE_TTL=0)
+class ArchiveReadTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.task = Task.objects.filter(assigned_to=cls.user).first()
+        entries = user_journal_entries(cls.user)
+        cls.entries = list(entries.values_list('pk', flat=True))
+        entries.update(created_at=timezone.now() - timedelta(hours=1))
+        entries.filter(pk__in=cls.entries[:4]).update(
+            created_at=timezone.now() - timedelta(days=3), task=cls.task)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def reads(self):
+        start = (timezone.now() - timedelta(days=5)).date().isoformat()
+        urls = [
+            '/api/journal-entries/mood-statistics/',
+            f'/api/journal-entries/{self.task.pk}/task-mood-statistics/'
+            f'?start_date={start}',
+            f'/api/journal-entries/{self.task.board_id}/project-overview/'
+            f'?start_date={start}',
+        ]
+        return {url: self.client.get(url).json() for url in urls}
+
+    def assertSameSeries(self, first, second):
+        self.assertEqual(first.keys(), second.keys())
+        for url, rows in first.items():
+            with self.subTest(url=url):
+                self.assertEqual(len(rows), len(second[url]))
+                for row, other in zip(rows, second[url]):
+                    self.assertEqual(row.keys(), other.keys())
+                    for key, value in row.items():
+                        if isinstance(value, float):
+                            self.assertAlmostEqual(value, other[key])
+                        else:
+                            self.assertEqual(value, other[key])
+
+    def test_reads_include_entries_archived_with_days(self):
+        before = self.reads()
+        call_command('archive_journal_entries',
+                     '--days',
+                     '2',
+                     stdout=StringIO())
+        self.assertEqual(ArchivedJournalEntry.objects.count(), 4)
+        self.assertSameSeries(self.reads(), before)
+
+        for url in (f'/api/journal-entries/{self.entries[0]}/',
+                    f'/api/journal-entries/{self.entries[0]}/?fields=id'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['id'], self.entries[0])
+
+
+class ShardRoutingTests(TestCase):
+
+    @override_settings(JOURNAL_SHARDS=['journal_0', 'journal_1'])
+    def test_entries_follow_their_user(self):
+        self.assertEqual({shard_for(user_id)
+                          for user_id in range(1, 50)},
+                         {'journal_0', 'journal_1'})
+        router = JournalShardRouter()
+        user = CustomUser(pk=7)
+        for hints in ({
+                'instance': JournalEntry(user_id=7)
+        }, {
+                'instance': user
+        }):
+            self.assertEqual(router.db_for_write(JournalEntry, **hints),
+                             shard_for(7))
+        self.assertEqual(router.db_for_read(Task), 'default')
+        self.assertTrue(
+            router.allow_migrate('journal_0', 'api', 'journalentry'))
+        self.assertFalse(router.allow_migrate('journal_0', 'api', 'task'))
+
+    @override_settings(JOURNAL_SHARDS=[])
+    def test_unsharded(self):
+        self.assertEqual(shard_for(7), 'default')
+        self.assertIsNone(JournalShardRouter().db_for_write(JournalEntry))
+
+
+@skipUnless(settings.JOURNAL_SHARDS, 'run with JOURNAL_SHARDS=2')
+class ShardTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.other = CustomUser.objects.create_user('bob', 'password')
+        cls.entry = user_journal_entries(
+            cls.user).filter(task__isnull=False).first()
+        set_shared_with(cls.entry, [cls.other])
+
+    def test_entries_are_stored_in_their_users_shard(self):
+        shard = shard_for(self.user.pk)
+        self.assertEqual(self.entry._state.db, shard)
+        self.assertGreaterEqual(self.entry.pk,
+                                (settings.JOURNAL_SHARDS.index(shard) + 1) *
+                                SHARD_ID_SPACING)
+        self.assertFalse(JournalEntry.objects.using('default').exists())
+
+    def test_deleting_a_task_unlinks_its_entries(self):
+        Task.objects.filter(pk=self.entry.task_id).delete()
+        self.entry.refresh_from_db()
+        self.assertEqual((self.entry.task_id, self.entry.board_id),
+                         (None, None))
+
+    def test_deleting_a_user_deletes_their_entries_and_shares(self):
+        self.other.delete()
+        self.assertEqual(shared_with_ids([self.entry]), {self.entry.pk: []})
+        self.user.delete()
+        for database in journal_databases():
+            self.assertFalse(
+                JournalEntry.objects.using(database).filter(
+                    user=self.user.pk).exists())
+
+    def test_archive_moves_entries_out_of_the_shards(self):
+        count = user_journal_entries(self.user).count()
+        archived = archive_journal_entries(timezone.now() + timedelta(days=1))
+        self.assertGreaterEqual(archived, count)
+        self.assertFalse(user_journal_entries(self.user).exists())
+        self.assertEqual(
+            ArchivedJournalEntry.objects.get(
+                pk=self.entry.pk).shared_with.get(), self.other)
+
+
+class SingleFlightTests(TestCase):
+
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight(ttl=0)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return len(calls)
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                flight.run(('name', 1), compute))) for _ in range(4)
+        ]
+        threads[0].start()
+        started.wait(5)
+        for thread in threads[1:]:
+            thread.start()
+        # Give the followers time to join the flight in progress
+        deadline = time.monotonic() + 5
+        while (flight.counts['name']['coalesced'] < 3
+               and time.monotonic() < deadline):
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual((len(calls), results), (1, [1, 1, 1, 1]))
+        self.assertEqual(flight.stats()['name']['coalescing_ratio'], 0.75)
+        # Without a ttl the next call runs again
+        self.assertEqual(flight.run(('name', 1), compute), 2)
+
+    def test_results_are_reused_for_the_ttl(self):
+        flight = SingleFlight(ttl=60)
+        self.assertEqual(flight.run(('name', 1), lambda: 'first'), 'first')
+        self.assertEqual(flight.run(('name', 1), lambda: 'second'), 'first')
+        self.assertEqual(flight.run(('name', 2), lambda: 'second'), 'second')
+        self.assertEqual(flight.stats()['name']['cached'], 1)
+
+    def test_forgotten_results_are_computed_again(self):
+        flight = SingleFlight(ttl=60)
+        self.assertEqual(flight.run(('name', ), lambda: 'first'), 'first')
+        flight.forget()
+        self.assertEqual(flight.run(('name', ), lambda: 'second'), 'second')
+
+        def changed_while_computing():
+            flight.forget()
+            return 'third'
+
+        flight.forget()
+        self.assertEqual(flight.run(('name', ), changed_while_computing),
+                         'third')
+        self.assertEqual(flight.run(('name', ), lambda: 'fourth'), 'fourth')
+
+    def test_errors_are_not_cached(self):
+        flight = SingleFlight(ttl=60)
+
+        def fail():
+            raise ValueError('boom')
+
+        with self.assertRaises(ValueError):
+            flight.run(('name', ), fail)
+        self.assertEqual(flight.run(('name', ), lambda: 'ok'), 'ok')
+
+
+@override_settings(ANALYTICS_COALESCE_TTL=60)
+class CoalescedAnalyticsTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.other = CustomUser.objects.create_user('bob', 'password')
+        cls.task = Task.objects.filter(assigned_to=cls.user).first()
+        cls.task.board.members.add(cls.other)
+        user_journal_entries(cls.user).update(task=cls.task,
+                                              visibility='private')
+
+    def setUp(self):
+        analytics.reset()
+
+    def statistics(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(f'/api/journal-entries/{self.task.pk}/'
+                          'task-mood-statistics/').json()
+
+    def test_personal_parts_are_not_shared(self):
+        own = self.statistics(self.user)
+        self.assertTrue(own)
+        self.assertEqual(self.statistics(self.other), [])
+        # The public part was reused, the personal ones were not
+        stats = analytics.stats()['task-mood-statistics']
+        self.assertEqual((stats['executed'], stats['cached']), (3, 1))
+        self.assertEqual(self.statistics(self.user), own)
+
+    def test_writes_are_seen_right_away(self):
+
+        def entry_count():
+            return sum(day['entry_count']
+                       for day in self.statistics(self.user))
+
+        before = entry_count()
+        with self.captureOnCommitCallbacks(execute=True):
+            JournalEntry.objects.create(user=self.user,
+                                        task=self.task,
+                                        title='Now',
+                                        valence=1,
+                                        arousal=1)
+        self.assertEqual(entry_count(), before + 1)
+
+
+class MoodInsightTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+        cls.task = Task.objects.filter(assigned_to=cls.user).first()
+
+    def assertCellsEqual(self, cells, expected):
+        self.assertEqual(cells.keys(), expected.keys())
+        for key, cell in cells.items():
+            for value, other in zip(cell, expected[key]):
+                self.assertAlmostEqual(value, other)
+
+    def test_new_entries_are_added_incrementally(self):
+        get_insight(self.user)
+        JournalEntry.objects.create(user=self.user,
+                                    task=self.task,
+                                    title='New',
+                                    valence=0.3,
+                                    arousal=-0.4)
+        insight = MoodInsight.objects.get(user=self.user)
+        self.assertFalse(insight.stale)
+        self.assertEqual(insight.entry_count,
+                         user_journal_entries(self.user).count())
+        self.assertCellsEqual(insight.cells, compute_cells(self.user))
+
+    def test_archived_entries_count(self):
+        before = compute_cells(self.user)
+        archive_journal_entries(timezone.now())
+        self.assertFalse(user_journal_entries(self.user).exists())
+        self.assertCellsEqual(compute_cells(self.user), before)
+
+    def test_edits_mark_the_insight_stale(self):
+        get_insight(self.user)
+        entry = user_journal_entries(self.user).first()
+        entry.valence = 1
+        entry.save()
+        self.assertTrue(MoodInsight.objects.get(user=self.user).stale)
+
+    def test_priority_correlation(self):
+        user_journal_entries(self.user).delete()
+        low = Task.objects.create(title='Low', list=self.task.list, priority=1)
+        high = Task.objects.create(title='High',
+                                   list=self.task.list,
+                                   priority=3)
+        samples = [(low, 0.6, 0.8), (low, 0.3, 0.4), (high, 0.0, 0.1),
+                   (high, 0.2, 0.0)]
+        for task, valence, arousal in samples:
+            JournalEntry.objects.create(user=self.user,
+                                        task=task,
+                                        title='Entry',
+                                        valence=valence,
+                                        arousal=arousal)
+        x = [task.priority for task, _, _ in samples]
+        y = [math.hypot(valence, arousal) for _, valence, arousal in samples]
+        mean_x, mean_y = sum(x) / len(x), sum(y) / len(y)
+        expected = sum(
+            (a - mean_x) * (b - mean_y)
+            for a, b in zip(x, y)) / (math.sqrt(sum(
+                (a - mean_x)**2
+                for a in x)) * math.sqrt(sum((b - mean_y)**2 for b in y)))
+
+        factors = {
+            factor['factor']: factor
+            for factor in describe(get_insight(self.user))['factors']
+        }
+        self.assertAlmostEqual(factors['priority']['correlation'], expected)
+        self.assertEqual([(group['value'], group['count'])
+                          for group in factors['priority']['groups']],
+                         [(1, 2), (3, 2)])
+        self.assertAlmostEqual(
+            factors['priority']['groups'][0]['mean_mood_index'],
+            (1.0 + 0.5) / 2)
+
+
+class ProfilingTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create_superuser('admin', 'password')
+        cls.user = CustomUser.objects.create_user('alice', 'password')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(PROFILE_DIR=directory.name))
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def test_off_unless_a_staff_user_asks(self):
+        flag = {'HTTP_X_PROFILE': '1'}
+        requests = [
+            (self.client_for(self.admin), '/api/boards/', {}),
+            (self.client_for(self.user), '/api/boards/', flag),
+            (self.client_for(self.user), '/api/boards/?_profile=1', {}),
+            (APIClient(), '/api/boards/', flag),
+        ]
+        for client, url, headers in requests:
+            response = client.get(url, **headers)
+            self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(list_profiles(), [])
+
+    def test_staff_requests_are_profiled(self):
+        client = self.client_for(self.admin)
+        for url, headers in (('/api/boards/', {
+                'HTTP_X_PROFILE': '1'
+        }), ('/api/boards/?_profile=1', {})):
+            response = client.get(url, **headers)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('X-Profile-Id', response)
+
+        profile = client.get(f'/api/profiles/{response["X-Profile-Id"]}/'
+                             '?sort=tottime&limit=5').data
+        self.assertEqual((profile['method'], profile['path'], profile['user'],
+                          profile['status']),
+                         ('GET', '/api/boards/?_profile=1', 'admin', 200))
+        self.assertEqual(profile['query_count'], len(profile['queries']))
+        self.assertTrue(
+            any('api_board' in query['sql'] for query in profile['queries']))
+        self.assertIn('tottime', profile['stats'])
+        self.assertEqual(len(client.get('/api/profiles/').data), 2)
+        self.assertEqual(
+            self.client_for(self.user).get('/api/profiles/').status_code, 403)
+
+
+class SlowQueryLogTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = f'{directory.name}/slow_queries.log'
+        self.enterContext(override_settings(SLOW_QUERY_LOG=self.log))
+
+    def run_queries(self, threshold_ms):
+        with connection.execute_wrapper(
+                SlowQueryLogger(connection, threshold_ms)):
+            for title, ids in (('secret one', [1, 2, 3]), ('secret two', [4])):
+                Task.objects.filter(title=title, pk__in=ids).count()
+
+    def test_queries_over_the_threshold_are_logged(self):
+        self.run_queries(threshold_ms=0)
+        with open(self.log) as log:
+            text = log.read()
+        entries = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual(len(entries), 2)
+        self.assertNotIn('secret', text)
+
+        first, second = entries
+        self.assertEqual(first['fingerprint'], second['fingerprint'])
+        self.assertEqual(first['fingerprint'], fingerprint(first['sql']))
+        self.assertIn('"api_task"."title" = ?', first['sql'])
+        self.assertIn('IN (...)', first['sql'])
+        self.assertNotEqual(first['params_fingerprint'],
+                            second['params_fingerprint'])
+        self.assertTrue(first['plan'])
+        self.assertIn('api/tests.py', first['call_site'])
+
+        out = StringIO()
+        call_command('slow_queries', '--log', self.log, '--json', stdout=out)
+        summary = json.loads(out.getvalue())
+        self.assertEqual([(group['count'], group['distinct_params'])
+                          for group in summary], [(2, 2)])
+
+    def test_fast_queries_are_not_logged(self):
+        self.run_queries(threshold_ms=60_000)
+        self.assertFalse(os.path.exists(self.log))
+
+    def test_normalize_sql(self):
+        self.assertEqual(
+            normalize_sql("SELECT *  FROM t\nWHERE a = 'it''s' AND b IN "
+                          "(%s, %s, %s) AND c > 1.5"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) AND c > ?')
+
+
+class LoadTestRecorderTests(TestCase):
+
+    def test_errors_and_contention_per_route(self):
+        recorder = Recorder()
+        for latency in range(1, 101):
+            recorder.record('GET /api/boards/', latency, 200)
+        recorder.record('PUT /api/tasks/{id}/', 5, 409)
+        recorder.record('PUT /api/tasks/{id}/', 7, 500,
+                        b'{"detail": "database is locked"}')
+        recorder.record('PUT /api/tasks/{id}/', 9, 500, b'boom')
+        totals, routes = recorder.summary(elapsed=2)
+
+        boards = routes['GET /api/boards/']
+        self.assertEqual((boards['requests'], boards['rps']), (100, 50))
+        self.assertEqual(
+            (boards['p50_ms'], boards['p95_ms'], boards['max_ms']),
+            (50, 95, 100))
+        tasks = routes['PUT /api/tasks/{id}/']
+        self.assertEqual((tasks['error_rate'], tasks['contention']), (1, 2))
+        self.assertEqual(tasks['statuses'], {'409': 1, '500': 2})
+        self.assertEqual((totals['requests'], totals['contention']), (103, 2))
+
+    def test_compare(self):
+        baseline = {'routes': {'GET /a': {'rps': 10, 'p95_ms': 20}}}
+        results = {
+            'routes': {
+                'GET /a': {
+                    'rps': 15,
+                    'p95_ms': 10,
+                    'error_rate': 0.5
+                }
+            }
+        }
+        self.assertEqual(
+            loadtest_compare(results, baseline)['GET /a'], {
+                'rps_change': 0.5,
+                'p95_change': -0.5,
+                'error_rate_change': 0.5,
+                'contention_change': 0,
+            })
+
+
+class LoadTestScenarioTests(LiveServerTestCase):
+
+    def test_scenario_runs_against_the_server(self):
+        scenario = {
+            # The live server threads share the in-memory database's
+            # connection, concurrent users would trip each other up
+            'users': 1,
+            'duration': 1,
+            'ramp_up': 0,
+            'think_time': [0, 0.01],
+            'lists': 2,
+            'tasks': 4,
+        }
+        results = run_scenario(f'{self.live_server_url}/api/',
+                               scenario,
+                               seed=1)
+        self.assertGreater(results['totals']['requests'], 0)
+        failed = {
+            route: stats['statuses']
+            for route, stats in results['routes'].items()
+            if stats['error_rate']
+        }
+        self.assertEqual(failed, {})
+
+
+class MaintenanceReportTests(JournalTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        CustomUser.objects.create_user('alice', 'password')
+
+    def test_key_queries_use_indexes(self):
+        report = health_report()
+        # Journal queries are explained once per shard, as name@shard
+        self.assertEqual({name.split('@')[0]
+                          for name in report['queries']}, set(KEY_QUERIES))
+        for name, query in report['queries'].items():
+            with self.subTest(query=name):
+                self.assertNotIn('error', query)
+                self.assertTrue(query['indexes'])
+                self.assertEqual(query['full_scans'], [])
+
+        database = report['databases']['default']
+        self.assertIn('api_journalentry', database['tables'])
+        used = {
+            index
+            for query in report['queries'].values()
+            if query['database'] == 'default' for index in query['indexes']
+        }
+        self.assertFalse(used & set(database['unused_indexes']))
+        self.assertFalse({
+            name
+            for name in database['unused_indexes']
+            if database['indexes'][name]['unique']
+        })
+
+    def test_compare_reports_plan_changes(self):
+        baseline = health_report()
+        report = copy.deepcopy(baseline)
+        self.assertEqual(compare_reports(report, baseline)['plans'], {})
+
+        report['queries']['tasks.list']['indexes'] = []
+        report['queries']['tasks.list']['full_scans'] = ['api_task']
+        report['databases']['default']['unused_indexes'].append('some_idx')
+        changes = compare_reports(report, baseline)
+        self.assertEqual(set(changes['plans']['tasks.list']),
+                         {'indexes', 'full_scans'})
+        self.assertEqual(changes['newly_unused_indexes'],
+                         {'default': ['some_idx']})
+
+    def test_analyze_and_integrity_check(self):
+        # VACUUM can't run inside the test's transaction
+        result = maintain('default', vacuum=False, quick_check=True)
+        self.assertEqual(result['integrity'], ['ok'])
+        self.assertIn('analyze_ms', result)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('db_maintenance', '--report-only', stdout=out)
+        self.assertIn('Key queries', out.getvalue())
+        self.assertIn('task_board_completed_due_idx', out.getvalue())
+
+
+class MaintenanceVacuumTests(TransactionTestCase):
+
+    def test_incremental_vacuum_after_a_full_one(self):
+        self.assertEqual(
+            maintain('default', full_vacuum=True)['vacuum']['mode'], 'full')
+        result = maintain('default')
+        self.assertEqual(result['vacuum']['mode'], 'incremental')
+        self.assertEqual(result['integrity'], ['ok'])
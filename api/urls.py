@@ -1,9 +1,10 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (BoardViewSet, CustomTokenRefreshView, DashboardViewSet,
-                    JournalEntryViewSet, ListViewSet, LoginView, RegisterView,
-                    TaskViewSet)
+from .views import (BatchView, BoardViewSet, CustomTokenRefreshView,
+                    DashboardViewSet, JobViewSet, JournalEntryViewSet,
+                    ListViewSet, LoginView, ProfileViewSet, RegisterView,
+                    TaskViewSet, board_events)
 
 router = DefaultRouter()
 router.register(r'boards', BoardViewSet)
@@ -13,9 +14,13 @@ router.register(r'journal-entries',
                 JournalEntryViewSet,
                 basename='journalentry')
 router.register(r'dashboard', DashboardViewSet, basename='dashboard')
+router.register(r'jobs', JobViewSet, basename='job')
+router.register(r'profiles', ProfileViewSet, basename='profile')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('boards/<int:pk>/events/', board_events, name='board-events'),
+    path('batch/', BatchView.as_view(), name='batch'),
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', LoginView.as_view(), name='login'),
     path('token/refresh/',
@@ -1,26 +1,61 @@
+from collections import defaultdict
+from itertools import chain
 from datetime import timedelta
 
-from django.db.models import (Avg, Count, ExpressionWrapper, F, FloatField,
-                              Func, Max, Min, Q)
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (Count, ExpressionWrapper, F, FloatField, Func,
+                              Max, OuterRef, Subquery)
+from django.http import (FileResponse, Http404, JsonResponse,
+                         StreamingHttpResponse)
 from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_datetime
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed, ValidationError
 from rest_framework.filters import OrderingFilter
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.views import (TokenObtainPairView,
                                             TokenRefreshView)
 
 from api import serializers
+from api.archive import (daily_mood_rows, daily_mood_statistics,
+                         heatmap_totals, merge_daily_rows, reaches_archive)
+from api.batch import run_batch
+from api.cloning import clone_board
+from api.coalescing import analytics
+from api.comembers import search_comembers
+from api.counters import apply_task_delta
+from api.deletion import detach_board, purge_board
+from api.events import publish_board_event, publish_task_event, stream_events
+from api.fastpath import (TASK_COLUMNS, serialize_journal_entries,
+                          serialize_task_rows, serialize_tasks)
+from api.insights import describe, get_insight, mark_stale
+from api.jobs import enqueue
+from api.pagination import StandardResultsSetPagination
 from api.permissions import IsBoardMember
-
-from .models import Board, CustomUser, JournalEntry, List, Task
-from .serializers import (BoardDetailSerializer, BoardSerializer,
-                          JournalEntrySerializer, ListSerializer,
-                          TaskDropdownSerializer, TaskSerializer,
-                          UserSerializer)
+from api.profiling import list_profiles, load_profile, profile_path
+from api.renderers import COLUMNAR_RENDERERS
+from api.sharding import (journal_databases, sharding_enabled,
+                          user_journal_entries)
+
+from .models import (ArchivedJournalEntry, Board, CustomUser, Job,
+                     JournalEntry, List, Task, allocate_positions)
+from .serializers import (BatchSerializer, BoardCloneSerializer,
+                          BoardDetailSerializer, BoardSerializer,
+                          JobSerializer, JournalEntrySerializer,
+                          ListSerializer, TaskBulkAssignSerializer,
+                          TaskBulkCreateSerializer, TaskDropdownSerializer,
+                          TaskSerializer, UserSerializer, optimize_queryset,
+                          prefetch_shared_with, wants_sparse_fieldset)
 
 
 class Sqrt(Func):
@@ -29,6 +64,48 @@ class Sqrt(Func):
     output_field = FloatField()
 
 
+def mood_index_expression():
+    return Sqrt(
+        ExpressionWrapper(F('valence')**2 + F('arousal')**2,
+                          output_field=FloatField()))
+
+
+# The analytics time series can also be rendered column by column
+SERIES_RENDERERS = api_settings.DEFAULT_RENDERER_CLASSES + COLUMNAR_RENDERERS
+
+
+def bool_query_param(request, name):
+    return request.query_params.get(name, '').lower() in ('1', 'true', 'yes')
+
+
+def int_query_param(request, name, default=None):
+    value = request.query_params.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValidationError({name: 'Must be an integer.'})
+    if value < 0:
+        raise ValidationError({name: 'Must not be negative.'})
+    return value
+
+
+def date_range_filters(request):
+    """
+    The ``start_date`` and ``end_date`` query parameters, None if missing,
+    and the ``created_at`` filters for them.
+    """
+    start_date = request.query_params.get('start_date', '').strip() or None
+    end_date = request.query_params.get('end_date', '').strip() or None
+    date_filters = {}
+    if start_date:
+        date_filters['created_at__gte'] = start_date
+    if end_date:
+        date_filters['created_at__lte'] = end_date
+    return start_date, end_date, date_filters
+
+
 class RegisterView(APIView):
     permission_classes = [AllowAny]
 
@@ -40,6 +117,26 @@ class RegisterView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BatchView(APIView):
+    """
+    Run several API requests at once.
+
+    Expects ``{"requests": [{"method": "GET", "path": "/api/boards/",
+    "body": {...}}, ...], "parallel": false}`` and responds with
+    ``{"responses": [{"status": 200, "body": ...}, ...]}`` in the same
+    order. The sub-requests are authenticated as the user of the batch.
+    """
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        responses = run_batch(request,
+                              serializer.validated_data['requests'],
+                              BatchView,
+                              parallel=serializer.validated_data['parallel'])
+        return Response({'responses': responses})
+
+
 class LoginView(TokenObtainPairView):
     permission_classes = [AllowAny]
 
@@ -75,11 +172,81 @@ class BoardViewSet(viewsets.ModelViewSet):
                         status=status.HTTP_201_CREATED,
                         headers=headers)
 
+    def list(self, request, *args, **kwargs):
+        boards = self.filter_queryset(self.get_queryset()).filter(
+            is_template=False).prefetch_related('members')
+        return self.list_boards(boards)
+
+    def list_boards(self, boards):
+        overdue_counts = dict(Task.objects.overdue().filter(
+            board__in=boards).order_by().values_list('board').annotate(
+                Count('id')))
+        context = self.get_serializer_context()
+        context['overdue_counts'] = overdue_counts
+        serializer = self.get_serializer(boards, many=True, context=context)
+        return Response(serializer.data)
+
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
+    def destroy(self, request, *args, **kwargs):
+        """
+        Delete the board with its lists and tasks in batches.
+
+        Query Parameters:
+            async (bool): Optional. Hide the board right away, delete it in
+                a background job and respond with 202 and the job, which
+                reports its progress at /api/jobs/<id>/.
+        """
+        board = self.get_object()
+        if not bool_query_param(request, 'async'):
+            purge_board(board.pk)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+
+        detach_board(board.pk)
+        job = enqueue('purge_board', user=request.user, board_id=board.pk)
+        return Response(JobSerializer(job).data,
+                        status=status.HTTP_202_ACCEPTED,
+                        headers={'Location': f'/api/jobs/{job.pk}/'})
+
+    @action(detail=False, methods=['get'])
+    def templates(self, request):
+        """List the board templates of the user."""
+        return self.list_boards(self.get_queryset().filter(
+            is_template=True).prefetch_related('members'))
+
+    @action(detail=True, methods=['post'])
+    def clone(self, request, pk=None):
+        """
+        Create a new board from this board or template.
+
+        Body Parameters:
+            name (str): Optional. Defaults to the name of the source board.
+            include_tasks (bool): Optional. Copy the tasks, default true.
+            include_assignees (bool): Optional. Keep task assignees that
+                are members of the copy, default false.
+            include_members (bool): Optional. Copy the members, default
+                false.
+        """
+        return self.clone_board(request, is_template=False)
+
+    @action(detail=True, methods=['post'], url_path='save-as-template')
+    def save_as_template(self, request, pk=None):
+        """Save a copy of this board as a template, see ``clone``."""
+        return self.clone_board(request, is_template=True)
+
+    def clone_board(self, request, is_template):
+        serializer = BoardCloneSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        copy = clone_board(self.get_object(),
+                           request.user,
+                           is_template=is_template,
+                           **serializer.validated_data)
+        return Response(BoardSerializer(copy).data,
+                        status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['post'])
     def add_member(self, request, pk=None):
         board = self.get_object()
@@ -89,6 +256,7 @@ class BoardViewSet(viewsets.ModelViewSet):
             if user not in board.members.all():
                 board.members.add(user)
                 user_data = UserSerializer(user).data
+                publish_board_event(board.pk, 'member.added', user=user_data)
                 return Response({
                     'status': 'user added to board',
                     'user': user_data
@@ -134,6 +302,10 @@ class ListViewSet(viewsets.ModelViewSet):
 
                 list_obj.position = new_position
                 list_obj.save()
+                publish_board_event(list_obj.board_id,
+                                    'list.moved',
+                                    list=list_obj.pk,
+                                    position=new_position)
 
             return Response({'status': 'list moved'})
         return Response({'status': 'invalid position'},
@@ -147,10 +319,108 @@ class TaskViewSet(viewsets.ModelViewSet):
     filterset_fields = ['list', 'assigned_to', 'priority', 'complexity']
     ordering_fields = ['position', 'due_date', 'priority']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if (self.action in ('list', 'retrieve')
+                and wants_sparse_fieldset(self.request)):
+            queryset = optimize_queryset(queryset, self.get_serializer())
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        if wants_sparse_fieldset(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(serialize_tasks(queryset))
+
+    def retrieve(self, request, *args, **kwargs):
+        if wants_sparse_fieldset(request):
+            return super().retrieve(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        data = serialize_tasks(queryset.filter(pk=kwargs['pk']))
+        if not data:
+            raise Http404
+        return Response(data[0])
+
     def perform_create(self, serializer):
-        serializer.save()
+        task = serializer.save()
+        publish_task_event('task.created', task, task=serializer.data)
+
+    def perform_update(self, serializer):
+        old_board_id = serializer.instance.board_id
+        task = serializer.save()
+        publish_task_event('task.updated',
+                           task,
+                           old_board_id,
+                           task=serializer.data)
+
+    def perform_destroy(self, instance):
+        board_id = instance.board_id
+        task_id, list_id = instance.pk, instance.list_id
+        instance.delete()
+        publish_board_event(board_id,
+                            'task.deleted',
+                            task=task_id,
+                            list=list_id)
+
+    @action(detail=False, methods=['post'])
+    @transaction.atomic
+    def bulk(self, request):
+        """
+        Create many tasks at once from ``{"tasks": [...]}``.
+
+        Each list gets one block of consecutive positions, and tasks and
+        assignments are inserted in bulk, all in one transaction.
+        """
+        serializer = TaskBulkCreateSerializer(data=request.data,
+                                              context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data['tasks']
+
+        by_list = defaultdict(list)
+        for item in items:
+            by_list[item['list']].append(item)
+        positions = {
+            list_id: allocate_positions(Task, 'list', list_id, len(list_items))
+            for list_id, list_items in by_list.items()
+        }
+        tasks = []
+        for item in items:
+            item['task'] = Task(title=item['title'],
+                                description=item.get('description', ''),
+                                due_date=item.get('due_date'),
+                                priority=item.get('priority', 1),
+                                complexity=item.get('complexity', 1),
+                                list_id=item['list'],
+                                board_id=item['board_id'],
+                                position=positions[item['list']],
+                                completed=item.get('completed', False))
+            positions[item['list']] += 1
+            tasks.append(item['task'])
+        Task.objects.bulk_create(tasks)
+
+        Assignment = Task.assigned_to.through
+        Assignment.objects.bulk_create([
+            Assignment(task_id=item['task'].pk, customuser_id=user_id)
+            for item in items
+            for user_id in dict.fromkeys(item.get('assigned_to_ids', []))
+        ])
+        tasks_by_board = defaultdict(list)
+        for item in items:
+            tasks_by_board[item['board_id']].append(item['task'].pk)
+        for board_id, task_ids in tasks_by_board.items():
+            publish_board_event(board_id, 'tasks.created', tasks=task_ids)
+        for list_id, list_items in by_list.items():
+            apply_task_delta(
+                list_id, len(list_items),
+                sum(item['task'].completed for item in list_items),
+                list_items[0]['board_id'])
+
+        created = Task.objects.filter(pk__in=[task.pk for task in tasks])
+        return Response(serialize_tasks(created.order_by('id')),
+                        status=status.HTTP_201_CREATED)
 
     @action(detail=True, methods=['post'])
+    @transaction.atomic
     def move(self, request, pk=None):
         task = self.get_object()
         new_position = request.data.get('position')
@@ -161,10 +431,10 @@ class TaskViewSet(viewsets.ModelViewSet):
                 return Response({'status': 'invalid position'},
                                 status=status.HTTP_400_BAD_REQUEST)
             old_position = task.position
-            old_list = task.list
-            if new_list_id and int(new_list_id) != old_list.id:
+            old_list_id, old_board_id = task.list_id, task.board_id
+            if new_list_id and int(new_list_id) != old_list_id:
                 new_list = List.objects.get(id=new_list_id)
-                Task.objects.filter(list=old_list,
+                Task.objects.filter(list=old_list_id,
                                     position__gt=old_position).update(
                                         position=F('position') - 1)
                 Task.objects.filter(list=new_list,
@@ -173,21 +443,73 @@ class TaskViewSet(viewsets.ModelViewSet):
                 task.list = new_list
             elif new_position != old_position:
                 if new_position < old_position:
-                    Task.objects.filter(list=task.list,
+                    Task.objects.filter(list=task.list_id,
                                         position__gte=new_position,
                                         position__lt=old_position).update(
                                             position=F('position') + 1)
                 else:
-                    Task.objects.filter(list=task.list,
+                    Task.objects.filter(list=task.list_id,
                                         position__gt=old_position,
                                         position__lte=new_position).update(
                                             position=F('position') - 1)
             task.position = new_position
             task.save()
+            publish_task_event('task.moved',
+                               task,
+                               old_board_id,
+                               task=task.pk,
+                               list=task.list_id,
+                               from_list=old_list_id,
+                               position=new_position)
             return Response({'status': 'task moved'})
         return Response({'status': 'invalid position'},
                         status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['get'])
+    def overdue(self, request):
+        """
+        Uncompleted tasks past their due date, earliest first.
+
+        Query Parameters:
+            scope (str): Optional. 'assigned' (default) for the user's tasks,
+                'boards' for all tasks on the user's boards.
+            board (int): Optional. Only tasks on this board.
+            page, page_size (int): Optional. Pagination.
+        """
+        return self.paginated_tasks(self.scoped_tasks(request).overdue())
+
+    @action(detail=False, methods=['get'], url_path='due-soon')
+    def due_soon(self, request):
+        """
+        Uncompleted tasks due within the next ``hours`` (default 48).
+
+        Accepts the same query parameters as ``overdue``.
+        """
+        hours = min(int_query_param(request, 'hours', 48), 24 * 366)
+        return self.paginated_tasks(
+            self.scoped_tasks(request).due_soon(timedelta(hours=hours)))
+
+    def scoped_tasks(self, request):
+        scope = request.query_params.get('scope', 'assigned')
+        if scope not in ('assigned', 'boards'):
+            raise ValidationError({'scope': "Must be 'assigned' or 'boards'."})
+        tasks = (Task.objects.for_assignee(request.user) if scope == 'assigned'
+                 else Task.objects.for_member(request.user))
+
+        board_id = int_query_param(request, 'board')
+        if board_id is not None:
+            if not Board.objects.filter(pk=board_id,
+                                        members=request.user).exists():
+                raise Http404
+            tasks = tasks.for_board(board_id)
+        return tasks
+
+    def paginated_tasks(self, tasks):
+        paginator = StandardResultsSetPagination()
+        rows = tasks.order_by('due_date', 'id').values(*TASK_COLUMNS)
+        page = paginator.paginate_queryset(rows, self.request, view=self)
+        return paginator.get_paginated_response(serialize_task_rows(page))
+
     @action(detail=True, methods=['post'])
     def assign(self, request, pk=None):
         task = self.get_object()
@@ -195,23 +517,178 @@ class TaskViewSet(viewsets.ModelViewSet):
         task.assigned_to.add(user)
         return Response({'status': 'task assigned'})
 
+    @action(detail=False, methods=['post'], url_path='bulk-assign')
+    @transaction.atomic
+    def bulk_assign(self, request):
+        """
+        Add and remove assignees of many tasks at once from ``{"task_ids":
+        [...], "add": [user ids], "remove": [user ids]}``.
+
+        Responds with how many assignments were added and removed and the
+        updated tasks. Only the boards of the tasks get an event.
+        """
+        serializer = TaskBulkAssignSerializer(data=request.data,
+                                              context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        task_ids = list(data['boards'])
+
+        Assignment = Task.assigned_to.through
+        removed = 0
+        if data['remove']:
+            removed, _ = Assignment.objects.filter(
+                task_id__in=task_ids,
+                customuser_id__in=data['remove']).delete()
+        added = []
+        if data['add']:
+            existing = set(
+                Assignment.objects.filter(
+                    task_id__in=task_ids,
+                    customuser_id__in=data['add']).values_list(
+                        'task_id', 'customuser_id'))
+            added = Assignment.objects.bulk_create([
+                Assignment(task_id=task_id, customuser_id=user_id)
+                for task_id in task_ids for user_id in data['add']
+                if (task_id, user_id) not in existing
+            ])
+
+        tasks_by_board = defaultdict(list)
+        for task_id, board_id in data['boards'].items():
+            tasks_by_board[board_id].append(task_id)
+        for board_id, board_task_ids in tasks_by_board.items():
+            publish_board_event(board_id,
+                                'tasks.assigned',
+                                tasks=board_task_ids,
+                                added=data['add'],
+                                removed=data['remove'])
+
+        tasks = Task.objects.filter(pk__in=task_ids).order_by('id')
+        return Response({
+            'added': len(added),
+            'removed': removed,
+            'tasks': serialize_tasks(tasks),
+        })
+
 
 class JournalEntryViewSet(viewsets.ModelViewSet):
     serializer_class = JournalEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return JournalEntry.objects.filter(user=self.request.user)
-
-    def get_extended_queryset(self):
+        queryset = user_journal_entries(self.request.user)
+        if (self.action in ('list', 'retrieve')
+                and wants_sparse_fieldset(self.request)):
+            queryset = optimize_queryset(queryset, self.get_serializer())
+        return queryset
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args,
+                                             **kwargs)
+        if self.renderer_classes is SERIES_RENDERERS:
+            patch_vary_headers(response, ['Accept'])
+        return response
+
+    def get_serializer(self, *args, **kwargs):
+        if args and kwargs.get('many'):
+            args = (prefetch_shared_with(args[0]), *args[1:])
+        return super().get_serializer(*args, **kwargs)
+
+    def get_scoped_querysets(self, scope, model=JournalEntry):
+        """
+        The entries of ``model`` the user may see on every database, in two
+        disjoint parts: the 'public' ones, the same for every user, or the
+        'personal' ones, the user's other entries and those shared with
+        them.
+        """
         user = self.request.user
-        return JournalEntry.objects.filter(
-            Q(user=user) | Q(visibility='public')
-            | (Q(visibility='shared') & Q(shared_with=user)))
+        databases = journal_databases() if model is JournalEntry else [None]
+        querysets = []
+        for database in databases:
+            entries = model.objects.using(database)
+            if scope == 'public':
+                querysets.append(entries.filter(visibility='public'))
+            else:
+                querysets += [
+                    entries.filter(user=user).exclude(visibility='public'),
+                    entries.filter(visibility='shared',
+                                   shared_with=user).exclude(user=user),
+                ]
+        return querysets
+
+    def coalesced_parts(self, key, compute):
+        """
+        ``compute(hot, archived)`` for the public and the personal entries
+        (see ``get_scoped_querysets``), each through api.coalescing so
+        identical concurrent requests run it once. The public part is
+        shared by all users, ``key`` must identify everything else the
+        result depends on.
+        """
+        return [
+            analytics.run(
+                (*key, scope if scope == 'public' else self.request.user.pk),
+                lambda scope=scope: compute(
+                    self.get_scoped_querysets(scope),
+                    self.get_scoped_querysets(scope, ArchivedJournalEntry)))
+            for scope in ('public', 'personal')
+        ]
+
+    def list(self, request, *args, **kwargs):
+        """
+        List the user's journal entries.
+
+        Query Parameters:
+            include_archived (bool): Optional. Also return the entries moved
+                to the archive (see api.archive), which is slower.
+        """
+        if not bool_query_param(request, 'include_archived'):
+            if wants_sparse_fieldset(request):
+                return super().list(request, *args, **kwargs)
+            queryset = self.filter_queryset(self.get_queryset())
+            return Response(serialize_journal_entries(queryset))
+
+        hot = self.filter_queryset(self.get_queryset())
+        cold = ArchivedJournalEntry.objects.filter(user=request.user)
+        if wants_sparse_fieldset(request):
+            serializer = self.get_serializer()
+            entries = sorted(chain(hot, optimize_queryset(cold, serializer)),
+                             key=lambda entry: entry.created_at,
+                             reverse=True)
+            return Response(self.get_serializer(entries, many=True).data)
+        data = serialize_journal_entries(hot) + serialize_journal_entries(cold)
+        data.sort(key=lambda entry: parse_datetime(entry['created_at']),
+                  reverse=True)
+        return Response(data)
+
+    def retrieve(self, request, *args, **kwargs):
+        if wants_sparse_fieldset(request):
+            try:
+                return super().retrieve(request, *args, **kwargs)
+            except Http404:
+                serializer = self.get_serializer()
+                entry = optimize_queryset(
+                    ArchivedJournalEntry.objects.filter(user=request.user,
+                                                        pk=kwargs['pk']),
+                    serializer).first()
+                if entry is None:
+                    raise
+                return Response(self.get_serializer(entry).data)
+        queryset = self.filter_queryset(self.get_queryset())
+        data = serialize_journal_entries(queryset.filter(pk=kwargs['pk']))
+        if not data:
+            data = serialize_journal_entries(
+                ArchivedJournalEntry.objects.filter(user=request.user,
+                                                    pk=kwargs['pk']))
+        if not data:
+            raise Http404
+        return Response(data[0])
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+    def perform_destroy(self, instance):
+        mark_stale(instance.user_id)
+        instance.delete()
+
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
@@ -230,7 +707,10 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
 
         return Response(serializer.data)
 
-    @action(detail=False, methods=['get'], url_path='mood-statistics')
+    @action(detail=False,
+            methods=['get'],
+            url_path='mood-statistics',
+            renderer_classes=SERIES_RENDERERS)
     def mood_statistics(self, request):
         """
         Retrieve mood statistics for the last 30 days.
@@ -240,46 +720,70 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
         """
         end_date = timezone.now().date()
         start_date = end_date - timedelta(days=30)
-        journal_entries = self.get_queryset().filter(
-            created_at__date__range=(start_date, end_date),
-            valence__isnull=False,
-            arousal__isnull=False).values('created_at__date').annotate(
-                mood_index=Avg(
-                    Sqrt(
-                        ExpressionWrapper(F('valence')**2 + F('arousal')**2,
-                                          output_field=FloatField()))
-                )).order_by('created_at__date')
 
+        def compute():
+            hot = self.get_queryset().filter(
+                created_at__date__range=(start_date, end_date))
+            cold = ArchivedJournalEntry.objects.filter(
+                user=request.user,
+                created_at__date__range=(
+                    start_date,
+                    end_date)) if reaches_archive(start_date) else None
+            return daily_mood_statistics(hot, cold, mood_index_expression())
+
+        days = analytics.run(
+            ('mood-statistics', request.user.pk, start_date, end_date),
+            compute)
         data = [{
-            'date': entry['created_at__date'].isoformat(),
-            'mood_index': entry['mood_index']
-        } for entry in journal_entries]
+            'date': day['created_at__date'].isoformat(),
+            'mood_index': day['avg_mood_index']
+        } for day in days]
         return Response(data)
 
-    @action(detail=False, methods=['get'], url_path='heatmap-data')
+    @action(detail=False,
+            methods=['get'],
+            url_path='coalescing-stats',
+            permission_classes=[permissions.IsAdminUser])
+    def coalescing_stats(self, request):
+        """
+        Calls of the analytics actions in this process since it started,
+        and how many of them shared another call's computation.
+        """
+        return Response(analytics.stats())
+
+    @action(detail=False, methods=['get'], url_path='mood-insights')
+    def mood_insights(self, request):
+        """
+        Correlations and effect sizes of task priority, complexity, overdue
+        state, time of day and weekday on the user's mood index, strongest
+        first. Cached per user, see api.insights.
+        """
+        return Response(describe(get_insight(request.user)))
+
+    @action(detail=False,
+            methods=['get'],
+            url_path='heatmap-data',
+            renderer_classes=SERIES_RENDERERS)
     def heatmap_data(self, request):
         """
         Endpoint to retrieve data for generating a heatmap of mood indices
         based on task complexity and priority.
         """
-        data = self.get_queryset().filter(
-            task__isnull=False,
-            valence__isnull=False, arousal__isnull=False).values(
-                'task__complexity', 'task__priority').annotate(mood_index=Avg(
-                    Sqrt(
-                        ExpressionWrapper(
-                            F('valence')**2 + F('arousal')**2,
-                            output_field=FloatField())))).order_by(
-                                'task__complexity', 'task__priority')
-
+        totals = analytics.run(
+            ('heatmap-data', request.user.pk), lambda: heatmap_totals(
+                request.user, self.get_queryset(), mood_index_expression()))
         heatmap_data = [{
-            'complexity': item['task__complexity'],
-            'priority': item['task__priority'],
-            'mood_index': item['mood_index']
-        } for item in data]
+            'complexity': complexity,
+            'priority': priority,
+            'mood_index': mood_sum / count
+        } for (complexity, priority), (count,
+                                       mood_sum) in sorted(totals.items())]
         return Response(heatmap_data)
 
-    @action(detail=True, methods=['get'], url_path='task-mood-statistics')
+    @action(detail=True,
+            methods=['get'],
+            url_path='task-mood-statistics',
+            renderer_classes=SERIES_RENDERERS)
     def task_mood_statistics(self, request, pk=None):
         try:
             task = Task.objects.get(pk=pk)
@@ -287,36 +791,25 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
             return Response({"error": "Task not found."},
                             status=status.HTTP_404_NOT_FOUND)
 
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-
-        queryset = self.get_extended_queryset().filter(task=task)
-
-        if start_date:
-            queryset = queryset.filter(created_at__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(created_at__lte=end_date)
-
-        data = queryset.filter(
-            valence__isnull=False,
-            arousal__isnull=False).values('created_at__date').annotate(
-                avg_mood_index=Avg(
-                    Sqrt(
-                        ExpressionWrapper(F('valence')**2 + F('arousal')**2,
-                                          output_field=FloatField()))),
-                min_mood_index=Min(
-                    Sqrt(
-                        ExpressionWrapper(F('valence')**2 + F('arousal')**2,
-                                          output_field=FloatField()))),
-                max_mood_index=Max(
-                    Sqrt(
-                        ExpressionWrapper(F('valence')**2 + F('arousal')**2,
-                                          output_field=FloatField()))),
-                entry_count=Count('id')).order_by('created_at__date')
-        # print(data)
-        return Response(data)
-
-    @action(detail=True, methods=['get'], url_path='task-mood-history')
+        start_date, end_date, date_filters = date_range_filters(request)
+        with_archive = reaches_archive(start_date)
+
+        def compute(hot, archived):
+            return daily_mood_rows([
+                queryset.filter(task=task, **date_filters) for queryset in hot
+            ], [
+                queryset.filter(task=task, **date_filters)
+                for queryset in archived
+            ] if with_archive else None, mood_index_expression())
+
+        parts = self.coalesced_parts(
+            ('task-mood-statistics', task.pk, start_date, end_date), compute)
+        return Response(merge_daily_rows(chain.from_iterable(parts)))
+
+    @action(detail=True,
+            methods=['get'],
+            url_path='task-mood-history',
+            renderer_classes=SERIES_RENDERERS)
     def task_mood_history(self, request, pk=None):
         """
         Retrieve mood history for a specific task.
@@ -333,21 +826,39 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
             return Response({"error": "Task not found."},
                             status=status.HTTP_404_NOT_FOUND)
 
-        journal_entries = self.get_extended_queryset().filter(
-            task=task).order_by('created_at')
+        def compute(hot, archived):
+            return list(
+                chain.from_iterable(
+                    queryset.filter(task=task).annotate(
+                        mood_index=mood_index_expression()).values(
+                            'created_at', 'mood_index', 'title', 'content',
+                            'visibility', 'user_id') for queryset in hot))
+
+        parts = self.coalesced_parts(('task-mood-history', task.pk), compute)
+        journal_entries = sorted(chain.from_iterable(parts),
+                                 key=lambda entry: entry['created_at'])
+        # The users aren't in the shards, look them up in one query
+        usernames = dict(
+            CustomUser.objects.filter(
+                pk__in={entry['user_id']
+                        for entry in journal_entries}).values_list(
+                            'id', 'username'))
 
         data = [{
-            'date': entry.created_at.isoformat(),
-            'mood_index': entry.mood_index,
-            'title': entry.title,
-            'content': entry.content,
-            'visibility': entry.visibility,
-            'user': entry.user.username
+            'date': entry['created_at'].isoformat(),
+            'mood_index': entry['mood_index'],
+            'title': entry['title'],
+            'content': entry['content'],
+            'visibility': entry['visibility'],
+            'user': usernames.get(entry['user_id'])
         } for entry in journal_entries]
 
         return Response(data)
 
-    @action(detail=True, methods=['get'], url_path='project-overview')
+    @action(detail=True,
+            methods=['get'],
+            url_path='project-overview',
+            renderer_classes=SERIES_RENDERERS)
     def project_overview(self, request, pk=None):
         """
         Retrieve a project-wide overview of mood statistics.
@@ -364,53 +875,95 @@ class JournalEntryViewSet(viewsets.ModelViewSet):
         except Board.DoesNotExist:
             return Response({"error": "Board not found."},
                             status=status.HTTP_404_NOT_FOUND)
-        start_date = request.query_params.get('start_date')
-        end_date = request.query_params.get('end_date')
-
-        queryset = self.get_extended_queryset().filter(task__list__board=board)
-
-        if start_date:
-            queryset = queryset.filter(created_at__gte=start_date)
-        if end_date:
-            queryset = queryset.filter(created_at__lte=end_date)
-
-        data = queryset.filter(
-            valence__isnull=False,
-            arousal__isnull=False).values('created_at__date').annotate(
-                avg_mood_index=Avg(
-                    Sqrt(
-                        ExpressionWrapper(F('valence')**2 + F('arousal')**2,
-                                          output_field=FloatField()))),
-                min_mood_index=Min(
-                    Sqrt(
-                        ExpressionWrapper(F('valence')**2 + F('arousal')**2,
-                                          output_field=FloatField()))),
-                max_mood_index=Max(
-                    Sqrt(
-                        ExpressionWrapper(F('valence')**2 + F('arousal')**2,
-                                          output_field=FloatField()))),
-                entry_count=Count('id')).order_by('created_at__date')
-        return Response(data)
+        start_date, end_date, date_filters = date_range_filters(request)
+        with_archive = reaches_archive(start_date)
+
+        def compute(hot, archived):
+            return daily_mood_rows([
+                queryset.filter(board=board, **date_filters)
+                for queryset in hot
+            ], [
+                queryset.filter(task__board=board, **date_filters)
+                for queryset in archived
+            ] if with_archive else None, mood_index_expression())
+
+        parts = self.coalesced_parts(
+            ('project-overview', board.pk, start_date, end_date), compute)
+        return Response(merge_daily_rows(chain.from_iterable(parts)))
 
     @action(detail=False, methods=['GET'], url_path='available-tasks')
     def available_tasks(self, request):
         """
             Retrieve all tasks that the user is assigned to and can be linked to a journal entry.
             """
-        user_tasks = Task.objects.filter(assigned_to=request.user)
+        user_tasks = Task.objects.for_assignee(request.user)
         serializer = TaskDropdownSerializer(user_tasks, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['GET'], url_path='available-tasks/search')
+    def search_available_tasks(self, request):
+        """
+        Typeahead search over the tasks the user is assigned to.
+
+        Query Parameters:
+            q (str): Optional. Text to match against the task title.
+            match (str): Optional. 'prefix' (default), served by an index,
+                or 'contains', which scans the user's assigned tasks.
+            include_completed (bool): Optional. Also return completed tasks.
+            limit (int): Optional. Maximum number of results (default 10, max 50).
+
+        Returns:
+            Response: The matching tasks, most recently journaled first.
+        """
+        query = request.query_params.get('q', '').strip()
+        match = request.query_params.get('match', 'prefix')
+        if match not in ('prefix', 'contains'):
+            raise ValidationError({'match': "Must be 'prefix' or 'contains'."})
+        limit = min(int_query_param(request, 'limit', 10), 50)
+        include_completed = bool_query_param(request, 'include_completed')
+
+        tasks = Task.objects.for_assignee(request.user)
+        if not include_completed:
+            tasks = tasks.filter(completed=False)
+        if query and match == 'prefix':
+            tasks = tasks.title_prefix(query)
+        elif query:
+            tasks = tasks.filter(title__icontains=query)
+
+        if sharding_enabled():
+            # The entries are in another database, no subquery
+            last_activity = dict(
+                user_journal_entries(request.user).filter(
+                    task__isnull=False).values('task').annotate(
+                        last=Max('created_at')).values_list('task', 'last'))
+            tasks = sorted(tasks.only('id', 'title'),
+                           key=lambda task:
+                           (last_activity.get(task.pk) is not None,
+                            last_activity.get(task.pk), task.pk),
+                           reverse=True)[:limit]
+        else:
+            last_activity = JournalEntry.objects.filter(
+                user=request.user, task=OuterRef('pk')).order_by(
+                    '-created_at').values('created_at')
+            tasks = tasks.annotate(
+                last_activity=Subquery(last_activity[:1])).only('id', 'title')
+            tasks = tasks.order_by(
+                F('last_activity').desc(nulls_last=True), '-id')[:limit]
+        serializer = TaskDropdownSerializer(tasks, many=True)
+        return Response(serializer.data)
+
     @action(detail=False, methods=['GET'], url_path='shareable-users')
     def shareable_users(self, request):
         """
             Retrieve all users that are in the same boards as the current user.
+
+            Query Parameters:
+                search (str): Optional. Case-insensitive username prefix.
+                limit (int): Optional. Maximum number of users to return.
             """
-        user_boards = Board.objects.filter(members=request.user)
-        shareable_users = CustomUser.objects.filter(
-            boards__in=user_boards).exclude(id=request.user.id).distinct()
-        serializer = UserSerializer(shareable_users, many=True)
-        return Response(serializer.data)
+        search = request.query_params.get('search', '')
+        limit = int_query_param(request, 'limit')
+        return Response(search_comembers(request.user.id, search, limit))
 
 
 class DashboardViewSet(viewsets.ViewSet):
@@ -419,20 +972,21 @@ class DashboardViewSet(viewsets.ViewSet):
     def dashboard(self, request):
         user = request.user
         now = timezone.now()
-        all_tasks = Task.objects.filter(assigned_to=user)
+        all_tasks = Task.objects.for_assignee(user)
 
         uncompleted_tasks = all_tasks.filter(
             completed=False).order_by('due_date')
         uncompleted_tasks_data = list(
             uncompleted_tasks.values('id', 'title', 'due_date', 'completed',
-                                     'priority', 'list__board__id'))
-
-        for task in uncompleted_tasks_data:
-            task['board_id'] = task.pop('list__board__id')
+                                     'priority', 'board_id'))
 
         data = {
             'total_tasks':
             all_tasks.count(),
+            'overdue_tasks':
+            all_tasks.overdue(now).count(),
+            'due_soon_tasks':
+            all_tasks.due_soon(now=now).count(),
             'completed_tasks':
             all_tasks.filter(completed=True).count(),
             'all_tasks':
@@ -443,3 +997,93 @@ class DashboardViewSet(viewsets.ViewSet):
                              timedelta(days=7)).count(),
         }
         return Response(data)
+
+
+class JobViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Status of the background jobs started by the current user.
+    """
+    serializer_class = JobSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['name', 'status']
+
+    def get_queryset(self):
+        return Job.objects.filter(user=self.request.user)
+
+
+class ProfileViewSet(viewsets.ViewSet):
+    """
+    Request profiles taken by api.middleware.ProfilingMiddleware, for
+    admins only.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    sort_keys = ('cumulative', 'tottime', 'ncalls')
+
+    def list(self, request):
+        return Response(list_profiles())
+
+    def retrieve(self, request, pk=None):
+        """
+        The request, its SQL queries and the top functions of a profile.
+
+        Query Parameters:
+            sort (str): Optional. 'cumulative' (default), 'tottime' or
+                'ncalls'.
+            limit (int): Optional. Number of functions (default 50).
+        """
+        sort = request.query_params.get('sort', 'cumulative')
+        if sort not in self.sort_keys:
+            raise ValidationError(
+                {'sort': f'Must be one of {", ".join(self.sort_keys)}.'})
+        info = load_profile(pk, sort, int_query_param(request, 'limit', 50))
+        if info is None:
+            raise Http404
+        return Response(info)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """The raw cProfile stats, for pstats or snakeviz."""
+        path = profile_path(pk, '.prof')
+        if path is None:
+            raise Http404
+        return FileResponse(path.open('rb'),
+                            as_attachment=True,
+                            filename=path.name)
+
+
+def token_user(raw_token):
+    """Return the user of a JWT access token, or None if it is invalid."""
+    authentication = JWTAuthentication()
+    try:
+        return authentication.get_user(
+            authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, InvalidToken):
+        return None
+
+
+async def board_events(request, pk):
+    """
+    Stream the changes to a board as Server-Sent Events.
+
+    Browsers' EventSource cannot send an Authorization header, so the
+    access token is passed as ``?token=``. The stream stays open, so this
+    view has to be served by an ASGI server (task_mood_tracker/asgi.py).
+
+    Events: task.created, task.updated, task.moved, task.deleted,
+    tasks.created, list.moved, member.added, and reset when the client
+    fell behind and should reload the board.
+    """
+    user = await sync_to_async(token_user)(request.GET.get('token', ''))
+    if user is None:
+        return JsonResponse({'detail': 'Invalid or missing token.'},
+                            status=status.HTTP_401_UNAUTHORIZED)
+    if not await Board.objects.filter(pk=pk, members=user).aexists():
+        return JsonResponse({'detail': 'Not found.'},
+                            status=status.HTTP_404_NOT_FOUND)
+
+    events = stream_events(pk, settings.EVENTS_HEARTBEAT_SECONDS)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
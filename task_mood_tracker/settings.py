@@ -35,11 +35,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ProfilingMiddleware',
+    'api.middleware.QueryContextMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -71,9 +74,52 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Job workers write concurrently with the web process
+            'timeout': 20,
+        },
     }
 }
 
+# Journal entries can be spread over several databases by user, see
+# api.sharding. JOURNAL_SHARDS=4 adds four SQLite files next to db.sqlite3;
+# migrate them with `manage.py migrate_shards`.
+JOURNAL_SHARDS = []
+for index in range(int(os.environ.get('JOURNAL_SHARDS', '0'))):
+    alias = f'journal_{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': BASE_DIR / f'journal_{index}.sqlite3',
+    }
+    JOURNAL_SHARDS.append(alias)
+
+DATABASE_ROUTERS = ['api.sharding.JournalShardRouter']
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Use a shared backend (e.g. Redis or Memcached) when running several worker
+# processes, otherwise cache invalidations only reach the local process.
+
+CACHES = {
+    'default': {
+        'BACKEND':
+        os.environ.get('DJANGO_CACHE_BACKEND',
+                       'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION':
+        os.environ.get('DJANGO_CACHE_LOCATION', ''),
+    }
+}
+
+# Seconds the co-member lists of api.comembers are cached. Membership
+# changes only invalidate them in the process that made the change, so a
+# per-process cache keeps them briefly to bound how stale other workers
+# can be.
+COMEMBERS_CACHE_TIMEOUT = int(
+    os.environ.get(
+        'COMEMBERS_CACHE_TIMEOUT',
+        60 if CACHES['default']['BACKEND'].endswith('.LocMemCache') else 60 *
+        60 * 24))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -136,8 +182,53 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_FILTER_BACKENDS':
     ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
+# Response compression (api.middleware.CompressionMiddleware)
+RESPONSE_COMPRESSION_MIN_SIZE = int(
+    os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', '1024'))
+RESPONSE_COMPRESSION_BROTLI_QUALITY = 4
+
+# Batch endpoint (api.batch)
+BATCH_MAX_REQUESTS = 20
+# Threads for batches of GET requests sent with "parallel": true
+BATCH_MAX_WORKERS = 4
+
+# Request profiles of staff users (api.middleware.ProfilingMiddleware)
+PROFILE_DIR = os.environ.get('PROFILE_DIR', BASE_DIR / 'profiles')
+PROFILE_MAX_COUNT = 200
+
+# Queries slower than this are logged to SLOW_QUERY_LOG as JSON lines
+# (api.slow_queries). Off unless set, e.g. to 100
+SLOW_QUERY_THRESHOLD_MS = os.environ.get('SLOW_QUERY_THRESHOLD_MS', '')
+SLOW_QUERY_THRESHOLD_MS = (float(SLOW_QUERY_THRESHOLD_MS)
+                           if SLOW_QUERY_THRESHOLD_MS else None)
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG',
+                                BASE_DIR / 'slow_queries.log')
+
+# Journal entries older than this many days are moved to the archive by
+# `manage.py archive_journal_entries` (api.archive)
+JOURNAL_ARCHIVE_AFTER_DAYS = int(
+    os.environ.get('JOURNAL_ARCHIVE_AFTER_DAYS', '180'))
+
+# Mood insights are recomputed from scratch when older than this, new
+# entries are added to them as they come (api.insights)
+MOOD_INSIGHTS_MAX_AGE_HOURS = 24
+
+# Live board events (api.events)
+EVENTS_HEARTBEAT_SECONDS = 15
+# Events buffered per stream before a slow client is told to reload
+EVENTS_QUEUE_SIZE = 100
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
@@ -154,3 +245,24 @@ SIMPLE_JWT = {
 }
 
 AUTH_USER_MODEL = 'api.CustomUser'
+
+# Background jobs (api.jobs)
+# On, jobs run inline when they are enqueued and failed ones aren't retried.
+# Off, they wait for `manage.py run_jobs` workers, which then have to run
+# next to the web processes: seeding new accounts, board purges and
+# database maintenance are all jobs. `manage.py check --deploy` warns about
+# this (api.W001), add it to SILENCED_SYSTEM_CHECKS once workers run.
+# On with DEBUG, off without, unless DJANGO_JOBS_EAGER says otherwise.
+JOBS_EAGER = os.environ.get('DJANGO_JOBS_EAGER',
+                            'True' if DEBUG else 'False') == 'True'
+# Base delay in seconds before a failed job is retried, doubled per attempt
+JOBS_RETRY_BACKOFF = 10
+# Running jobs that reported no progress for this many seconds are requeued
+JOBS_LOCK_TIMEOUT = 60 * 30
+
+# Identical concurrent analytics requests share one computation
+# (api.coalescing). Above 0, the result is also reused for this many
+# seconds. Journal entry writes only drop the results of their own process,
+# so with several processes users may see numbers from before their own
+# writes for that long.
+ANALYTICS_COALESCE_TTL = float(os.environ.get('ANALYTICS_COALESCE_TTL', '0'))